@@ -4,3 +4,22 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.core.signals import request_finished
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+        from . import checks  # Register system checks
+        from . import metrics
+
+        def on_connection_created(sender, connection, **kwargs):
+            # Với pool, signal chạy mỗi lần lấy kết nối từ pool: số kết nối thật lấy từ thống kê pool
+            if not connection.settings_dict.get('OPTIONS', {}).get('pool'):
+                metrics.DB_CONNECTIONS_CREATED.labels(connection.alias).inc()
+
+        # Đăng ký sau close_old_connections của Django nên thấy đúng các kết nối còn giữ lại
+        def on_request_finished(sender, **kwargs):
+            metrics.update_db_connections(connections)
+
+        connection_created.connect(on_connection_created, weak=False, dispatch_uid='api_metrics_connection_created')
+        request_finished.connect(on_request_finished, weak=False, dispatch_uid='api_metrics_request_finished')
@@ -0,0 +1,94 @@
+"""
+View async cho các endpoint chờ I/O lâu (gọi AI, tải transcript): khi chạy dưới ASGI
+request đang chờ AI không chiếm thread làm việc nào, một worker giữ được hàng nghìn
+request đồng thời. Truy vấn ORM trong các view này đi qua database_sync_to_async.
+
+DRF chưa hỗ trợ view async nên @async_api_view dựng một APIView như @api_view và dùng lại
+các bước của APIView.dispatch: initial() (xác thực, permission, throttle, content negotiation),
+handle_exception() (EXCEPTION_HANDLER) và finalize_response(); chỉ handler là coroutine.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.views import APIView
+
+
+def database_sync_to_async(func):
+    """
+    sync_to_async cho các bước ORM của view async. Chạy trên thread pool dùng chung của event
+    loop (thread_sensitive=False) thay vì thread riêng của request: một truy vấn chậm (ví dụ
+    thống kê) không chặn request khác, số kết nối DB giới hạn theo kích thước thread pool.
+    Như sau mỗi request, kết nối hỏng hoặc quá CONN_MAX_AGE của thread đó được đóng lại.
+    """
+    @wraps(func)
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)
+
+
+class AsyncAPIView(APIView):
+    """APIView của @async_api_view: phần đồng bộ của dispatch chạy qua database_sync_to_async"""
+    handler = None
+
+    def initial_sync(self, request, *args, **kwargs):
+        """Phần đầu của APIView.dispatch; trả về response nếu không cần gọi handler (OPTIONS)"""
+        self.initial(request, *args, **kwargs)
+        method = request.method.lower()
+        if method not in self.http_method_names:
+            raise exceptions.MethodNotAllowed(request.method)
+        if method == 'options':
+            return self.options(request, *args, **kwargs)
+        request.data  # đọc body ngay, handler async không được chạm vào stream đồng bộ
+        return None
+
+    async def adispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            response = await database_sync_to_async(self.initial_sync)(request, *args, **kwargs)
+            if response is None:
+                response = await self.handler(request, *args, **kwargs)
+        except Exception as exc:
+            # Lỗi không phải APIException được ném lại như APIView (500 của Django, có log)
+            response = await database_sync_to_async(self.handle_exception)(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+def async_api_view(methods, permission_classes=None):
+    """
+    Tương đương @api_view(methods) + @permission_classes(...) cho view `async def`.
+    View nhận rest_framework.request.Request (request.user, request.data đã sẵn sàng),
+    trả về Response của DRF; truy vấn DB trong view gọi qua database_sync_to_async.
+    """
+    def decorator(view):
+        attrs = {
+            'handler': staticmethod(view),
+            'http_method_names': [method.lower() for method in {*methods, 'OPTIONS'}],
+            '__doc__': view.__doc__,
+        }
+        if permission_classes is not None:
+            attrs['permission_classes'] = permission_classes
+        view_class = type(view.__name__, (AsyncAPIView,), attrs)
+
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            return await view_class().adispatch(request, *args, **kwargs)
+
+        wrapper.cls = view_class
+        return wrapper
+    return decorator
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Backend cache chỉ sống trong một process: mỗi worker gunicorn/uvicorn có bản riêng
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_local_cache(alias):
+    return settings.CACHES.get(alias, {}).get('BACKEND') in LOCAL_CACHE_BACKENDS
+
+
+@register(Tags.database, Tags.caches)
+def check_replica_sticky_cache(app_configs, **kwargs):
+    """
+    Read-your-writes của read replica ghim user vào primary bằng một key trong cache 'default'
+    (api.db_routers.pin_to_primary). Với cache riêng của từng process, request đọc tới worker
+    khác không thấy key và đọc replica chưa kịp đồng bộ. DATABASE_REPLICA_NAME (file SQLite
+    thứ hai, runserver một process khi chạy local) không bị kiểm tra.
+    """
+    if settings.DATABASE_REPLICA_HOSTS and is_local_cache('default'):
+        return [Error(
+            "Read replicas (DATABASE_REPLICA_HOSTS) require a cache shared by all workers.",
+            hint="Set CACHE_BACKEND to Redis, Memcached or DatabaseCache, or remove DATABASE_REPLICA_HOSTS.",
+            id='api.E001',
+        )]
+    return []
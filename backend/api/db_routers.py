@@ -0,0 +1,100 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+# Ưu tiên đọc của view (xem read_preference)
+REPLICA = 'replica'
+PRIMARY = 'primary'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def replica_reads():
+    """Trong khối này các truy vấn đọc được gửi tới read replica (nếu có cấu hình)"""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def set_replica_reads(enabled):
+    _replica_reads.set(enabled)
+
+
+def read_preference(preference):
+    """
+    Khai báo nơi đọc dữ liệu của view (class hoặc function, đặt ngoài cùng), ví dụ
+    `@read_preference(REPLICA)` cho các view chỉ đọc chấp nhận dữ liệu trễ vài giây.
+    View không khai báo luôn đọc từ primary.
+    """
+    def decorator(view):
+        view.read_preference = preference
+        return view
+    return decorator
+
+
+def get_read_preference(view_func):
+    preference = getattr(view_func, 'read_preference', None)
+    if preference is None:
+        # Class-based view: as_view() gắn class vào view_class
+        preference = getattr(getattr(view_func, 'view_class', None), 'read_preference', None)
+    return preference or PRIMARY
+
+
+def _sticky_key(user_id):
+    return f'replica_sticky:{user_id}'
+
+
+def pin_to_primary(user_id):
+    """Sau khi user ghi dữ liệu: các lần đọc của user đi primary DATABASE_REPLICA_STICKY_SECONDS giây"""
+    cache.set(_sticky_key(user_id), True, settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+
+def is_pinned_to_primary(user_id):
+    return cache.get(_sticky_key(user_id)) is not None
+
+
+def token_user_id(request):
+    """
+    User id trong access token của request (trước khi DRF xác thực). Chỉ dùng để chọn
+    DB: token sai/hết hạn coi như ẩn danh, việc xác thực vẫn do DRF đảm nhận.
+    """
+    parts = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(parts) != 2 or parts[0] not in api_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        return AccessToken(parts[1]).get(api_settings.USER_ID_CLAIM)
+    except TokenError:
+        return None
+
+
+class PrimaryReplicaRouter:
+    """
+    Ghi luôn vào primary (`default`). Đọc đi tới một replica ngẫu nhiên trong
+    settings.DATABASE_REPLICAS khi đang ở trong replica_reads() và không nằm trong
+    transaction của primary; còn lại đọc từ primary. Migrate chỉ chạy trên primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and _replica_reads.get() and not connections['default'].in_atomic_block:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replica là bản sao của primary: quan hệ giữa các alias luôn hợp lệ
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
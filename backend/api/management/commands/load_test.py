@@ -0,0 +1,160 @@
+import asyncio
+import os
+import re
+import ssl
+import time
+import urllib.request
+from itertools import cycle, islice
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from .query_report import percentile
+
+_SAMPLE_RE = re.compile(r'^(db_connections_created_total|db_pool_connections)\{([^}]*)\} ([0-9.eE+-]+)$')
+
+
+def connections_opened(metrics_text):
+    """Tổng số kết nối DB đã mở theo /metrics: ngoài pool (counter) + kết nối pool (state="opened")"""
+    total = 0.0
+    for line in metrics_text.splitlines():
+        match = _SAMPLE_RE.match(line)
+        if match and (match.group(1) == 'db_connections_created_total' or 'state="opened"' in match.group(2)):
+            total += float(match.group(3))
+    return total
+
+
+def thread_count(pid):
+    """Số thread của process và mọi process con (worker gunicorn/uvicorn), đọc từ /proc"""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            tasks = os.listdir(f'/proc/{current}/task')
+        except OSError:
+            continue
+        total += len(tasks)
+        for task in tasks:
+            try:
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    pending.extend(int(child) for child in f.read().split())
+            except OSError:
+                pass
+    return total
+
+
+class Command(BaseCommand):
+    help = (
+        "HTTP load test against a running server (gunicorn/uvicorn): throughput, latency percentiles, "
+        "DB connections opened during the run (read from /metrics) and, with --pid, peak server threads. "
+        "The client is asyncio based, so --concurrency can be in the thousands."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Server base URL')
+        parser.add_argument('--path', action='append', dest='paths', help='Path to request (repeatable, round robin)')
+        parser.add_argument('--method', default='GET', help='HTTP method')
+        parser.add_argument('--body', default='', help='JSON request body')
+        parser.add_argument('--requests', type=int, default=1000, help='Total number of requests')
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight at the same time')
+        parser.add_argument('--token', help='Bearer access token sent with every request')
+        parser.add_argument('--metrics-token', help='METRICS_TOKEN of the server, if set')
+        parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+        parser.add_argument('--pid', type=int, help='Server (master) pid: report the peak thread count during the run')
+
+    def handle(self, *args, **options):
+        base = options['url'].rstrip('/')
+        paths = options['paths'] or ['/api/courses/']
+
+        opened_before = self.connections_opened(base, options['metrics_token'])
+        started = time.perf_counter()
+        results, peak_threads = asyncio.run(self.run(base, paths, options))
+        elapsed = time.perf_counter() - started
+        opened = self.connections_opened(base, options['metrics_token']) - opened_before
+
+        latencies = [latency for _, latency in results]
+        errors = sum(1 for status, _ in results if status is None or status >= 400)
+        self.stdout.write(
+            f"requests={len(results)} errors={errors} concurrency={options['concurrency']} "
+            f"rps={len(results) / elapsed:.1f}"
+        )
+        self.stdout.write(
+            f"latency p50={percentile(latencies, 50):.1f}ms p95={percentile(latencies, 95):.1f}ms "
+            f"p99={percentile(latencies, 99):.1f}ms max={max(latencies):.1f}ms"
+        )
+        if peak_threads is not None:
+            self.stdout.write(f"peak server threads={peak_threads}")
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ DB connections opened: {opened:.0f} ({opened * 1000 / len(results):.1f} per 1000 requests)"
+        ))
+
+    async def run(self, base, paths, options):
+        url = urlsplit(base)
+        body = options['body'].encode()
+        head = [
+            f"Host: {url.netloc}",
+            "Connection: close",
+            f"Content-Length: {len(body)}",
+        ]
+        if body:
+            head.append("Content-Type: application/json")
+        if options['token']:
+            head.append(f"Authorization: Bearer {options['token']}")
+        context = ssl.create_default_context() if url.scheme == 'https' else None
+        port = url.port or (443 if context else 80)
+
+        async def exchange(request):
+            reader, writer = await asyncio.open_connection(url.hostname, port, ssl=context)
+            try:
+                writer.write(request + body)
+                await writer.drain()
+                status = int((await reader.readline()).split()[1])
+                await reader.read()  # Connection: close - đọc tới khi server đóng kết nối
+                return status
+            finally:
+                writer.close()
+
+        async def fetch(path):
+            request = f"{options['method']} {url.path}{path} HTTP/1.1\r\n" + '\r\n'.join(head) + '\r\n\r\n'
+            started = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(exchange(request.encode()), options['timeout'])
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                status = None
+            return status, (time.perf_counter() - started) * 1000
+
+        queue = iter(islice(cycle(paths), options['requests']))
+        results = []
+
+        async def worker():
+            for path in queue:
+                results.append(await fetch(path))
+
+        peak = None
+        sampler = None
+        if options['pid']:
+            peak = thread_count(options['pid'])
+
+            async def sample():
+                nonlocal peak
+                while True:
+                    await asyncio.sleep(0.1)
+                    peak = max(peak, thread_count(options['pid']))
+
+            sampler = asyncio.create_task(sample())
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(options['concurrency'], options['requests']))))
+        finally:
+            if sampler:
+                sampler.cancel()
+        return results, peak
+
+    def connections_opened(self, base, token):
+        request = urllib.request.Request(
+            f'{base}/metrics', headers={'Authorization': f'Bearer {token}'} if token else {})
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return connections_opened(response.read().decode())
+        except OSError as e:
+            raise CommandError(f"Cannot read {base}/metrics: {e}")
@@ -0,0 +1,93 @@
+import json
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+LOG_MARKER = 'query_stats '
+
+
+def read_query_stats(lines):
+    """Các bản ghi JSON do QueryInstrumentationMiddleware log (bỏ qua dòng khác và dòng hỏng)"""
+    for line in lines:
+        index = line.find(LOG_MARKER)
+        if index < 0:
+            continue
+        try:
+            yield json.loads(line[index + len(LOG_MARKER):])
+        except ValueError:
+            continue
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))]
+
+
+def rank_endpoints(records):
+    """Gộp theo (method, view); xếp hạng theo số truy vấn lặp trung bình (mức độ N+1) rồi số truy vấn"""
+    groups = defaultdict(list)
+    for record in records:
+        groups[(record.get('method'), record.get('view') or record.get('path'))].append(record)
+
+    rows = []
+    for (method, view), items in groups.items():
+        queries = [item['queries'] for item in items]
+        worst = max(
+            (duplicate for item in items for duplicate in item.get('duplicates', ())),
+            key=lambda duplicate: duplicate['count'], default=None,
+        )
+        rows.append({
+            'method': method,
+            'view': view,
+            'requests': len(items),
+            'avg_queries': round(sum(queries) / len(items), 1),
+            'p95_queries': percentile(queries, 95),
+            'avg_sql_ms': round(sum(item['sql_ms'] for item in items) / len(items), 2),
+            'avg_duplicate_queries': round(sum(item.get('duplicate_queries', 0) for item in items) / len(items), 1),
+            'worst_duplicate': worst,
+        })
+    rows.sort(key=lambda row: (row['avg_duplicate_queries'], row['avg_queries']), reverse=True)
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Rank endpoints by N+1 severity from query_stats log lines (QUERY_LOG_FILE by default, '-' = stdin)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help='Log files to read (default: settings.QUERY_LOG_FILE)')
+        parser.add_argument('--top', type=int, default=20, help='Number of endpoints to show')
+        parser.add_argument('--json', action='store_true', help='Print the ranking as JSON')
+
+    def handle(self, *args, **options):
+        files = options['files'] or ([settings.QUERY_LOG_FILE] if settings.QUERY_LOG_FILE else [])
+        if not files:
+            raise CommandError("No log file given and QUERY_LOG_FILE is not set")
+
+        records = []
+        for path in files:
+            if path == '-':
+                records.extend(read_query_stats(sys.stdin))
+                continue
+            try:
+                with open(path, encoding='utf-8') as f:
+                    records.extend(read_query_stats(f))
+            except OSError as e:
+                raise CommandError(f"Cannot read {path}: {e}")
+
+        rows = rank_endpoints(records)[:options['top']]
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2, ensure_ascii=False))
+            return
+
+        self.stdout.write(f"{'endpoint':<52} {'reqs':>5} {'avg q':>6} {'p95 q':>6} {'sql ms':>8} {'dup q':>6}")
+        for row in rows:
+            endpoint = f"{row['method']} {row['view']}"
+            self.stdout.write(
+                f"{endpoint[:52]:<52} {row['requests']:>5} {row['avg_queries']:>6} {row['p95_queries']:>6} "
+                f"{row['avg_sql_ms']:>8} {row['avg_duplicate_queries']:>6}"
+            )
+            if row['worst_duplicate']:
+                self.stdout.write(f"    x{row['worst_duplicate']['count']}: {row['worst_duplicate']['sql'][:120]}")
+        self.stdout.write(self.style.SUCCESS(f"✅ {len(records)} sampled requests"))
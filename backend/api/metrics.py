@@ -0,0 +1,102 @@
+"""
+Metrics dạng Prometheus cho API: latency theo route, latency/lỗi của các lần gọi AI,
+thời gian lấy transcript YouTube, tỉ lệ hit cache và số kết nối DB đang mở.
+
+Khi chạy nhiều worker (gunicorn) đặt biến môi trường PROMETHEUS_MULTIPROC_DIR trỏ tới
+một thư mục rỗng trước khi khởi động: mỗi worker ghi giá trị ra file trong thư mục đó
+và /metrics gộp lại bằng MultiProcessCollector (xem gunicorn.conf.py).
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+
+from .profiling import record_timing
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Thời gian xử lý request theo route',
+    ['route', 'method', 'status'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+AI_LATENCY = Histogram(
+    'ai_request_duration_seconds',
+    'Thời gian gọi Gemini theo helper trong course/utils.py',
+    ['helper'],
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120),
+)
+AI_ERRORS = Counter(
+    'ai_request_errors',
+    'Số lần gọi Gemini lỗi theo helper',
+    ['helper'],
+)
+TRANSCRIPT_LATENCY = Histogram(
+    'transcript_fetch_duration_seconds',
+    'Thời gian lấy transcript YouTube theo kết quả (found/not_found/error)',
+    ['outcome'],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests',
+    'Số lần đọc cache theo loại key và kết quả (hit/miss)',
+    ['cache', 'result'],
+)
+DB_CONNECTIONS_OPEN = Gauge(
+    'db_connections_open',
+    'Số kết nối DB còn mở sau request (giữ lại theo CONN_MAX_AGE), cộng qua mọi worker',
+    ['alias'],
+    multiprocess_mode='livesum',
+)
+DB_POOL_CONNECTIONS = Gauge(
+    'db_pool_connections',
+    'Connection pool psycopg: số kết nối trong pool (size), đang rảnh (available), request đang chờ '
+    '(waiting), tổng số kết nối pool đã mở (opened)',
+    ['alias', 'state'],
+    multiprocess_mode='livesum',
+)
+DB_CONNECTIONS_CREATED = Counter(
+    'db_connections_created',
+    'Số kết nối DB mới được mở ngoài pool (tăng nhanh = kết nối không được tái sử dụng)',
+    ['alias'],
+)
+
+
+@contextmanager
+def track_ai_call(helper):
+    """Đo thời gian một lần gọi AI; exception thoát ra được đếm là lỗi rồi ném tiếp"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        AI_ERRORS.labels(helper).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        AI_LATENCY.labels(helper).observe(elapsed)
+        record_timing('ai', elapsed)
+
+
+def record_cache_lookup(key, hit):
+    """Đếm hit/miss; nhãn cache là prefix của key (`quiz_blob:12` -> `quiz_blob`)"""
+    CACHE_REQUESTS.labels(key.split(':', 1)[0], 'hit' if hit else 'miss').inc()
+
+
+def update_db_connections(connections):
+    for connection in connections.all(initialized_only=True):
+        DB_CONNECTIONS_OPEN.labels(connection.alias).set(1 if connection.connection is not None else 0)
+        if connection.settings_dict.get('OPTIONS', {}).get('pool'):
+            stats = connection.pool.get_stats()
+            DB_POOL_CONNECTIONS.labels(connection.alias, 'size').set(stats.get('pool_size', 0))
+            DB_POOL_CONNECTIONS.labels(connection.alias, 'available').set(stats.get('pool_available', 0))
+            DB_POOL_CONNECTIONS.labels(connection.alias, 'waiting').set(stats.get('requests_waiting', 0))
+            DB_POOL_CONNECTIONS.labels(connection.alias, 'opened').set(stats.get('connections_num', 0))
+
+
+def render_metrics():
+    """Nội dung text exposition format; gộp mọi worker nếu chạy ở chế độ multiprocess"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
@@ -0,0 +1,421 @@
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from datetime import timedelta
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+from . import metrics, profiling
+from . import db_routers
+from .async_views import database_sync_to_async
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+query_logger = logging.getLogger('api.queries')
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+
+
+class AsyncCapableMiddleware:
+    """
+    Middleware dùng được cả dưới WSGI lẫn ASGI (như MiddlewareMixin của Django): khi handler
+    phía sau là coroutine thì lớp con xử lý ở __acall__, request đang chờ view async không
+    giữ thread nào. Middleware chỉ đồng bộ làm Django bọc cả chuỗi phía sau vào một thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+
+def is_async_view(request):
+    """View của request là coroutine (xem api.async_views); dùng trước khi Django resolve URL"""
+    try:
+        return iscoroutinefunction(resolve(request.path_info).func)
+    except Resolver404:
+        return False
+
+
+def wrap_connections(wrapper):
+    """ExitStack gắn execute_wrapper vào mọi kết nối DB của thread hiện tại"""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(wrapper))
+    return stack
+
+
+class IdempotencyMiddleware(AsyncCapableMiddleware):
+    """
+    Hỗ trợ header `Idempotency-Key` cho các endpoint POST trong settings.IDEMPOTENT_URL_NAMES.
+    Lần đầu: chạy view và lưu response (status < 500). Các lần gửi lại cùng key trong thời gian
+    IDEMPOTENCY_KEY_TTL: trả lại response đã lưu, không chạy view (không tạo bản ghi trùng,
+    không gọi lại AI). Request trùng key đang xử lý trả 409, cùng key nhưng body khác trả 422.
+    Key gắn với user id (không phải token) nên vẫn dùng được sau khi làm mới access token.
+    """
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        record = getattr(request, '_idempotency_record', None)
+        if record is not None:
+            self._store_response(record, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        record = getattr(request, '_idempotency_record', None)
+        if record is not None:
+            await database_sync_to_async(self._store_response)(record, response)
+        return response
+
+    @staticmethod
+    def _store_response(record, response):
+        if response.status_code >= 500 or getattr(response, 'streaming', False):
+            # Không lưu lỗi server, để client có thể thử lại
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+            return
+
+        IdempotencyKey.objects.filter(pk=record.pk).update(
+            status_code=response.status_code,
+            content=response.content,
+            content_type=response.get('Content-Type', ''),
+        )
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        idempotency_key = request.META.get(IDEMPOTENCY_HEADER)
+        if not idempotency_key or request.method != 'POST':
+            return None
+        if request.resolver_match.url_name not in settings.IDEMPOTENT_URL_NAMES:
+            return None
+        if len(idempotency_key) > 255:
+            return JsonResponse({"detail": "Idempotency-Key quá dài (tối đa 255 ký tự)"}, status=400, json_dumps_params={"ensure_ascii": False})
+
+        user_id = self._user_id(request)
+        if user_id is None:
+            return None  # chưa xác thực: view trả 401/403, không có gì để lưu
+        key = self._fingerprint(str(user_id), request.method, request.path, idempotency_key)
+        request_hash = hashlib.sha256(request.body).hexdigest()
+        now = timezone.now()
+        stale_before = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+
+        in_progress = JsonResponse(
+            {"detail": "Request với Idempotency-Key này đang được xử lý"}, status=409, json_dumps_params={"ensure_ascii": False})
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(
+                        key=key,
+                        request_hash=request_hash,
+                        expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                    )
+                break
+            except IntegrityError:
+                record = IdempotencyKey.objects.filter(key=key).first()
+                if record is None or record.expires_at <= now or (
+                    record.status_code is None and record.created_at <= stale_before
+                ):
+                    if attempt:
+                        # Lần thử lại vẫn trùng: request khác cùng key đang nhận lại bản ghi cũ
+                        return in_progress
+                    # Key đã hết hạn, vừa bị xóa, hoặc request trước bị bỏ dở: xóa và thử tạo lại một lần
+                    IdempotencyKey.objects.filter(key=key).filter(
+                        Q(expires_at__lte=now) | Q(status_code__isnull=True, created_at__lte=stale_before)
+                    ).delete()
+                    continue
+                if record.request_hash != request_hash:
+                    return JsonResponse(
+                        {"detail": "Idempotency-Key đã được dùng cho một request khác"}, status=422, json_dumps_params={"ensure_ascii": False})
+                if record.status_code is None:
+                    return in_progress
+                response = HttpResponse(
+                    bytes(record.content), status=record.status_code, content_type=record.content_type)
+                response['Idempotent-Replayed'] = 'true'
+                return response
+
+        request._idempotency_record = record
+        return None
+
+    @staticmethod
+    def _user_id(request):
+        # Access token (chưa được DRF xác thực, chỉ giải mã) hoặc user của session
+        user_id = db_routers.token_user_id(request)
+        if user_id is None:
+            user = getattr(request, 'user', None)
+            user_id = user.pk if user is not None and user.is_authenticated else None
+        return user_id
+
+    @staticmethod
+    def _fingerprint(*parts):
+        return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+
+_IN_LIST_RE = re.compile(r'\bIN \((?:%s|\?)(?:, (?:%s|\?))*\)')
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_SPACE_RE = re.compile(r'\s+')
+
+
+def sql_fingerprint(sql):
+    """
+    Dạng chuẩn hóa của câu SQL: bỏ literal và gộp danh sách IN (...). Cùng fingerprint
+    lặp lại nhiều lần trong một request thường là dấu hiệu N+1.
+    """
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    sql = _LITERAL_RE.sub('?', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """execute_wrapper ghi lại fingerprint và thời gian của từng truy vấn"""
+
+    def __init__(self):
+        self.count = 0
+        self.sql_time = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[sql_fingerprint(sql)] += 1
+
+    def duplicates(self, limit=5):
+        """Các fingerprint chạy nhiều hơn một lần, nhiều nhất trước"""
+        return [
+            {'count': count, 'sql': fingerprint[:300]}
+            for fingerprint, count in self.fingerprints.most_common(limit) if count > 1
+        ]
+
+
+class QueryInstrumentationMiddleware(AsyncCapableMiddleware):
+    """
+    Đo số truy vấn, tổng thời gian SQL và các truy vấn lặp (N+1) của một phần request
+    theo tỉ lệ QUERY_INSTRUMENTATION_SAMPLE_RATE. Kết quả trả về qua header
+    `Server-Timing` và một dòng log JSON (logger `api.queries`, prefix `query_stats`);
+    request có truy vấn lặp từ QUERY_DUPLICATE_WARN_THRESHOLD lần được log ở mức WARNING.
+
+    Dưới ASGI chỉ đo request tới view đồng bộ: view async truy vấn trên thread pool dùng chung
+    (api.async_views.database_sync_to_async), không tách được truy vấn theo request.
+    """
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with wrap_connections(recorder):
+            response = self.get_response(request)
+        return self._report(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        if not self._sampled() or is_async_view(request):
+            return await self.get_response(request)
+
+        # View đồng bộ, middleware đồng bộ và process_view chạy trên thread riêng của request
+        # (ThreadSensitiveContext của ASGIHandler): gắn execute_wrapper vào kết nối của thread đó
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        stack = await sync_to_async(wrap_connections)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self._report(request, response, recorder, started)
+
+    @staticmethod
+    def _sampled():
+        rate = settings.QUERY_INSTRUMENTATION_SAMPLE_RATE
+        return rate > 0 and (rate >= 1 or random.random() < rate)
+
+    @staticmethod
+    def _report(request, response, recorder, started):
+        total_ms = (time.perf_counter() - started) * 1000
+        sql_ms = recorder.sql_time * 1000
+
+        timing = f'db;dur={sql_ms:.1f};desc="{recorder.count} queries", app;dur={total_ms:.1f}'
+        if response.has_header('Server-Timing'):
+            timing = f"{response['Server-Timing']}, {timing}"
+        response['Server-Timing'] = timing
+
+        duplicates = recorder.duplicates()
+        match = request.resolver_match
+        stats = {
+            'view': match.view_name if match else None,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'sql_ms': round(sql_ms, 2),
+            'duration_ms': round(total_ms, 2),
+            'duplicate_queries': sum(count - 1 for count in recorder.fingerprints.values() if count > 1),
+            'duplicates': duplicates,
+        }
+        worst = duplicates[0]['count'] if duplicates else 0
+        level = logging.WARNING if worst >= settings.QUERY_DUPLICATE_WARN_THRESHOLD else logging.INFO
+        query_logger.log(level, 'query_stats %s', json.dumps(stats, ensure_ascii=False))
+        return response
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """
+    Ghi thời gian xử lý mọi request vào histogram http_request_duration_seconds theo tên
+    route (view_name của URL pattern, không dùng path để số nhãn không tăng theo id).
+    """
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self._observe(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, response, started)
+        return response
+
+    @staticmethod
+    def _observe(request, response, started):
+        match = request.resolver_match
+        metrics.REQUEST_LATENCY.labels(
+            match.view_name if match else 'unmatched',
+            request.method,
+            f'{response.status_code // 100}xx',
+        ).observe(time.perf_counter() - started)
+
+
+class ProfilingMiddleware(AsyncCapableMiddleware):
+    """
+    Profiling theo yêu cầu (xem api.profiling): request vượt PROFILING_SLOW_REQUEST_MS
+    hoặc mang header X-Profile-Request hợp lệ được lưu kèm log SQL và thời gian theo nhóm;
+    response có header `X-Profile-Id` để tra cứu qua API admin.
+
+    Profiler lấy mẫu/cProfile theo dõi thread xử lý request: dưới ASGI chỉ profile request tới
+    view đồng bộ (chạy trên thread riêng của request), không profile view async.
+    """
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        debug = self._debug(request)
+        if not debug and settings.PROFILING_SLOW_REQUEST_MS <= 0:
+            return self.get_response(request)
+
+        profile, stack = self._start(debug)
+        with stack:
+            response = self.get_response(request)
+        return self._save(request, response, profile, debug)
+
+    async def __acall__(self, request):
+        debug = self._debug(request)
+        if (not debug and settings.PROFILING_SLOW_REQUEST_MS <= 0) or is_async_view(request):
+            return await self.get_response(request)
+
+        # Bật profiler trên thread riêng của request, nơi view đồng bộ sẽ chạy
+        profile, stack = await sync_to_async(self._start)(debug)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return await sync_to_async(self._save)(request, response, profile, debug)
+
+    @staticmethod
+    def _debug(request):
+        token = request.META.get(profiling.PROFILE_META_KEY)
+        return bool(token) and profiling.is_profile_token_valid(token)
+
+    @staticmethod
+    def _start(debug):
+        profile = profiling.RequestProfile(
+            list(profiling.PROFILERS) if debug else settings.PROFILING_PROFILERS)
+        stack = wrap_connections(profile.sql)
+        stack.enter_context(profile)
+        return profile, stack
+
+    @staticmethod
+    def _save(request, response, profile, debug):
+        if not debug and profile.duration * 1000 < settings.PROFILING_SLOW_REQUEST_MS:
+            return response
+        try:
+            profile_id = profiling.save_profile(
+                profile.build_record(request, response, 'header' if debug else 'slow'), profile.files())
+        except OSError as e:
+            logger.error(f"Cannot save request profile: {e}")
+            return response
+        response['X-Profile-Id'] = profile_id
+        return response
+
+
+class ReadReplicaMiddleware(AsyncCapableMiddleware):
+    """
+    Request đọc (GET/HEAD/OPTIONS) tới view khai báo @read_preference(REPLICA) đọc từ read replica
+    (xem api.db_routers). Sau một request ghi thành công, user bị ghim vào primary
+    DATABASE_REPLICA_STICKY_SECONDS giây để đọc lại ngay dữ liệu vừa ghi (read-your-writes),
+    ví dụ danh sách khóa học của tôi ngay sau khi đăng ký.
+    """
+
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        if self.async_mode:
+            return self.__acall__(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            db_routers.set_replica_reads(False)
+        if request.method not in self.SAFE_METHODS and response.status_code < 400:
+            self._pin_writer(request)
+        return response
+
+    async def __acall__(self, request):
+        try:
+            response = await self.get_response(request)
+        finally:
+            db_routers.set_replica_reads(False)
+        if request.method not in self.SAFE_METHODS and response.status_code < 400:
+            # request.user có thể là lazy object của AuthenticationMiddleware (đọc session từ DB)
+            await database_sync_to_async(self._pin_writer)(request)
+        return response
+
+    @staticmethod
+    def _pin_writer(request):
+        # DRF gắn user đã xác thực lên request gốc
+        user = getattr(request, 'user', None)
+        user_id = user.pk if user is not None and user.is_authenticated else db_routers.token_user_id(request)
+        if user_id is not None:
+            db_routers.pin_to_primary(user_id)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method in self.SAFE_METHODS
+            and db_routers.get_read_preference(view_func) == db_routers.REPLICA
+        ):
+            user_id = db_routers.token_user_id(request)
+            db_routers.set_replica_reads(user_id is None or not db_routers.is_pinned_to_primary(user_id))
+        return None
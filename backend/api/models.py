@@ -6,3 +6,17 @@ class TestModel(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class IdempotencyKey(models.Model):
+    """Response đã lưu cho một Idempotency-Key, dùng để trả lại khi client gửi lại request"""
+    key = models.CharField(max_length=64, unique=True)  # sha256(user + method + path + Idempotency-Key)
+    request_hash = models.CharField(max_length=64)  # sha256 của body, phát hiện dùng lại key với nội dung khác
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)  # null: request đang xử lý
+    content = models.BinaryField(default=b'')
+    content_type = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.status_code})"
@@ -0,0 +1,293 @@
+"""
+Profiling request theo yêu cầu (opt-in), chạy bởi api.middleware.ProfilingMiddleware:
+
+- Request chậm: khi PROFILING_SLOW_REQUEST_MS > 0 mọi request chạy dưới các profiler
+  trong PROFILING_PROFILERS (mặc định sampling, chi phí thấp); chỉ request vượt ngưỡng
+  mới được lưu.
+- Request gửi header X-Profile-Request mang token đã ký (cấp qua API admin): chạy dưới
+  mọi profiler (cProfile + sampling) và luôn được lưu.
+
+Mỗi profile gồm thời gian theo nhóm (DB, AI, transcript đo trực tiếp; serialization,
+grading ước lượng từ mẫu stack), log SQL và kết quả profiler, lưu vào thư mục
+PROFILING_DIR dạng ring buffer giữ PROFILING_MAX_ENTRIES profile mới nhất.
+"""
+import cProfile
+import glob
+import io
+import json
+import marshal
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import signing
+
+PROFILE_HEADER = 'X-Profile-Request'
+PROFILE_META_KEY = 'HTTP_X_PROFILE_REQUEST'
+TOKEN_SALT = 'api.profiling'
+TOKEN_VALUE = 'profile'
+
+# Nhóm thời gian ước lượng từ mẫu stack: một mẫu thuộc nhóm nếu có frame khớp
+GRADING_FUNCTIONS = {'grade_quiz_answers', 'finalize_quiz_attempts', 'find_invalid_answers', 'get_attempt_result'}
+SAMPLED_CATEGORIES = {
+    'serialization': lambda filename, name: filename.endswith('serializers.py'),
+    'grading': lambda filename, name: name in GRADING_FUNCTIONS and filename.endswith(os.path.join('course', 'utils.py')),
+}
+
+_PROFILE_ID_RE = re.compile(r'^\d+-[0-9a-f]{8}$')
+_timings = ContextVar('profiling_timings', default=None)
+
+
+def record_timing(kind, seconds):
+    """Cộng thời gian của một nhóm (ai, transcript...) vào request đang được profile"""
+    timings = _timings.get()
+    if timings is not None:
+        timings[kind] = timings.get(kind, 0.0) + seconds
+
+
+def make_profile_token():
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(TOKEN_VALUE)
+
+
+def is_profile_token_valid(value):
+    try:
+        return signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            value, max_age=settings.PROFILING_TOKEN_MAX_AGE) == TOKEN_VALUE
+    except signing.BadSignature:
+        return False
+
+
+def _frame_label(filename, name):
+    """Đường dẫn ngắn của frame: bỏ phần trước site-packages hoặc thư mục dự án"""
+    for marker in ('site-packages' + os.sep, str(settings.BASE_DIR) + os.sep):
+        index = filename.find(marker)
+        if index >= 0:
+            filename = filename[index + len(marker):]
+            break
+    return f'{filename}:{name}'
+
+
+class SamplingProfiler:
+    """Lấy mẫu stack của thread xử lý request mỗi PROFILING_SAMPLE_INTERVAL_MS từ một thread phụ"""
+    name = 'sampling'
+
+    def __init__(self):
+        self.interval = settings.PROFILING_SAMPLE_INTERVAL_MS / 1000
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiling-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append((frame.f_code.co_filename, frame.f_code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def summary(self, duration):
+        samples = sum(self.stacks.values())
+        categories = {}
+        for category, matches in SAMPLED_CATEGORIES.items():
+            hits = sum(count for stack, count in self.stacks.items() if any(matches(*frame) for frame in stack))
+            categories[category] = round(duration * 1000 * hits / samples, 2) if samples else 0.0
+        return {'samples': samples, 'interval_ms': self.interval * 1000, 'categories_ms': categories}
+
+    def files(self):
+        """Stack dạng folded (mỗi dòng `frame;frame;... số mẫu`), mở được bằng flamegraph/speedscope"""
+        lines = [
+            ';'.join(_frame_label(*frame) for frame in stack) + f' {count}'
+            for stack, count in self.stacks.most_common()
+        ]
+        return {'folded': '\n'.join(lines).encode()}
+
+
+class CProfileProfiler:
+    """cProfile đầy đủ (chi phí cao): chỉ nên dùng cho request debug"""
+    name = 'cprofile'
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.profile.create_stats()
+
+    def summary(self, duration):
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats('cumulative').print_stats(30)
+        return {'top_cumulative': out.getvalue()}
+
+    def files(self):
+        # Cùng định dạng với Profile.dump_stats: mở bằng pstats/snakeviz
+        return {'prof': marshal.dumps(self.profile.stats)}
+
+
+PROFILERS = {profiler.name: profiler for profiler in (SamplingProfiler, CProfileProfiler)}
+
+
+class SqlLog:
+    """execute_wrapper ghi lại các truy vấn của request (tối đa PROFILING_MAX_SQL câu)"""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.entries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.time += elapsed
+            if len(self.entries) < settings.PROFILING_MAX_SQL:
+                self.entries.append({'sql': sql[:1000], 'ms': round(elapsed * 1000, 3)})
+
+
+class RequestProfile:
+    """Các profiler, log SQL và thời gian theo nhóm của một request"""
+
+    def __init__(self, profiler_names):
+        self.profilers = [PROFILERS[name]() for name in profiler_names]
+        self.sql = SqlLog()
+        self.timings = {}
+
+    def __enter__(self):
+        self._token = _timings.set(self.timings)
+        self.started = time.perf_counter()
+        for profiler in self.profilers:
+            profiler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        for profiler in reversed(self.profilers):
+            profiler.stop()
+        self.duration = time.perf_counter() - self.started
+        try:
+            _timings.reset(self._token)
+        except ValueError:
+            # Dưới ASGI __enter__ và __exit__ chạy trong hai lần sync_to_async (context khác nhau)
+            _timings.set(None)
+        return False
+
+    def build_record(self, request, response, trigger):
+        total_ms = self.duration * 1000
+        measured = {kind: round(seconds * 1000, 2) for kind, seconds in self.timings.items()}
+        measured['db'] = round(self.sql.time * 1000, 2)
+        match = request.resolver_match
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'trigger': trigger,
+            'created_at': time.time(),
+            'duration_ms': round(total_ms, 2),
+            'timings_ms': {
+                **measured,
+                'other': round(max(0.0, total_ms - sum(measured.values())), 2),
+            },
+            'queries': self.sql.count,
+            'sql': self.sql.entries,
+            'profilers': {profiler.name: profiler.summary(self.duration) for profiler in self.profilers},
+        }
+        sampled = record['profilers'].get('sampling')
+        if sampled:
+            # Ước lượng từ mẫu stack, có thể chồng lên db (truy vấn lazy khi serialize)
+            record['sampled_ms'] = sampled['categories_ms']
+        return record
+
+    def files(self):
+        files = {}
+        for profiler in self.profilers:
+            files.update(profiler.files())
+        return files
+
+
+def save_profile(record, files):
+    """Ghi profile vào ring buffer; xóa profile cũ nhất khi vượt PROFILING_MAX_ENTRIES"""
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    profile_id = f'{time.time_ns()}-{uuid.uuid4().hex[:8]}'
+    record = {'id': profile_id, 'files': sorted(files), **record}
+    for ext, content in files.items():
+        with open(os.path.join(directory, f'{profile_id}.{ext}'), 'wb') as f:
+            f.write(content)
+    # Ghi JSON sau cùng (qua file tạm + rename) để danh sách không thấy profile ghi dở
+    path = os.path.join(directory, f'{profile_id}.json')
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False)
+    os.replace(f'{path}.tmp', path)
+    _prune(directory, settings.PROFILING_MAX_ENTRIES)
+    return profile_id
+
+
+def _profile_ids(directory):
+    return sorted(
+        os.path.basename(path)[:-len('.json')] for path in glob.glob(os.path.join(directory, '*.json'))
+    )
+
+
+def _prune(directory, keep):
+    ids = _profile_ids(directory)
+    for profile_id in ids[:max(0, len(ids) - keep)]:
+        for path in glob.glob(os.path.join(directory, f'{profile_id}.*')):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # worker khác vừa xóa
+
+
+def load_profile(profile_id):
+    if not _PROFILE_ID_RE.match(profile_id):
+        return None
+    try:
+        with open(os.path.join(settings.PROFILING_DIR, f'{profile_id}.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def list_profiles():
+    """Tóm tắt các profile đang lưu, mới nhất trước (không kèm log SQL và kết quả profiler)"""
+    summaries = []
+    for profile_id in reversed(_profile_ids(settings.PROFILING_DIR)):
+        record = load_profile(profile_id)
+        if record is not None:
+            summaries.append({
+                key: record.get(key) for key in (
+                    'id', 'method', 'path', 'view', 'status', 'trigger', 'created_at',
+                    'duration_ms', 'timings_ms', 'sampled_ms', 'queries', 'files',
+                )
+            })
+    return summaries
+
+
+def profile_file_path(profile_id, ext):
+    """Đường dẫn file kết quả profiler (prof/folded) của profile, None nếu không có"""
+    if not _PROFILE_ID_RE.match(profile_id) or ext not in ('prof', 'folded'):
+        return None
+    path = os.path.join(settings.PROFILING_DIR, f'{profile_id}.{ext}')
+    return path if os.path.exists(path) else None
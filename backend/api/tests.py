@@ -1,3 +1,296 @@
-from django.test import TestCase
+import hashlib
+import json
+import threading
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import ThreadSensitiveContext, async_to_sync, sync_to_async
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connections
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .async_views import database_sync_to_async
+from .checks import check_replica_sticky_cache
+from .middleware import IdempotencyMiddleware, sql_fingerprint
+from .models import IdempotencyKey
+from .profiling import load_profile
+
+
+class QueryInstrumentationTests(TestCase):
+    """Header Server-Timing và dòng log query_stats của request được đo"""
+
+    @override_settings(QUERY_INSTRUMENTATION_SAMPLE_RATE=1.0)
+    def test_sampled_request_reports_queries(self):
+        with self.assertLogs('api.queries', 'INFO') as logs:
+            response = self.client.get('/api/courses/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        stats = json.loads(logs.output[0].split('query_stats ', 1)[1])
+        self.assertEqual((stats['view'], stats['status']), ('course-list', 200))
+        self.assertGreater(stats['queries'], 0)
+
+    @override_settings(QUERY_INSTRUMENTATION_SAMPLE_RATE=1.0)
+    async def test_sync_view_is_instrumented_under_asgi(self):
+        with self.assertLogs('api.queries', 'INFO') as logs:
+            response = await self.async_client.get('/api/courses/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        stats = json.loads(logs.output[0].split('query_stats ', 1)[1])
+        self.assertGreater(stats['queries'], 0)
+
+    @override_settings(QUERY_INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_unsampled_request_is_not_instrumented(self):
+        self.assertFalse(self.client.get('/api/courses/').has_header('Server-Timing'))
+
+    def test_fingerprint_ignores_literals_and_in_list_length(self):
+        self.assertEqual(
+            sql_fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s) AND x = 5'),
+            sql_fingerprint('SELECT *  FROM t WHERE id IN (%s) AND x = 7'),
+        )
+
+
+class MetricsTests(TestCase):
+    """Endpoint /metrics và các metric được ghi khi xử lý request"""
+
+    def test_metrics_exposes_route_latency(self):
+        self.client.get('/api/courses/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="course-list",status="2xx"}',
+                      response.content.decode())
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token_required_when_configured(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_ai_call_errors_are_counted_per_helper(self):
+        from prometheus_client import REGISTRY
+        from .metrics import track_ai_call
+
+        def errors():
+            return REGISTRY.get_sample_value('ai_request_errors_total', {'helper': 'test_helper'}) or 0
+
+        before = errors()
+        with self.assertRaises(RuntimeError):
+            with track_ai_call('test_helper'):
+                raise RuntimeError('boom')
+        self.assertEqual(errors(), before + 1)
+
+
+class ProfilingTests(TestCase):
+    """Request được profile (header ký hoặc vượt ngưỡng) lưu vào ring buffer, xem qua API admin"""
+
+    def setUp(self):
+        import tempfile
+        from django.contrib.auth.models import User
+        from rest_framework.test import APIClient
+
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profile_dir.cleanup)
+        overrides = override_settings(PROFILING_DIR=self.profile_dir.name, PROFILING_MAX_ENTRIES=2)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.admin = APIClient()
+        self.admin.force_authenticate(User.objects.create_user('admin', password='x', is_staff=True))
+
+    def profile_token(self):
+        return self.admin.post('/api/admin/profiles/token/').data
+
+    def profile_header(self):
+        token = self.profile_token()
+        return {f"HTTP_{token['header'].upper().replace('-', '_')}": token['value']}
+
+    def test_signed_header_profiles_request(self):
+        response = self.client.get('/api/courses/', **self.profile_header())
+        profile_id = response['X-Profile-Id']
+
+        record = self.admin.get(f'/api/admin/profiles/{profile_id}/').data
+        self.assertEqual((record['view'], record['trigger']), ('course-list', 'header'))
+        self.assertIn('db', record['timings_ms'])
+        self.assertEqual(len(record['sql']), record['queries'])
+        self.assertEqual(record['files'], ['folded', 'prof'])
+        self.assertEqual(self.admin.get(f'/api/admin/profiles/{profile_id}/prof/').status_code, 200)
+
+    async def test_sync_view_is_profiled_under_asgi(self):
+        token = await sync_to_async(self.profile_token)()
+        response = await self.async_client.get('/api/courses/', headers={token['header']: token['value']})
+        record = await sync_to_async(load_profile)(response['X-Profile-Id'])
+        self.assertEqual(record['view'], 'course-list')
+        self.assertGreater(record['queries'], 0)
+        self.assertEqual(record['files'], ['folded', 'prof'])
+
+    def test_invalid_header_and_fast_requests_are_not_profiled(self):
+        self.assertFalse(self.client.get('/api/courses/', HTTP_X_PROFILE_REQUEST='profile:forged').has_header('X-Profile-Id'))
+        with override_settings(PROFILING_SLOW_REQUEST_MS=60_000):
+            self.assertFalse(self.client.get('/api/courses/').has_header('X-Profile-Id'))
+
+    def test_ring_buffer_keeps_newest_profiles(self):
+        headers = self.profile_header()
+        ids = [self.client.get('/api/courses/', **headers)['X-Profile-Id'] for _ in range(3)]
+        listed = [profile['id'] for profile in self.admin.get('/api/admin/profiles/').data]
+        self.assertEqual(listed, ids[:0:-1])
+
+    def test_profiles_are_admin_only(self):
+        self.assertEqual(self.client.get('/api/admin/profiles/').status_code, 401)
+
+
+class IdempotencyTests(TestCase):
+    """Idempotency-Key: gửi lại trả response đã lưu, key gắn với user chứ không với token"""
+
+    def setUp(self):
+        from course.models import Course
+        from user.utils import create_user_with_profile
+
+        self.student = create_user_with_profile('student', 'pw', user_type='student')
+        self.course = Course.objects.create(title='Idempotent', description='d', published=True)
+        self.path = f'/api/student/courses/{self.course.id}/enroll/'
+
+    def post(self, key, body=None):
+        from user.tokens import RoleRefreshToken
+
+        # Mỗi lần một access token mới (như sau khi làm mới token)
+        token = RoleRefreshToken.for_user(self.student).access_token
+        return self.client.post(
+            self.path, body or {}, content_type='application/json',
+            HTTP_AUTHORIZATION=f'Bearer {token}', HTTP_IDEMPOTENCY_KEY=key)
+
+    def record_key(self, key):
+        return IdempotencyMiddleware._fingerprint(str(self.student.pk), 'POST', self.path, key)
+
+    def test_retry_replays_stored_response(self):
+        from course.models import UserCourse
+
+        first = self.post('k1')
+        retry = self.post('k1')
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(UserCourse.objects.filter(user=self.student).count(), 1)
+
+    def test_same_key_with_other_body_is_rejected(self):
+        self.post('k2', {'note': 'a'})
+        self.assertEqual(self.post('k2', {'note': 'b'}).status_code, 422)
+
+    def test_in_progress_key_conflicts_until_lock_timeout(self):
+        record = IdempotencyKey.objects.create(
+            key=self.record_key('k3'), request_hash=hashlib.sha256(b'{}').hexdigest(),
+            expires_at=timezone.now() + timedelta(days=1))
+        self.assertEqual(self.post('k3').status_code, 409)
+
+        # Worker xử lý request trước đã chết: sau IDEMPOTENCY_LOCK_TIMEOUT request được chạy lại
+        IdempotencyKey.objects.filter(pk=record.pk).update(
+            created_at=timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT + 1))
+        self.assertEqual(self.post('k3').status_code, 201)
+        self.assertEqual(IdempotencyKey.objects.get(key=self.record_key('k3')).status_code, 201)
+
+    def test_stale_key_is_reclaimed_only_once(self):
+        from course.models import UserCourse
+
+        IdempotencyKey.objects.create(
+            key=self.record_key('k5'), request_hash=hashlib.sha256(b'{}').hexdigest(),
+            expires_at=timezone.now() - timedelta(seconds=1))
+        # Request khác cùng key liên tục giành lại bản ghi: chỉ thử lại một lần rồi trả 409
+        with mock.patch.object(IdempotencyKey.objects, 'create', side_effect=IntegrityError) as create:
+            self.assertEqual(self.post('k5').status_code, 409)
+        self.assertEqual(create.call_count, 2)
+        self.assertFalse(UserCourse.objects.filter(user=self.student).exists())
+
+    def test_server_error_is_not_stored(self):
+        record = IdempotencyKey.objects.create(key=self.record_key('k4'), request_hash='', expires_at=timezone.now())
+        IdempotencyMiddleware._store_response(record, HttpResponse(status=503))
+        self.assertFalse(IdempotencyKey.objects.filter(pk=record.pk).exists())
+
+
+class DatabaseRoutingTests(SimpleTestCase):
+    """Router primary/replica và cách load_test đếm kết nối DB từ /metrics"""
+
+    def test_reads_use_replica_only_inside_replica_reads(self):
+        from django.contrib.auth.models import User
+        from .db_routers import PrimaryReplicaRouter, replica_reads
+
+        router = PrimaryReplicaRouter()
+        with override_settings(DATABASE_REPLICAS=['replica1']):
+            self.assertEqual(router.db_for_read(User), 'default')
+            with replica_reads():
+                self.assertEqual(router.db_for_read(User), 'replica1')
+                self.assertEqual(router.db_for_write(User), 'default')
+        with override_settings(DATABASE_REPLICAS=[]), replica_reads():
+            self.assertEqual(router.db_for_read(User), 'default')
+
+    def test_connections_opened_counts_direct_and_pool_connections(self):
+        from .management.commands.load_test import connections_opened
+
+        text = '\n'.join([
+            'db_connections_created_total{alias="default"} 3.0',
+            'db_pool_connections{alias="default",state="opened"} 2.0',
+            'db_pool_connections{alias="default",state="size"} 2.0',
+        ])
+        self.assertEqual(connections_opened(text), 5)
+
+
+class ReplicaCacheCheckTests(SimpleTestCase):
+    """Read replica thật (DATABASE_REPLICA_HOSTS) cần cache dùng chung cho việc ghim primary"""
+
+    @override_settings(DATABASE_REPLICA_HOSTS=['replica:5432'])
+    def test_replica_hosts_require_shared_cache(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([e.id for e in check_replica_sticky_cache(None)], ['api.E001'])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}):
+            self.assertEqual(check_replica_sticky_cache(None), [])
+
+
+class DatabaseSyncToAsyncTests(SimpleTestCase):
+    """Bước ORM của view async chạy trên thread pool dùng chung, không trên thread riêng của request"""
+
+    def test_runs_outside_request_thread(self):
+        async def handle():
+            # Như ASGIHandler: mỗi request một ThreadSensitiveContext
+            async with ThreadSensitiveContext():
+                request_thread = await sync_to_async(threading.get_ident)()
+                orm_thread = await database_sync_to_async(threading.get_ident)()
+            return request_thread, orm_thread
+
+        request_thread, orm_thread = async_to_sync(handle)()
+        self.assertNotEqual(request_thread, orm_thread)
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'Needs a replica database (DATABASE_REPLICA_NAME or DATABASE_REPLICA_HOSTS)')
+class ReadReplicaTests(TransactionTestCase):
+    """View khai báo đọc replica đi replica; sau khi user ghi thì đọc primary (read-your-writes)"""
+    databases = '__all__'
+
+    def setUp(self):
+        from course.models import Course
+        from user.tokens import RoleRefreshToken
+        from user.utils import create_user_with_profile
+
+        cache.clear()
+        self.student = create_user_with_profile('student', 'pw', user_type='student')
+        self.course = Course.objects.create(title='Replica', description='d', published=True)
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {RoleRefreshToken.for_user(self.student).access_token}'
+
+    def replica_queries(self, path):
+        replica = connections[settings.DATABASE_REPLICAS[0]]
+        with CaptureQueriesContext(replica) as queries:
+            self.assertEqual(self.client.get(path).status_code, 200)
+        return len(queries)
+
+    def test_replica_preferred_views_read_from_replica(self):
+        self.assertGreater(self.replica_queries('/api/courses/'), 0)
+        self.assertGreater(self.replica_queries(f'/api/student/courses/{self.course.id}/'), 0)
+        # View không khai báo read_preference đọc primary
+        self.assertEqual(self.replica_queries('/api/student/my-courses/'), 0)
+
+    def test_reads_stick_to_primary_after_write(self):
+        response = self.client.post(f'/api/student/courses/{self.course.id}/enroll/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.replica_queries('/api/courses/'), 0)
+
+        cache.clear()  # hết thời gian ghim
+        self.assertGreater(self.replica_queries('/api/courses/'), 0)
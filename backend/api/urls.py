@@ -1,5 +1,8 @@
 from django.urls import path
-from .views import HelloView, TestConnectionView, TestDatabaseView
+from .views import (
+    HelloView, TestConnectionView, TestDatabaseView,
+    ProfileListView, ProfileDetailView, ProfileFileView, ProfileTokenView,
+)
 from user.views import RegisterView, ProfileView
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
@@ -10,4 +13,8 @@ urlpatterns = [
     path('hello/', HelloView.as_view()),
     path('test-connection/', TestConnectionView.as_view()),
     path('test-database/', TestDatabaseView.as_view()),
+    path('admin/profiles/', ProfileListView.as_view(), name='profile-list'),
+    path('admin/profiles/token/', ProfileTokenView.as_view(), name='profile-token'),
+    path('admin/profiles/<str:profile_id>/', ProfileDetailView.as_view(), name='profile-detail'),
+    path('admin/profiles/<str:profile_id>/<str:ext>/', ProfileFileView.as_view(), name='profile-file'),
 ]
\ No newline at end of file
@@ -1,9 +1,17 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser
 from .models import TestModel
 from .serializers import TestModelSerializer
 from django.db import connection
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+from prometheus_client import CONTENT_TYPE_LATEST
+from . import profiling
+from .metrics import render_metrics
 
 class HelloView(APIView):
     def get(self, request):
@@ -37,4 +45,55 @@ class TestDatabaseView(APIView):
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@require_GET
+def metrics_view(request):
+    """Metrics Prometheus (text exposition format), gộp mọi worker ở chế độ multiprocess"""
+    token = settings.METRICS_TOKEN
+    if token and not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
+
+
+class ProfileListView(APIView):
+    """Danh sách profile request đang lưu (mới nhất trước), chỉ admin"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(profiling.list_profiles())
+
+
+class ProfileDetailView(APIView):
+    """Chi tiết một profile: thời gian theo nhóm, log SQL, kết quả profiler"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, profile_id):
+        record = profiling.load_profile(profile_id)
+        if record is None:
+            return Response({"detail": "Không tìm thấy profile"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(record)
+
+
+class ProfileFileView(APIView):
+    """Tải file kết quả profiler: `prof` (pstats/snakeviz) hoặc `folded` (flamegraph)"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, profile_id, ext):
+        path = profiling.profile_file_path(profile_id, ext)
+        if path is None:
+            return Response({"detail": "Không tìm thấy file profile"}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'{profile_id}.{ext}')
+
+
+class ProfileTokenView(APIView):
+    """Cấp token cho header X-Profile-Request để profile một request bất kỳ"""
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        return Response({
+            "header": profiling.PROFILE_HEADER,
+            "value": profiling.make_profile_token(),
+            "expires_in": settings.PROFILING_TOKEN_MAX_AGE,
+        })
@@ -52,17 +52,23 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.ProfilingMiddleware',
+    'api.middleware.ReadReplicaMiddleware',
+    'api.middleware.QueryInstrumentationMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.IdempotencyMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_EXPOSE_HEADERS = ['ETag', 'Last-Modified', 'Idempotent-Replayed', 'Server-Timing', 'X-Profile-Id']
 
 ROOT_URLCONF = 'backend.urls'
 
@@ -87,16 +93,66 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# Kết nối được giữ lại giữa các request DATABASE_CONN_MAX_AGE giây (0 = đóng sau mỗi request)
+# và được kiểm tra còn sống trước khi dùng lại. DATABASE_POOL=True (PostgreSQL + psycopg 3) dùng
+# connection pool thay thế: mỗi worker một pool từ DATABASE_POOL_MIN_SIZE đến
+# DATABASE_POOL_MAX_SIZE kết nối, chờ tối đa DATABASE_POOL_TIMEOUT giây khi pool đã đầy.
+# Tổng kết nối tối đa = số worker x DATABASE_POOL_MAX_SIZE, phải nhỏ hơn max_connections.
+DATABASE_CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', 60))  # giây
+DATABASE_POOL = os.environ.get('DATABASE_POOL', 'False') == 'True'
+DATABASE_POOL_MIN_SIZE = int(os.environ.get('DATABASE_POOL_MIN_SIZE', 1))
+DATABASE_POOL_MAX_SIZE = int(os.environ.get('DATABASE_POOL_MAX_SIZE', 4))
+DATABASE_POOL_TIMEOUT = float(os.environ.get('DATABASE_POOL_TIMEOUT', 10))  # giây
+
+# Read replica (tuỳ chọn): danh sách host[:port] cách nhau dấu phẩy, dùng chung tên DB/tài khoản
+# với primary trừ khi đặt DATABASE_REPLICA_NAME (ví dụ file SQLite thứ hai khi chạy local).
+# Chỉ view khai báo @read_preference(REPLICA) (api.db_routers) mới đọc từ replica
+DATABASE_REPLICA_HOSTS = [host for host in os.environ.get('DATABASE_REPLICA_HOSTS', '').split(',') if host]
+DATABASE_REPLICA_NAME = os.environ.get('DATABASE_REPLICA_NAME')
+
+
+def database_config(name, host, port):
+    config = {
         'ENGINE': os.environ.get('DATABASE_ENGINE'),
-        'NAME': os.environ.get('DATABASE_NAME'),
+        'NAME': name,
         'USER': os.environ.get('DATABASE_USER'),
         'PASSWORD': os.environ.get('DATABASE_PASSWORD'),
-        'HOST': os.environ.get('DATABASE_HOST'),
-        'PORT': os.environ.get('DATABASE_PORT'),
+        'HOST': host,
+        'PORT': port,
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
     }
+    if DATABASE_POOL and 'postgresql' in (config['ENGINE'] or ''):
+        # Pool thay cho kết nối bền: Django yêu cầu CONN_MAX_AGE = 0 khi dùng pool
+        config['CONN_MAX_AGE'] = 0
+        config['OPTIONS'] = {'pool': {
+            'min_size': DATABASE_POOL_MIN_SIZE,
+            'max_size': DATABASE_POOL_MAX_SIZE,
+            'timeout': DATABASE_POOL_TIMEOUT,
+        }}
+    return config
+
+
+DATABASES = {
+    'default': database_config(
+        os.environ.get('DATABASE_NAME'), os.environ.get('DATABASE_HOST'), os.environ.get('DATABASE_PORT')),
 }
+for index, replica_host in enumerate(DATABASE_REPLICA_HOSTS or ([''] if DATABASE_REPLICA_NAME else []), start=1):
+    replica_host, _, replica_port = replica_host.partition(':')
+    DATABASES[f'replica{index}'] = {
+        **database_config(
+            DATABASE_REPLICA_NAME or os.environ.get('DATABASE_NAME'),
+            replica_host or os.environ.get('DATABASE_HOST'),
+            replica_port or os.environ.get('DATABASE_PORT'),
+        ),
+        # Khi chạy test, replica trỏ tới DB test của primary
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+# Sau khi ghi, user đọc từ primary trong khoảng này (nên lớn hơn độ trễ replication);
+# trạng thái lưu trong cache mặc định nên cần cache dùng chung (Redis...) khi chạy nhiều worker (check api.E001)
+DATABASE_REPLICA_STICKY_SECONDS = int(os.environ.get('DATABASE_REPLICA_STICKY_SECONDS', 10))
+DATABASE_ROUTERS = ['api.db_routers.PrimaryReplicaRouter']
 
 
 # Password validation
@@ -140,9 +196,15 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# JWT_STATELESS_AUTH=True: các request đọc (GET) tin tưởng claims vai trò trong access token, không truy vấn DB.
+# Phiên bản profile dùng để vô hiệu hóa claims cũ được cache trong cache 'default', nên chế độ này
+# cần cache dùng chung giữa các worker (Redis/Memcached/DB cache, xem check user.E001)
+JWT_STATELESS_AUTH = os.environ.get('JWT_STATELESS_AUTH', 'False') == 'True'
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'user.authentication.ClaimsJWTAuthentication' if JWT_STATELESS_AUTH
+        else 'user.authentication.ProfileJWTAuthentication',
     ),
 }
 
@@ -153,8 +215,112 @@ SIMPLE_JWT = {
     "AUTH_HEADER_TYPES": ("Bearer",),
     "ROTATE_REFRESH_TOKENS": True,
     "BLACKLIST_AFTER_ROTATION": True,
+    "TOKEN_REFRESH_SERIALIZER": "user.serializers.RoleTokenRefreshSerializer",
+}
+
+# Idempotency-Key: các endpoint POST (theo tên route) được phép gửi lại an toàn
+IDEMPOTENT_URL_NAMES = {
+    'quiz-submit',
+    'course-enroll',
+    'course-bulk-enroll',
+    'generate-auto-quiz',
+    'student-lesson-summarize',
+    'quiz-attempt-ai-feedback',
+    'teacher-quiz-attempt-ai-feedback',
+}
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))  # giây
+# Key "đang xử lý" quá thời gian này (worker bị kill giữa chừng) được coi là bỏ dở và cho chạy lại;
+# phải lớn hơn thời gian xử lý lâu nhất của các endpoint trên (kể cả chờ AI)
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.environ.get('IDEMPOTENCY_LOCK_TIMEOUT', 5 * 60))  # giây
+
+# Đo số truy vấn/thời gian SQL theo request (api.middleware.QueryInstrumentationMiddleware):
+# tỉ lệ request được đo (production nên để nhỏ, ví dụ 0.01), ngưỡng số lần lặp của một truy vấn
+# để log WARNING, và file log JSON cho lệnh query_report
+QUERY_INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('QUERY_INSTRUMENTATION_SAMPLE_RATE', 1.0 if DEBUG else 0.01))
+QUERY_DUPLICATE_WARN_THRESHOLD = int(os.environ.get('QUERY_DUPLICATE_WARN_THRESHOLD', 10))
+QUERY_LOG_FILE = os.environ.get('QUERY_LOG_FILE')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        # Console chỉ hiện request nghi N+1; file (nếu có) nhận mọi request được đo
+        'query_console': {'class': 'logging.StreamHandler', 'level': 'WARNING'},
+        **({'query_file': {'class': 'logging.FileHandler', 'filename': QUERY_LOG_FILE, 'level': 'INFO'}}
+           if QUERY_LOG_FILE else {}),
+    },
+    'loggers': {
+        'api.queries': {
+            'handlers': ['query_console', *(['query_file'] if QUERY_LOG_FILE else [])],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Endpoint /metrics (Prometheus): nếu đặt METRICS_TOKEN thì phải gửi header
+# `Authorization: Bearer <token>`; để trống khi /metrics chỉ mở trong mạng nội bộ
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Profiling request (api.middleware.ProfilingMiddleware): request chậm hơn PROFILING_SLOW_REQUEST_MS
+# (0 = tắt) được chạy dưới các profiler trong PROFILING_PROFILERS (sampling, cprofile) và lưu lại;
+# request có header X-Profile-Request (token ký, hạn PROFILING_TOKEN_MAX_AGE giây) luôn được profile.
+# Profile lưu trong PROFILING_DIR, chỉ giữ PROFILING_MAX_ENTRIES bản mới nhất
+PROFILING_SLOW_REQUEST_MS = int(os.environ.get('PROFILING_SLOW_REQUEST_MS', 0))
+PROFILING_PROFILERS = [name for name in os.environ.get('PROFILING_PROFILERS', 'sampling').split(',') if name]
+PROFILING_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILING_SAMPLE_INTERVAL_MS', 5))
+PROFILING_TOKEN_MAX_AGE = int(os.environ.get('PROFILING_TOKEN_MAX_AGE', 60 * 60))
+PROFILING_DIR = os.environ.get('PROFILING_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILING_MAX_ENTRIES = int(os.environ.get('PROFILING_MAX_ENTRIES', 200))
+PROFILING_MAX_SQL = int(os.environ.get('PROFILING_MAX_SQL', 500))
+
+# Conditional GET (ETag/Last-Modified) cho API nội dung khóa học: thời gian proxy/CDN
+# được cache response công khai (ẩn danh) trước khi phải kiểm tra lại
+COURSE_CACHE_MAX_AGE = int(os.environ.get('COURSE_CACHE_MAX_AGE', 60))  # giây
+
+# Bài kiểm tra có giới hạn thời gian: thời gian ân hạn (độ trễ mạng) sau deadline trước khi
+# từ chối autosave/nộp bài; lệnh finalize_expired_attempts chốt các bài quá hạn
+QUIZ_DEADLINE_GRACE_SECONDS = int(os.environ.get('QUIZ_DEADLINE_GRACE_SECONDS', 30))
+
+# Import archive khóa học: kích thước tối đa sau giải nén của course.json và ảnh bìa (chống zip bomb)
+COURSE_ARCHIVE_MAX_JSON_SIZE = int(os.environ.get('COURSE_ARCHIVE_MAX_JSON_SIZE', 50 * 1024 * 1024))  # byte
+COURSE_ARCHIVE_MAX_THUMBNAIL_SIZE = int(os.environ.get('COURSE_ARCHIVE_MAX_THUMBNAIL_SIZE', 5 * 1024 * 1024))  # byte
+
+# Sao chép khóa học: khóa học có tối đa bấy nhiêu dòng nội dung được sao chép ngay trong
+# request, lớn hơn thì tạo CourseCloneJob cho lệnh run_clone_jobs chạy nền
+COURSE_CLONE_SYNC_MAX_ROWS = int(os.environ.get('COURSE_CLONE_SYNC_MAX_ROWS', 5000))
+COURSE_CLONE_CHUNK_SIZE = int(os.environ.get('COURSE_CLONE_CHUNK_SIZE', 1000))
+# Job đang chạy không ghi heartbeat (sau mỗi lô) quá thời gian này được coi là worker đã chết
+# và được nhận lại; phải lớn hơn thời gian sao chép một lô COURSE_CLONE_CHUNK_SIZE dòng
+COURSE_CLONE_JOB_TIMEOUT = int(os.environ.get('COURSE_CLONE_JOB_TIMEOUT', 10 * 60))  # giây
+
+# Cache (mặc định local-memory; production nên dùng Redis để các worker dùng chung)
+# Ví dụ: CACHE_BACKEND=django.core.cache.backends.redis.RedisCache CACHE_LOCATION=redis://127.0.0.1:6379/1
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    },
+    # JSON đã render của cây khóa học (xem COURSE_TREE_CACHE_*); có thể trỏ sang backend
+    # khác, ví dụ DB cache: COURSE_TREE_CACHE_BACKEND=django.core.cache.backends.db.DatabaseCache
+    # COURSE_TREE_CACHE_LOCATION=course_tree_cache (chạy `python manage.py createcachetable`)
+    'course_tree': {
+        'BACKEND': os.environ.get(
+            'COURSE_TREE_CACHE_BACKEND',
+            os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        ),
+        'LOCATION': os.environ.get('COURSE_TREE_CACHE_LOCATION', os.environ.get('CACHE_LOCATION', '')),
+        'KEY_PREFIX': 'course_tree',
+    },
 }
 
+# Cache cây nội dung khóa học đã xuất bản, key theo (course id, content_version)
+# nên không cần xóa khi sửa nội dung; bản cũ tự hết hạn sau TIMEOUT
+COURSE_TREE_CACHE_ALIAS = os.environ.get('COURSE_TREE_CACHE_ALIAS', 'course_tree')
+COURSE_TREE_CACHE_TIMEOUT = int(os.environ.get('COURSE_TREE_CACHE_TIMEOUT', 24 * 60 * 60))  # giây
+# Chống stampede: chỉ một request dựng lại cache, các request khác chờ tối đa bấy nhiêu giây
+COURSE_TREE_CACHE_LOCK_TIMEOUT = int(os.environ.get('COURSE_TREE_CACHE_LOCK_TIMEOUT', 10))  # giây
+
 # Email settings (replace with your own email configuration)
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend' 
 EMAIL_HOST = os.environ.get('EMAIL_HOST', 'smtp.gmail.com')
@@ -170,3 +336,6 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # Google AI API Key for quiz generation
 GOOGLE_AI_API_KEY = os.environ.get('GOOGLE_AI_API_KEY', '')
+
+# > 0: thay lời gọi Gemini bằng khoảng chờ (giây) và câu trả lời cố định, chỉ dùng khi load test
+AI_SIMULATED_LATENCY = float(os.environ.get('AI_SIMULATED_LATENCY', 0))
@@ -0,0 +1,336 @@
+"""
+Định dạng archive khóa học (zip): `course.json` chứa toàn bộ cây nội dung và
+thư mục `thumbnail/` chứa ảnh bìa (nếu có).
+
+Export được stream theo từng lô section nên không giữ cả cây/zip trong bộ nhớ;
+import tạo cả cây bằng một bulk_create cho mỗi cấp trong một transaction.
+"""
+import json
+import os
+import zipfile
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DataError, IntegrityError, transaction
+from django.db.models import Prefetch
+
+from .models import Course, Section, Lesson, Quiz, Question, Choice, QuestionTag, QuizRule
+from .utils import section_content_prefetches
+
+ARCHIVE_FORMAT = 'course-archive'
+ARCHIVE_VERSION = 1
+ARCHIVE_JSON_NAME = 'course.json'
+EXPORT_SECTION_CHUNK_SIZE = 50
+BULK_BATCH_SIZE = 1000
+
+
+class ArchiveError(ValueError):
+    """Archive không hợp lệ (sai định dạng, thiếu trường, sai kiểu dữ liệu)"""
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def _question_data(question, tags=False):
+    data = {
+        'text': question.text,
+        'position': question.position,
+        'difficulty': question.difficulty,
+        'choices': [{'text': choice.text, 'is_correct': choice.is_correct} for choice in question.choices.all()],
+    }
+    if tags:
+        data['tags'] = [tag.name for tag in question.tags.all()]
+    return data
+
+
+def section_data(section):
+    """Dữ liệu archive của một section (cần prefetch section_content_prefetches())"""
+    return {
+        'title': section.title,
+        'position': section.position,
+        'lessons': [{
+            'title': lesson.title,
+            'content': lesson.content,
+            'position': lesson.position,
+            'video_url': lesson.video_url,
+        } for lesson in section.lessons.all()],
+        'quizzes': [{
+            'title': quiz.title,
+            'position': quiz.position,
+            'time_limit': quiz.time_limit,
+            'rules': [{
+                'tag': rule.tag.name if rule.tag else None,
+                'difficulty': rule.difficulty,
+                'count': rule.count,
+            } for rule in quiz.rules.all()],
+            'questions': [_question_data(question) for question in quiz.questions.all()],
+        } for quiz in section.quizzes.all()],
+    }
+
+
+def course_header_data(course):
+    """Phần đầu archive: thông tin khóa học, tag và ngân hàng câu hỏi (chưa có sections)"""
+    bank = (
+        Question.objects.filter(bank_course=course)
+        .order_by('position', 'id')
+        .prefetch_related('tags', Prefetch('choices', queryset=Choice.objects.order_by('id')))
+    )
+    return {
+        'format': ARCHIVE_FORMAT,
+        'version': ARCHIVE_VERSION,
+        'course': {
+            'title': course.title,
+            'subtitle': course.subtitle,
+            'description': course.description,
+            'category': course.category,
+            'price': str(course.price) if course.price is not None else None,
+            'thumbnail': f'thumbnail/{os.path.basename(course.thumbnail.name)}' if course.thumbnail else None,
+        },
+        'question_tags': list(course.question_tags.order_by('name').values_list('name', flat=True)),
+        'question_bank': [_question_data(question, tags=True) for question in bank],
+    }
+
+
+def iter_section_data(course):
+    """Dữ liệu archive của các section, prefetch theo lô EXPORT_SECTION_CHUNK_SIZE section"""
+    sections = (
+        Section.objects.filter(course=course)
+        .order_by('position', 'id')
+        .prefetch_related(*section_content_prefetches())
+    )
+    for section in sections.iterator(chunk_size=EXPORT_SECTION_CHUNK_SIZE):
+        yield section_data(section)
+
+
+class _StreamBuffer:
+    """File chỉ-ghi không seek được: zipfile ghi vào, generator lấy dần dữ liệu ra"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_course_archive(course):
+    """Generator trả về từng phần bytes của file zip archive"""
+    buffer = _StreamBuffer()
+    header = course_header_data(course)
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(ARCHIVE_JSON_NAME, 'w', force_zip64=True) as out:
+            # Ghi JSON tăng dần: phần đầu, từng section, rồi đóng mảng sections
+            out.write(_dumps(header)[:-1].encode() + b',"sections":[')
+            for i, data in enumerate(iter_section_data(course)):
+                out.write((b',' if i else b'') + _dumps(data).encode())
+                yield buffer.pop()
+            out.write(b']}')
+        yield buffer.pop()
+
+        if header['course']['thumbnail']:
+            try:
+                thumbnail = course.thumbnail.open('rb')
+            except OSError:
+                thumbnail = None  # file ảnh không còn trên storage: bỏ qua
+            if thumbnail is not None:
+                with thumbnail, archive.open(header['course']['thumbnail'], 'w', force_zip64=True) as out:
+                    for chunk in thumbnail.chunks():
+                        out.write(chunk)
+                        yield buffer.pop()
+    yield buffer.pop()
+
+
+def _read_member(archive, name, max_size):
+    """Đọc một file trong zip, tối đa max_size byte sau giải nén (chống zip bomb)"""
+    info = archive.getinfo(name)
+    if info.file_size <= max_size:
+        with archive.open(info) as member:
+            # Kích thước khai báo trong zip có thể bị sửa: chỉ đọc tối đa max_size + 1 byte
+            content = member.read(max_size + 1)
+        if len(content) <= max_size:
+            return content
+    raise ArchiveError(f"{name} vượt quá {max_size} byte sau giải nén")
+
+
+def read_course_archive(fileobj):
+    """Đọc archive zip: trả về (data, thumbnail_bytes hoặc None)"""
+    try:
+        with zipfile.ZipFile(fileobj) as archive:
+            data = json.loads(_read_member(archive, ARCHIVE_JSON_NAME, settings.COURSE_ARCHIVE_MAX_JSON_SIZE))
+            thumbnail_name = (data.get('course') or {}).get('thumbnail') if isinstance(data, dict) else None
+            thumbnail = None
+            if thumbnail_name and thumbnail_name in archive.namelist():
+                thumbnail = _read_member(archive, thumbnail_name, settings.COURSE_ARCHIVE_MAX_THUMBNAIL_SIZE)
+    except ArchiveError:
+        raise
+    except (zipfile.BadZipFile, KeyError, ValueError) as e:
+        raise ArchiveError(f"File archive không hợp lệ: {e}")
+    return data, thumbnail
+
+
+def validate_thumbnail(name, content):
+    """Ảnh bìa trong archive phải là ảnh hợp lệ (kiểm tra bằng Pillow như ImageField của form)"""
+    try:
+        forms.ImageField().clean(SimpleUploadedFile(os.path.basename(name), content))
+    except ValidationError as e:
+        raise ArchiveError(f"Ảnh bìa không hợp lệ: {' '.join(e.messages)}")
+
+
+def unique_course_title(title):
+    """Course.title là unique: thêm hậu tố (2), (3)... nếu đã có khóa học cùng tên"""
+    max_length = Course._meta.get_field('title').max_length
+    title = title[:max_length]
+    taken = set(Course.objects.filter(title__startswith=title[:max_length - 6]).values_list('title', flat=True))
+    if title not in taken:
+        return title
+    n = 2
+    while True:
+        suffix = f' ({n})'
+        candidate = title[:max_length - len(suffix)] + suffix
+        if candidate not in taken:
+            return candidate
+        n += 1
+
+
+def _build_questions(questions_data, **fields):
+    return [
+        Question(
+            text=q['text'],
+            position=q.get('position', i + 1),
+            difficulty=q.get('difficulty') or 'medium',
+            **fields,
+        )
+        for i, q in enumerate(questions_data)
+    ]
+
+
+def import_course_archive(data, creator, thumbnail=None, title=None):
+    """
+    Tạo khóa học mới (chưa xuất bản) từ dữ liệu archive: mỗi cấp (section, lesson,
+    quiz, rule, question, choice, tag) một bulk_create, cả cây trong một transaction.
+    """
+    if not isinstance(data, dict) or data.get('format') != ARCHIVE_FORMAT:
+        raise ArchiveError("Không phải archive khóa học")
+    if data.get('version') != ARCHIVE_VERSION:
+        raise ArchiveError(f"Không hỗ trợ archive phiên bản {data.get('version')}")
+    if thumbnail is not None:
+        validate_thumbnail(str((data.get('course') or {}).get('thumbnail')), thumbnail)
+
+    try:
+        with transaction.atomic():
+            return _import_course(data, creator, thumbnail, title)
+    except (KeyError, TypeError, AttributeError, ValidationError) as e:
+        raise ArchiveError(f"Dữ liệu archive thiếu hoặc sai kiểu: {e}")
+    except (IntegrityError, DataError) as e:
+        # Giá trị vi phạm ràng buộc của DB (NOT NULL, CHECK, độ dài...): cả cây đã được rollback
+        raise ArchiveError(f"Dữ liệu archive không hợp lệ: {e}")
+
+
+def _import_course(data, creator, thumbnail, title):
+    course_data = data['course']
+    course = Course(
+        title=unique_course_title(title or course_data['title']),
+        subtitle=course_data.get('subtitle'),
+        description=course_data.get('description') or '',
+        category=course_data.get('category'),
+        price=course_data.get('price'),
+        creator=creator,
+        published=False,
+    )
+    course.save()
+
+    # Tag và ngân hàng câu hỏi
+    tag_names = {*data.get('question_tags', ())}
+    bank_data = data.get('question_bank', [])
+    for q in bank_data:
+        tag_names.update(q.get('tags', ()))
+    for section in data.get('sections', ()):
+        for quiz in section.get('quizzes', ()):
+            tag_names.update(rule['tag'] for rule in quiz.get('rules', ()) if rule.get('tag'))
+    tags = {
+        tag.name: tag for tag in QuestionTag.objects.bulk_create(
+            [QuestionTag(course=course, name=name) for name in sorted(tag_names)], batch_size=BULK_BATCH_SIZE)
+    }
+    bank_questions = Question.objects.bulk_create(
+        _build_questions(bank_data, bank_course=course), batch_size=BULK_BATCH_SIZE)
+    Question.tags.through.objects.bulk_create([
+        Question.tags.through(question_id=question.id, questiontag_id=tags[name].id)
+        for question, q in zip(bank_questions, bank_data)
+        for name in set(q.get('tags', ()))
+    ], batch_size=BULK_BATCH_SIZE)
+
+    # Section → lesson/quiz → rule/question
+    sections_data = data.get('sections', [])
+    sections = Section.objects.bulk_create([
+        Section(course=course, title=s['title'], position=s.get('position', i + 1))
+        for i, s in enumerate(sections_data)
+    ], batch_size=BULK_BATCH_SIZE)
+    Lesson.objects.bulk_create([
+        Lesson(
+            section=section,
+            title=lesson['title'],
+            content=lesson.get('content') or '',
+            position=lesson.get('position', i + 1),
+            video_url=lesson.get('video_url'),
+        )
+        for section, s in zip(sections, sections_data)
+        for i, lesson in enumerate(s.get('lessons', ()))
+    ], batch_size=BULK_BATCH_SIZE)
+    quizzes_data = [(section, quiz) for section, s in zip(sections, sections_data) for quiz in s.get('quizzes', ())]
+    quizzes = Quiz.objects.bulk_create([
+        Quiz(section=section, title=quiz['title'], position=quiz.get('position', i + 1), time_limit=quiz.get('time_limit'))
+        for section, s in zip(sections, sections_data)
+        for i, quiz in enumerate(s.get('quizzes', ()))
+    ], batch_size=BULK_BATCH_SIZE)
+    QuizRule.objects.bulk_create([
+        QuizRule(quiz=quiz, tag=tags[rule['tag']] if rule.get('tag') else None,
+                 difficulty=rule.get('difficulty'), count=rule['count'])
+        for quiz, (_, q) in zip(quizzes, quizzes_data)
+        for rule in q.get('rules', ())
+    ], batch_size=BULK_BATCH_SIZE)
+    # position mặc định đánh số trong từng quiz (như lesson/quiz trong từng section)
+    quiz_questions_data = [question for _, q in quizzes_data for question in q.get('questions', ())]
+    quiz_questions = [
+        question for quiz, (_, q) in zip(quizzes, quizzes_data)
+        for question in _build_questions(q.get('questions', ()), quiz=quiz)
+    ]
+    Question.objects.bulk_create(quiz_questions, batch_size=BULK_BATCH_SIZE)
+
+    # Lựa chọn của mọi câu hỏi (ngân hàng và quiz) trong một lần
+    Choice.objects.bulk_create([
+        Choice(question=question, text=choice['text'], is_correct=bool(choice.get('is_correct')))
+        for question, q in [*zip(bank_questions, bank_data), *zip(quiz_questions, quiz_questions_data)]
+        for choice in q.get('choices', ())
+    ], batch_size=BULK_BATCH_SIZE)
+
+    # Ghi file ảnh sau cùng: dữ liệu sai ở trên không để lại file mồ côi trên storage
+    if thumbnail is not None:
+        course.thumbnail.save(os.path.basename(course_data['thumbnail']), ContentFile(thumbnail))
+    return course
+
+
+def read_archive_upload(request):
+    """Archive từ request: file zip (multipart, trường `file`) hoặc JSON course.json trong body"""
+    upload = request.FILES.get('file')
+    if upload is not None:
+        return read_course_archive(upload)
+    if isinstance(request.data, dict) and 'format' in request.data:
+        return dict(request.data), None
+    raise ArchiveError("Cần gửi file archive (trường file) hoặc JSON course.json")
+
+
+def archive_filename(course):
+    return f'course-{course.id}-v{course.content_version}.zip'
+
@@ -0,0 +1,222 @@
+"""
+Sao chép sâu một khóa học: sections, lessons, quizzes (kèm rule), questions (kể cả
+ngân hàng câu hỏi), choices và tag. Không sao chép học viên đăng ký và lần làm bài.
+
+Mỗi cấp được đọc theo lô (keyset theo id) và ghi bằng bulk_create, id cũ được ánh
+xạ sang id mới để gắn cấp con. Dòng con có cha không nằm trong ánh xạ (cha được thêm vào
+khóa học gốc khi cấp cha đã sao chép xong) bị bỏ qua. Ảnh bìa dùng chung file với khóa học gốc.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .archive import unique_course_title
+from .models import Course, Section, Lesson, Quiz, Question, Choice, QuestionTag, QuizRule, CourseCloneJob
+
+
+def _question_filter(source, prefix=''):
+    return Q(**{f'{prefix}quiz__section__course': source}) | Q(**{f'{prefix}bank_course': source})
+
+
+def _clone_querysets(source):
+    """(tên cấp, queryset các dòng cần sao chép) theo thứ tự cha trước con"""
+    return [
+        ('tags', QuestionTag.objects.filter(course=source)),
+        ('sections', Section.objects.filter(course=source)),
+        ('lessons', Lesson.objects.filter(section__course=source)),
+        ('quizzes', Quiz.objects.filter(section__course=source)),
+        ('rules', QuizRule.objects.filter(quiz__section__course=source)),
+        ('questions', Question.objects.filter(_question_filter(source))),
+        ('question_tags', Question.tags.through.objects.filter(questiontag__course=source)),
+        ('choices', Choice.objects.filter(_question_filter(source, 'question__'))),
+    ]
+
+
+def count_clone_rows(source):
+    """Số dòng cần sao chép của từng cấp (dùng để chọn chạy ngay hay chạy nền và để báo tiến độ)"""
+    return {name: queryset.count() for name, queryset in _clone_querysets(source)}
+
+
+def _copy_rows(queryset, fields, build, chunk_size, on_chunk, remap=True):
+    """
+    Sao chép queryset theo lô chunk_size dòng (keyset theo id): build(row) tạo đối tượng
+    mới từ dict values(), trả về None để bỏ qua dòng. Trả về {id cũ: id mới} nếu remap.
+    """
+    model = queryset.model
+    id_map = {}
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id').values('id', *fields)[:chunk_size])
+        if not rows:
+            return id_map
+        built = [(row['id'], obj) for row in rows if (obj := build(row)) is not None]
+        created = model.objects.bulk_create([obj for _, obj in built])
+        if remap:
+            id_map.update(zip((old_id for old_id, _ in built), (obj.id for obj in created)))
+        last_id = rows[-1]['id']
+        on_chunk(len(rows))
+
+
+def create_course_copy(source, creator, title=None):
+    """Dòng Course mới (chưa xuất bản) cho bản sao; ảnh bìa dùng chung file, không upload lại"""
+    return Course.objects.create(
+        title=unique_course_title(title or source.title),
+        subtitle=source.subtitle,
+        description=source.description,
+        category=source.category,
+        price=source.price,
+        creator=creator,
+        published=False,
+        thumbnail=source.thumbnail.name or None,
+    )
+
+
+def copy_course_content(source, course, totals=None, on_progress=None, chunk_size=None):
+    """
+    Sao chép nội dung của source vào course. on_progress(percent) được gọi sau mỗi lô.
+    Hàm không tự mở transaction: caller bọc transaction.atomic() nếu cần (chạy nền thì
+    không, để tiến độ hiển thị được trong lúc sao chép).
+    """
+    chunk_size = chunk_size or settings.COURSE_CLONE_CHUNK_SIZE
+    totals = totals or count_clone_rows(source)
+    total_rows = sum(totals.values()) or 1
+    done = 0
+
+    def on_chunk(count):
+        nonlocal done
+        done += count
+        if on_progress is not None:
+            on_progress(min(99, done * 100 // total_rows))
+
+    querysets = dict(_clone_querysets(source))
+
+    tag_map = _copy_rows(
+        querysets['tags'], ['name'],
+        lambda row: QuestionTag(course=course, name=row['name']),
+        chunk_size, on_chunk)
+    section_map = _copy_rows(
+        querysets['sections'], ['title', 'position'],
+        lambda row: Section(course=course, title=row['title'], position=row['position']),
+        chunk_size, on_chunk)
+    _copy_rows(
+        querysets['lessons'], ['section_id', 'title', 'content', 'position', 'video_url'],
+        lambda row: Lesson(
+            section_id=section_map[row['section_id']], title=row['title'], content=row['content'],
+            position=row['position'], video_url=row['video_url'],
+        ) if row['section_id'] in section_map else None,
+        chunk_size, on_chunk, remap=False)
+    quiz_map = _copy_rows(
+        querysets['quizzes'], ['section_id', 'title', 'position', 'time_limit'],
+        lambda row: Quiz(
+            section_id=section_map[row['section_id']], title=row['title'],
+            position=row['position'], time_limit=row['time_limit'],
+        ) if row['section_id'] in section_map else None,
+        chunk_size, on_chunk)
+    _copy_rows(
+        querysets['rules'], ['quiz_id', 'tag_id', 'difficulty', 'count'],
+        lambda row: QuizRule(
+            quiz_id=quiz_map[row['quiz_id']], tag_id=tag_map.get(row['tag_id']),
+            difficulty=row['difficulty'], count=row['count'],
+        ) if row['quiz_id'] in quiz_map and (row['tag_id'] is None or row['tag_id'] in tag_map) else None,
+        chunk_size, on_chunk, remap=False)
+    question_map = _copy_rows(
+        querysets['questions'], ['quiz_id', 'bank_course_id', 'text', 'position', 'difficulty'],
+        lambda row: Question(
+            quiz_id=quiz_map.get(row['quiz_id']),
+            bank_course=course if row['bank_course_id'] is not None else None,
+            text=row['text'], position=row['position'], difficulty=row['difficulty'],
+        ) if row['quiz_id'] is None or row['quiz_id'] in quiz_map else None,
+        chunk_size, on_chunk)
+    _copy_rows(
+        querysets['question_tags'], ['question_id', 'questiontag_id'],
+        lambda row: Question.tags.through(
+            question_id=question_map[row['question_id']], questiontag_id=tag_map[row['questiontag_id']],
+        ) if row['question_id'] in question_map and row['questiontag_id'] in tag_map else None,
+        chunk_size, on_chunk, remap=False)
+    _copy_rows(
+        querysets['choices'], ['question_id', 'text', 'is_correct'],
+        lambda row: Choice(
+            question_id=question_map[row['question_id']], text=row['text'], is_correct=row['is_correct'],
+        ) if row['question_id'] in question_map else None,
+        chunk_size, on_chunk, remap=False)
+
+    if on_progress is not None:
+        on_progress(100)
+    return course
+
+
+def clone_course(source, creator, title=None, totals=None):
+    """Sao chép khóa học trong một transaction (khóa học nhỏ, chạy ngay trong request)"""
+    with transaction.atomic():
+        course = create_course_copy(source, creator, title)
+        return copy_course_content(source, course, totals=totals)
+
+
+class CloneJobLost(Exception):
+    """Worker khác đã nhận lại job (hoặc bản sao đích đã bị xóa): worker hiện tại phải dừng"""
+
+
+def run_clone_job(job):
+    """
+    Chạy một CourseCloneJob đã được nhận (status = running). Sau mỗi lô, một UPDATE ghi
+    tiến độ và heartbeat_at; UPDATE này chỉ khớp khi job vẫn thuộc lần nhận này (started_at)
+    và bản sao đích còn đó, không thì ném CloneJobLost để dừng. Lỗi giữa chừng thì xóa
+    bản sao dở dang và đánh dấu failed.
+    """
+    owned = CourseCloneJob.objects.filter(id=job.id, status=CourseCloneJob.RUNNING, started_at=job.started_at)
+    if job.target_id is not None:
+        # Job được nhận lại sau khi worker trước chết: xóa bản sao dở dang của lần chạy đó
+        Course.objects.filter(id=job.target_id).delete()
+
+    course = create_course_copy(job.source, job.requested_by, job.title or None)
+    current = owned.filter(target=course)
+
+    def on_progress(percent):
+        if not current.update(progress=percent, heartbeat_at=timezone.now()):
+            raise CloneJobLost(f"Clone job {job.id} was reclaimed or its target course was deleted")
+
+    try:
+        if not owned.update(target=course, heartbeat_at=timezone.now()):
+            raise CloneJobLost(f"Clone job {job.id} was reclaimed")
+        copy_course_content(job.source, course, on_progress=on_progress)
+    except CloneJobLost:
+        # Job giờ thuộc worker khác: chỉ dọn bản sao của mình, không đổi trạng thái job
+        Course.objects.filter(id=course.id).delete()
+        raise
+    except Exception as e:
+        Course.objects.filter(id=course.id).delete()
+        owned.update(status=CourseCloneJob.FAILED, error=str(e), finished_at=timezone.now())
+        raise
+    if not current.update(status=CourseCloneJob.DONE, progress=100, finished_at=timezone.now()):
+        raise CloneJobLost(f"Clone job {job.id} was reclaimed")
+    return course
+
+
+def claim_clone_job():
+    """
+    Nhận job đang chờ lâu nhất (bỏ qua job worker khác đang giữ), chuyển sang running.
+    Job running không ghi heartbeat quá COURSE_CLONE_JOB_TIMEOUT (worker bị kill giữa chừng)
+    cũng được nhận lại.
+    """
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=settings.COURSE_CLONE_JOB_TIMEOUT)
+    with transaction.atomic():
+        job = (
+            CourseCloneJob.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(Q(status=CourseCloneJob.PENDING) | Q(status=CourseCloneJob.RUNNING, heartbeat_at__lt=stale_before))
+            .filter(source__isnull=False)
+            .select_related('source', 'requested_by')
+            .order_by('created_at', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = CourseCloneJob.RUNNING
+        job.started_at = now
+        job.heartbeat_at = now
+        job.progress = 0
+        job.save(update_fields=['status', 'started_at', 'heartbeat_at', 'progress'])
+    return job
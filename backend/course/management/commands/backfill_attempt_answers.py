@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from course.models import QuizAttempt, AttemptAnswer
+from course.utils import load_quiz_answer_key, grade_quiz_answers
+
+
+class Command(BaseCommand):
+    help = "Backfill AttemptAnswer rows from QuizAttempt.answers for historical attempts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of attempts processed per transaction')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        attempts = (
+            QuizAttempt.objects.filter(answer_rows__isnull=True, status=QuizAttempt.SUBMITTED)
+            .order_by('quiz_id', 'id')
+            .only('id', 'quiz_id', 'answers')
+        )
+        self.stdout.write(self.style.NOTICE("Backfilling attempt answers..."))
+
+        answer_keys = {}
+        batch = []
+        total_attempts = 0
+        total_rows = 0
+        for attempt in attempts.iterator(chunk_size=batch_size):
+            if attempt.quiz_id not in answer_keys:
+                # Các attempt được sắp theo quiz nên chỉ cần giữ đáp án của quiz hiện tại
+                answer_keys = {attempt.quiz_id: load_quiz_answer_key(attempt.quiz_id)}
+            _, _, _, rows = grade_quiz_answers(attempt.answers, answer_keys[attempt.quiz_id])
+            for row in rows:
+                row.attempt_id = attempt.id
+            batch.extend(rows)
+            total_attempts += 1
+            if total_attempts % batch_size == 0:
+                total_rows += self._flush(batch)
+                batch = []
+        total_rows += self._flush(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Backfilled {total_rows} answers for {total_attempts} attempts"))
+
+    def _flush(self, rows):
+        if not rows:
+            return 0
+        with transaction.atomic():
+            AttemptAnswer.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+        return len(rows)
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from course.models import Course
+from course.utils import bulk_enroll_users
+
+
+class Command(BaseCommand):
+    help = "Bulk enroll students into a course by user IDs and/or usernames"
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_id', type=int)
+        parser.add_argument('--user-ids', nargs='*', type=int, default=[])
+        parser.add_argument('--usernames', nargs='*', default=[])
+        parser.add_argument('--file', help='File with one username (or numeric user ID with --ids-file) per line')
+        parser.add_argument('--ids-file', action='store_true',
+                            help='Treat the lines of --file as user IDs instead of usernames')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            course = Course.objects.get(id=options['course_id'])
+        except Course.DoesNotExist:
+            raise CommandError(f"Course {options['course_id']} does not exist")
+
+        user_ids = list(options['user_ids'])
+        usernames = list(options['usernames'])
+        if options['file']:
+            with open(options['file'], encoding='utf-8-sig') as f:
+                lines = [line.strip() for line in f if line.strip()]
+            if options['ids_file']:
+                try:
+                    user_ids.extend(int(line) for line in lines)
+                except ValueError as e:
+                    raise CommandError(f"Invalid user ID in {options['file']}: {e}")
+            else:
+                usernames.extend(lines)
+        if not user_ids and not usernames:
+            raise CommandError("Provide --user-ids, --usernames or --file")
+
+        results = bulk_enroll_users(course, user_ids=user_ids, usernames=usernames,
+                                    batch_size=options['batch_size'])
+
+        counts = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+            if result['status'] not in ('enrolled', 'already_enrolled'):
+                self.stdout.write(self.style.WARNING(
+                    f"{result['username'] or result['user_id']}: {result['status']}"))
+        summary = ", ".join(f"{status}={count}" for status, count in sorted(counts.items()))
+        self.stdout.write(self.style.SUCCESS(f"✅ Course {course.id}: {summary}"))
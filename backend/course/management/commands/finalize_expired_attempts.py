@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from course.utils import finalize_expired_attempts
+
+
+class Command(BaseCommand):
+    help = "Grade and close in-progress quiz attempts whose deadline has passed (run from cron or with --interval)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of attempts finalized per transaction')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running and sweep every N seconds (0 = run once)')
+
+    def handle(self, *args, **options):
+        while True:
+            finalized = finalize_expired_attempts(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"✅ Finalized {finalized} expired attempts"))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
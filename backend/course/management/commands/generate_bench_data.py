@@ -0,0 +1,188 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from course.models import Course, Section, Lesson, Quiz, Question, Choice, UserCourse, QuizAttempt, AttemptAnswer
+from user.models.user_profile import UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate synthetic teachers, courses (sections/lessons/quizzes/questions/choices), students, "
+        "enrollments and submitted quiz attempts with bulk_create, for benchmarks at production scale"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='bench', help='Prefix for generated usernames and course titles')
+        parser.add_argument('--teachers', type=int, default=10)
+        parser.add_argument('--courses', type=int, default=100, help='Total number of courses')
+        parser.add_argument('--sections', type=int, default=5, help='Sections per course')
+        parser.add_argument('--lessons', type=int, default=5, help='Lessons per section')
+        parser.add_argument('--quizzes', type=int, default=1, help='Quizzes per section')
+        parser.add_argument('--questions', type=int, default=10, help='Questions per quiz')
+        parser.add_argument('--choices', type=int, default=4, help='Choices per question')
+        parser.add_argument('--lesson-size', type=int, default=1000, help='Characters of content per lesson')
+        parser.add_argument('--students', type=int, default=1000)
+        parser.add_argument('--enrollments', type=int, default=5, help='Courses each student enrolls in')
+        parser.add_argument('--attempts', type=int, default=5, help='Submitted quiz attempts per student')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk_create')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (same seed -> same data)')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.rng = random.Random(options['seed'])
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f"Data with prefix '{prefix}' already exists; use another --prefix")
+
+        started = time.perf_counter()
+        teacher_ids = self.phase('teachers', lambda: self.create_users('t', options['teachers'], 'teacher'))
+        student_ids = self.phase('students', lambda: self.create_users('s', options['students'], 'student'))
+        course_quizzes = self.phase('courses', lambda: self.create_courses(teacher_ids))
+        self.phase('enrollments and attempts', lambda: self.create_enrollments(student_ids, course_quizzes))
+        self.stdout.write(self.style.SUCCESS(f"✅ Done in {time.perf_counter() - started:.1f}s"))
+
+    def phase(self, name, func):
+        started = time.perf_counter()
+        result = func()
+        self.stdout.write(self.style.SUCCESS(f"✅ {name}: {time.perf_counter() - started:.1f}s"))
+        return result
+
+    def bulk_create(self, model, objs):
+        """bulk_create theo lô batch_size trong một transaction, trả về đối tượng đã có id"""
+        created = []
+        with transaction.atomic():
+            for start in range(0, len(objs), self.batch_size):
+                created.extend(model.objects.bulk_create(objs[start:start + self.batch_size]))
+        return created
+
+    def create_users(self, kind, count, user_type):
+        # Băm mật khẩu một lần cho mọi user sinh ra (mật khẩu: <prefix>-password)
+        password = make_password(f"{self.options['prefix']}-password")
+        ids = []
+        for start in range(0, count, self.batch_size):
+            users = self.bulk_create(User, [
+                User(
+                    username=f"{self.options['prefix']}_{kind}{i}",
+                    email=f"{self.options['prefix']}_{kind}{i}@example.com",
+                    first_name=kind.upper(),
+                    last_name=str(i),
+                    password=password,
+                )
+                for i in range(start, min(count, start + self.batch_size))
+            ])
+            self.bulk_create(UserProfile, [UserProfile(user=user, user_type=user_type) for user in users])
+            ids.extend(user.id for user in users)
+        return ids
+
+    def create_courses(self, teacher_ids):
+        """Tạo khóa học theo từng nhóm; trả về {course_id: [(quiz_id, [(question_id, [choice_ids], correct_id)])]}"""
+        options = self.options
+        content = ('Lorem ipsum dolor sit amet. ' * (options['lesson_size'] // 28 + 1))[:options['lesson_size']]
+        # Mỗi nhóm khóa học sinh khoảng batch_size lesson để giới hạn bộ nhớ
+        per_course = max(1, options['sections'] * max(options['lessons'], options['quizzes'] * options['questions']))
+        group_size = max(1, self.batch_size // per_course)
+        course_quizzes = {}
+
+        for start in range(0, options['courses'], group_size):
+            courses = self.bulk_create(Course, [
+                Course(
+                    title=f"{options['prefix']} course {i}",
+                    description='Generated course',
+                    creator_id=teacher_ids[i % len(teacher_ids)] if teacher_ids else None,
+                    published=True,
+                    category=f'Category {i % 10}',
+                )
+                for i in range(start, min(options['courses'], start + group_size))
+            ])
+            sections = self.bulk_create(Section, [
+                Section(course=course, title=f'Section {s}', position=s)
+                for course in courses for s in range(options['sections'])
+            ])
+            self.bulk_create(Lesson, [
+                Lesson(section=section, title=f'Lesson {l}', content=content, position=l,
+                       video_url=f'https://example.com/video{l}')
+                for section in sections for l in range(options['lessons'])
+            ])
+            quizzes = self.bulk_create(Quiz, [
+                Quiz(section=section, title=f'Quiz {q}', position=options['lessons'] + q)
+                for section in sections for q in range(options['quizzes'])
+            ])
+            questions = self.bulk_create(Question, [
+                Question(quiz=quiz, text=f'Question {n}', position=n)
+                for quiz in quizzes for n in range(options['questions'])
+            ])
+            choices = self.bulk_create(Choice, [
+                Choice(question=question, text=f'Choice {c}', is_correct=(c == 0))
+                for question in questions for c in range(options['choices'])
+            ])
+
+            question_choices = {}
+            for choice in choices:
+                question_choices.setdefault(choice.question_id, []).append(choice.id)
+            quiz_questions = {}
+            for question in questions:
+                choice_ids = question_choices.get(question.id, [])
+                quiz_questions.setdefault(question.quiz_id, []).append(
+                    (question.id, choice_ids, choice_ids[0] if choice_ids else None))
+            section_course = {section.id: section.course_id for section in sections}
+            for course in courses:
+                course_quizzes[course.id] = []
+            for quiz in quizzes:
+                course_quizzes[section_course[quiz.section_id]].append((quiz.id, quiz_questions.get(quiz.id, [])))
+        return course_quizzes
+
+    def create_enrollments(self, student_ids, course_quizzes):
+        options = self.options
+        course_ids = list(course_quizzes)
+        if not course_ids:
+            return
+        now = timezone.now()
+        # Mỗi lô học viên: UserCourse, QuizAttempt rồi AttemptAnswer
+        group_size = max(1, self.batch_size // max(1, options['attempts'] * max(1, options['questions'])))
+        for start in range(0, len(student_ids), group_size):
+            enrollments = []
+            attempts = []
+            for user_id in student_ids[start:start + group_size]:
+                enrolled = self.rng.sample(course_ids, min(options['enrollments'], len(course_ids)))
+                enrollments.extend(
+                    UserCourse(user_id=user_id, course_id=course_id, progress=self.rng.randint(0, 100))
+                    for course_id in enrolled
+                )
+                quizzes = [quiz for course_id in enrolled for quiz in course_quizzes[course_id]]
+                for _ in range(options['attempts'] if quizzes else 0):
+                    quiz_id, questions = self.rng.choice(quizzes)
+                    answers = {
+                        str(question_id): str(self.rng.choice(choice_ids))
+                        for question_id, choice_ids, _ in questions if choice_ids
+                    }
+                    correct = sum(
+                        1 for question_id, _, correct_id in questions
+                        if answers.get(str(question_id)) == str(correct_id)
+                    )
+                    total = len(questions)
+                    attempts.append((QuizAttempt(
+                        user_id=user_id, quiz_id=quiz_id, status=QuizAttempt.SUBMITTED,
+                        score=round(correct / total * 10, 2) if total else 0,
+                        correct_count=correct, total_count=total, answers=answers,
+                        submitted_at=now,
+                    ), questions))
+
+            self.bulk_create(UserCourse, enrollments)
+            created = self.bulk_create(QuizAttempt, [attempt for attempt, _ in attempts])
+            self.bulk_create(AttemptAnswer, [
+                AttemptAnswer(
+                    attempt=attempt,
+                    question_id=question_id,
+                    choice_id=int(attempt.answers[str(question_id)]) if str(question_id) in attempt.answers else None,
+                    is_correct=attempt.answers.get(str(question_id)) == str(correct_id),
+                )
+                for attempt, (_, questions) in zip(created, attempts)
+                for question_id, _, correct_id in questions
+            ])
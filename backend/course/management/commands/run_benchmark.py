@@ -0,0 +1,174 @@
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from course.models import Course, Quiz, UserCourse, QuizAttempt
+
+# (tên, vai trò gọi API, URL theo dữ liệu mẫu)
+ENDPOINTS = [
+    ('course_list_anonymous', None, lambda d: '/api/courses/'),
+    ('course_detail_anonymous', None, lambda d: f"/api/courses/{d['course']}/"),
+    ('course_detail_teacher', 'teacher', lambda d: f"/api/courses/{d['course']}/"),
+    ('my_courses_teacher', 'teacher', lambda d: '/api/courses/my-courses/'),
+    ('sections_teacher', 'teacher', lambda d: f"/api/courses/{d['course']}/sections/"),
+    ('quiz_detail_student', 'student', lambda d: f"/api/quizzes/{d['quiz']}/"),
+    ('student_course_list', 'student', lambda d: '/api/student/courses/'),
+    ('student_course_detail', 'student', lambda d: f"/api/student/courses/{d['course']}/"),
+    ('student_my_courses', 'student', lambda d: '/api/student/my-courses/'),
+    ('student_quiz_history', 'student', lambda d: '/api/student/quiz-history/'),
+    ('teacher_quiz_results', 'teacher', lambda d: f"/api/teacher/quizzes/{d['quiz']}/results/"),
+    ('teacher_statistics', 'teacher', lambda d: '/api/teacher/statistics/'),
+    ('teacher_dashboard', 'teacher', lambda d: '/api/dashboard/teacher/'),
+]
+
+
+def percentile(values, pct):
+    """Percentile theo nearest-rank của danh sách giá trị"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the main read endpoints through the test client (data from generate_bench_data): "
+        "p50/p95 latency, query count, SQL time and peak Python memory, written as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='bench', help='Prefix used by generate_bench_data')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per endpoint (fill caches)')
+        parser.add_argument('--endpoints', default='', help='Comma-separated endpoint names (default: all)')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--compare', help='Previous JSON report to compare p95 and query counts against')
+
+    def handle(self, *args, **options):
+        names = {name.strip() for name in options['endpoints'].split(',') if name.strip()}
+        unknown = names - {name for name, _, _ in ENDPOINTS}
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+        endpoints = [endpoint for endpoint in ENDPOINTS if not names or endpoint[0] in names]
+
+        data = self.pick_data(options['prefix'])
+        clients = {None: APIClient()}
+        for role in ('teacher', 'student'):
+            clients[role] = APIClient()
+            clients[role].force_authenticate(data[role])
+
+        results = {}
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name, role, url in endpoints:
+                results[name] = self.measure(clients[role], url(data), options['iterations'], options['warmup'])
+                self.report_line(name, results[name])
+
+        report = {
+            'revision': git_revision(),
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'iterations': options['iterations'],
+            'dataset': {
+                'courses': Course.objects.count(),
+                'enrollments': UserCourse.objects.count(),
+                'attempts': QuizAttempt.objects.count(),
+            },
+            'endpoints': results,
+        }
+        if options['compare']:
+            self.compare(options['compare'], results)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"✅ Report written to {options['output']}"))
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+
+    def pick_data(self, prefix):
+        """Giáo viên, học viên, khóa học và quiz có nhiều dữ liệu nhất trong bộ dữ liệu mẫu"""
+        student_enrollment = (
+            UserCourse.objects.filter(user__username__startswith=f'{prefix}_s')
+            .select_related('user', 'course__creator').order_by('id').first()
+        )
+        if student_enrollment is None or student_enrollment.course.creator is None:
+            raise CommandError(f"No generated data for prefix '{prefix}'; run generate_bench_data first")
+        course = student_enrollment.course
+        quiz = Quiz.objects.filter(section__course=course).order_by('id').first()
+        if quiz is None:
+            raise CommandError("Generated courses have no quizzes; run generate_bench_data with --quizzes >= 1")
+        return {
+            'teacher': course.creator,
+            'student': student_enrollment.user,
+            'course': course.id,
+            'quiz': quiz.id,
+        }
+
+    def measure(self, client, url, iterations, warmup):
+        for _ in range(warmup):
+            client.get(url)
+
+        latencies = []
+        status_code = None
+        for _ in range(iterations):
+            started = time.perf_counter()
+            response = client.get(url)
+            latencies.append((time.perf_counter() - started) * 1000)
+            status_code = response.status_code
+
+        # Lượt đo riêng cho số truy vấn và bộ nhớ để không làm lệch latency
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            client.get(url)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'url': url,
+            'status': status_code,
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'max_ms': round(max(latencies), 2),
+            'queries': len(queries.captured_queries),
+            'sql_ms': round(sum(float(q['time']) for q in queries.captured_queries) * 1000, 2),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def report_line(self, name, result):
+        self.stderr.write(
+            f"{name:<28} {result['status']} p50={result['p50_ms']:>8.2f}ms p95={result['p95_ms']:>8.2f}ms "
+            f"queries={result['queries']:>3} peak={result['peak_memory_kb']:>9.1f}KB"
+        )
+
+    def compare(self, path, results):
+        with open(path) as f:
+            previous = json.load(f)
+        self.stderr.write(f"Compared with {previous.get('revision') or path}:")
+        for name, result in results.items():
+            before = previous.get('endpoints', {}).get(name)
+            if before is None:
+                continue
+            change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+            self.stderr.write(
+                f"{name:<28} p95 {before['p95_ms']:>8.2f} -> {result['p95_ms']:>8.2f}ms ({change:+.0f}%) "
+                f"queries {before['queries']} -> {result['queries']}"
+            )
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from course.clone import CloneJobLost, claim_clone_job, run_clone_job
+
+
+class Command(BaseCommand):
+    help = "Run pending background course clone jobs (run from cron or with --interval)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running and poll for new jobs every N seconds (0 = drain the queue once)')
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_clone_job()
+            if job is not None:
+                try:
+                    course = run_clone_job(job)
+                except CloneJobLost as e:
+                    self.stderr.write(self.style.WARNING(f"⚠️ {e}"))
+                except Exception as e:
+                    self.stderr.write(self.style.ERROR(f"❌ Clone job {job.id} failed: {e}"))
+                else:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"✅ Clone job {job.id}: course {job.source_id} -> {course.id}"))
+                continue
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
 from course.models import Course, Section, Lesson, Quiz, Question, Choice, UserCourse
+from course.utils import content_change
 from random import choice, randint, sample
 
 class Command(BaseCommand):
@@ -27,46 +28,48 @@ class Command(BaseCommand):
                 )
                 self.stdout.write(self.style.SUCCESS(f"Created course: {course.title}"))
 
-                # Tạo Sections
-                for sec_num in range(1, 4):
-                    section = Section.objects.create(
-                        title=f"Chương {sec_num}",
-                        position=sec_num,
-                        course=course
-                    )
-
-                    # Tạo Lessons
-                    for les_num in range(1, 4):
-                        Lesson.objects.create(
-                            title=f"Bài học {les_num} - Chương {sec_num}",
-                            content="Nội dung bài học chi tiết...",
-                            position=les_num,
-                            section=section,
-                            video_url=f"https://example.com/video{les_num}"
+                # Seed cả cây nội dung, tăng content_version một lần cho mỗi khóa học
+                with content_change(course.id):
+                    # Tạo Sections
+                    for sec_num in range(1, 4):
+                        section = Section.objects.create(
+                            title=f"Chương {sec_num}",
+                            position=sec_num,
+                            course=course
                         )
 
-                    # Tạo Quiz
-                    quiz = Quiz.objects.create(
-                        title=f"Bài kiểm tra Chương {sec_num}",
-                        section=section,
-                        position=1
-                    )
+                        # Tạo Lessons
+                        for les_num in range(1, 4):
+                            Lesson.objects.create(
+                                title=f"Bài học {les_num} - Chương {sec_num}",
+                                content="Nội dung bài học chi tiết...",
+                                position=les_num,
+                                section=section,
+                                video_url=f"https://example.com/video{les_num}"
+                            )
 
-                    # Tạo Questions và Choices
-                    for q_num in range(1, 4):
-                        question = Question.objects.create(
-                            quiz=quiz,
-                            text=f"Câu hỏi {q_num} chương {sec_num}",
-                            position=q_num
+                        # Tạo Quiz
+                        quiz = Quiz.objects.create(
+                            title=f"Bài kiểm tra Chương {sec_num}",
+                            section=section,
+                            position=1
                         )
 
-                        for c_num in range(1, 4):
-                            Choice.objects.create(
-                                question=question,
-                                text=f"Lựa chọn {c_num}",
-                                is_correct=(c_num == 1)  # Câu trả lời đúng là lựa chọn 1
+                        # Tạo Questions và Choices
+                        for q_num in range(1, 4):
+                            question = Question.objects.create(
+                                quiz=quiz,
+                                text=f"Câu hỏi {q_num} chương {sec_num}",
+                                position=q_num
                             )
 
+                            for c_num in range(1, 4):
+                                Choice.objects.create(
+                                    question=question,
+                                    text=f"Lựa chọn {c_num}",
+                                    is_correct=(c_num == 1)  # Câu trả lời đúng là lựa chọn 1
+                                )
+
                 # Enroll ngẫu nhiên 2-3 học sinh vào mỗi course
                 selected_students = sample(list(students), randint(2, 3))
                 for student in selected_students:
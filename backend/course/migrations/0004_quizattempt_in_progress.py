@@ -0,0 +1,59 @@
+# Generated by Django 5.2.1 on 2026-10-19 18:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0003_course_content_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizattempt',
+            name='seed',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='quizattempt',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='quizattempt',
+            name='status',
+            field=models.CharField(choices=[('in_progress', 'Đang làm'), ('submitted', 'Đã nộp')], default='submitted', max_length=12),
+        ),
+        migrations.AlterField(
+            model_name='quizattempt',
+            name='answers',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AlterField(
+            model_name='quizattempt',
+            name='correct_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='quizattempt',
+            name='score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='quizattempt',
+            name='submitted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='quizattempt',
+            name='total_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='quizattempt',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'in_progress')), fields=('user', 'quiz'), name='unique_in_progress_attempt'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-19 20:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0007_course_clone_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='courseclonejob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.db.models import prefetch_related_objects
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+class ConditionalRetrieveMixin:
+    """
+    GET có điều kiện cho các API đọc nội dung khóa học.
+
+    ETag (weak) được tạo từ content_version của khóa học và các thành phần riêng của
+    response (get_etag_parts). Nếu client gửi If-None-Match khớp thì trả 304 ngay, không
+    prefetch và không serialize cây nội dung.
+
+    Chỉ kiểm tra If-None-Match: If-Modified-Since theo content_updated_at (làm tròn giây)
+    bỏ sót hai lần sửa trong cùng một giây và mọi thay đổi ngoài nội dung (đăng ký học,
+    vai trò). Last-Modified chỉ gửi kèm để tham khảo khi response không có thành phần riêng.
+    """
+    def get_render_prefetch(self):
+        """Các quan hệ chỉ cần khi phải serialize (bỏ qua khi trả 304)"""
+        return ()
+
+    def get_content_course(self, instance):
+        """Khóa học chứa đối tượng; view con override"""
+        return instance
+
+    def get_etag_parts(self, instance, course):
+        """Thành phần bổ sung cho ETag khi response có dữ liệu ngoài nội dung"""
+        return ()
+
+    def get_etag(self, instance, course, parts=()):
+        parts = [type(instance).__name__.lower(), instance.pk, course.content_version, *parts]
+        return 'W/"%s"' % '-'.join(str(part) for part in parts)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        course = self.get_content_course(instance)
+        parts = tuple(self.get_etag_parts(instance, course))
+        etag = self.get_etag(instance, course, parts)
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = self.render_content(instance)
+
+        response['ETag'] = etag
+        if not parts:
+            response['Last-Modified'] = http_date(course.content_updated_at.timestamp())
+        self.patch_cache_headers(response, course)
+        return response
+
+    def render_content(self, instance):
+        """Serialize đối tượng khi không trả được 304"""
+        prefetch_related_objects([instance], *self.get_render_prefetch())
+        return Response(self.get_serializer(instance).data)
+
+    def patch_cache_headers(self, response, course):
+        # Khóa học công khai xem ẩn danh thì proxy/CDN được cache trong thời gian
+        # ngắn; còn lại luôn phải kiểm tra lại với server (rẻ nhờ 304)
+        if course.published and not self.request.user.is_authenticated:
+            patch_cache_control(response, public=True, max_age=settings.COURSE_CACHE_MAX_AGE)
+        else:
+            patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Authorization',))
@@ -1,5 +1,9 @@
+from datetime import timedelta
+from django.conf import settings
 from django.db import models
+from django.db.models import F
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class Course(models.Model):
     title = models.CharField(max_length=200, unique=True)
@@ -17,10 +21,35 @@ class Course(models.Model):
     category = models.CharField(max_length=100, blank=True, null=True)
     price = models.DecimalField(
         max_digits=6, decimal_places=2, null=True, blank=True, default=11.99)
+    # Tăng mỗi khi khóa học hoặc nội dung bên trong (section, lesson, quiz,
+    # question, choice) thay đổi; dùng làm ETag cho các API đọc nội dung
+    content_version = models.PositiveIntegerField(default=1)
+    content_updated_at = models.DateTimeField(default=timezone.now)
         
     def __str__(self):
         return str(self.id)
 
+    def save(self, *args, **kwargs):
+        # Cập nhật khóa học cũng là thay đổi nội dung; tăng version ngay trong
+        # câu UPDATE để không ghi đè giá trị đã được tăng bởi request khác
+        bumped = self.pk is not None and not self._state.adding
+        if bumped:
+            self.content_version = F('content_version') + 1
+            self.content_updated_at = timezone.now()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'content_version', 'content_updated_at'}
+        super().save(*args, **kwargs)
+        if bumped:
+            self.refresh_from_db(fields=['content_version'])
+
+    @classmethod
+    def bump_content_version(cls, *filters, **lookup):
+        """Tăng content_version của các khóa học khớp điều kiện bằng một UPDATE nguyên tử"""
+        return cls.objects.filter(*filters, **lookup).update(
+            content_version=F('content_version') + 1,
+            content_updated_at=timezone.now(),
+        )
+
 
 class Section(models.Model):
     title = models.CharField(max_length=200)
@@ -47,19 +76,63 @@ class Quiz(models.Model):
     section = models.ForeignKey(
         Section, on_delete=models.CASCADE, related_name="quizzes")
     position = models.PositiveIntegerField()
+    # Thời gian làm bài (phút); null = không giới hạn
+    time_limit = models.PositiveIntegerField(null=True, blank=True)
 
     def __str__(self):
         return str(self.id)
 
+class QuestionTag(models.Model):
+    """Nhãn (chủ đề) của câu hỏi trong ngân hàng câu hỏi của một khóa học"""
+    course = models.ForeignKey(
+        Course, on_delete=models.CASCADE, related_name="question_tags")
+    name = models.CharField(max_length=100)
+
+    class Meta:
+        unique_together = ('course', 'name')
+
+    def __str__(self):
+        return self.name
+
+
 class Question(models.Model):
+    DIFFICULTY_CHOICES = (
+        ('easy', 'Dễ'),
+        ('medium', 'Trung bình'),
+        ('hard', 'Khó'),
+    )
+
+    # Câu hỏi thuộc một quiz, hoặc nằm trong ngân hàng câu hỏi của khóa học (quiz = null,
+    # bank_course != null) để các quiz dùng chung qua QuizRule
     quiz = models.ForeignKey(
-        Quiz, on_delete=models.CASCADE, related_name="questions")
+        Quiz, on_delete=models.CASCADE, related_name="questions", null=True, blank=True)
+    bank_course = models.ForeignKey(
+        Course, on_delete=models.CASCADE, related_name="question_bank", null=True, blank=True)
     text = models.TextField()
-    position = models.PositiveIntegerField()
+    position = models.PositiveIntegerField(default=0)
+    difficulty = models.CharField(max_length=10, choices=DIFFICULTY_CHOICES, default='medium')
+    tags = models.ManyToManyField(QuestionTag, blank=True, related_name="questions")
 
     def __str__(self):
         return str(self.id)
 
+
+class QuizRule(models.Model):
+    """
+    Quiz lấy mẫu từ ngân hàng câu hỏi: mỗi rule rút `count` câu theo tag/độ khó
+    (null = không lọc). Quiz có rule thì câu hỏi được rút riêng cho từng lần làm bài.
+    """
+    quiz = models.ForeignKey(
+        Quiz, on_delete=models.CASCADE, related_name="rules")
+    tag = models.ForeignKey(
+        QuestionTag, on_delete=models.CASCADE, related_name="rules", null=True, blank=True)
+    difficulty = models.CharField(
+        max_length=10, choices=Question.DIFFICULTY_CHOICES, null=True, blank=True)
+    count = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.quiz_id}: {self.count} x {self.tag or '*'}"
+
 class Choice(models.Model):
     question = models.ForeignKey(
         Question, on_delete=models.CASCADE, related_name="choices")
@@ -84,16 +157,105 @@ class UserCourse(models.Model):
 
 
 class QuizAttempt(models.Model):
+    IN_PROGRESS = 'in_progress'
+    SUBMITTED = 'submitted'
+    STATUS_CHOICES = (
+        (IN_PROGRESS, 'Đang làm'),
+        (SUBMITTED, 'Đã nộp'),
+    )
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="quiz_attempts")
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name="attempts")
-    score = models.FloatField()
-    correct_count = models.PositiveIntegerField()
-    total_count = models.PositiveIntegerField()
-    answers = models.JSONField()  # {question_id: selected_choice_id}
-    submitted_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default=SUBMITTED)
+    score = models.FloatField(default=0)
+    correct_count = models.PositiveIntegerField(default=0)
+    total_count = models.PositiveIntegerField(default=0)
+    answers = models.JSONField(default=dict)  # {question_id: selected_choice_id}
+    # Seed xáo trộn thứ tự câu hỏi/lựa chọn của lần làm bài (chỉ có khi bắt đầu qua API start)
+    seed = models.PositiveIntegerField(null=True, blank=True)
+    # Id các câu hỏi ngân hàng đã rút cho lần làm bài (chỉ với quiz có QuizRule)
+    question_ids = models.JSONField(default=list, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Hạn nộp tính phía server = started_at + quiz.time_limit; quá hạn sẽ bị chốt tự động
+    deadline = models.DateTimeField(null=True, blank=True)
+    submitted_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ["-submitted_at"]
+        constraints = [
+            # Mỗi học viên chỉ có một lần làm bài đang mở cho mỗi quiz
+            models.UniqueConstraint(
+                fields=['user', 'quiz'],
+                condition=models.Q(status='in_progress'),
+                name='unique_in_progress_attempt',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'deadline']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.quiz.title} - {self.score}/10"
+
+    def is_expired(self, now=None):
+        """Đã quá hạn nộp (cộng thêm thời gian ân hạn QUIZ_DEADLINE_GRACE_SECONDS)"""
+        if self.deadline is None:
+            return False
+        grace = timedelta(seconds=settings.QUIZ_DEADLINE_GRACE_SECONDS)
+        return (now or timezone.now()) > self.deadline + grace
+
+
+class AttemptAnswer(models.Model):
+    """Một dòng cho mỗi câu hỏi trong một lần làm bài (bản chuẩn hóa của QuizAttempt.answers)"""
+    attempt = models.ForeignKey(
+        QuizAttempt, on_delete=models.CASCADE, related_name="answer_rows")
+    question = models.ForeignKey(
+        Question, on_delete=models.CASCADE, related_name="attempt_answers")
+    choice = models.ForeignKey(
+        Choice, on_delete=models.SET_NULL, null=True, blank=True, related_name="attempt_answers")
+    is_correct = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('attempt', 'question')
+        indexes = [
+            models.Index(fields=['question', 'is_correct']),
+        ]
+
+    def __str__(self):
+        return f"{self.attempt_id} - {self.question_id} - {self.choice_id}"
+
+
+class CourseCloneJob(models.Model):
+    """Sao chép khóa học chạy nền (khóa học lớn): lệnh run_clone_jobs xử lý và cập nhật tiến độ"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Đang chờ'),
+        (RUNNING, 'Đang sao chép'),
+        (DONE, 'Hoàn tất'),
+        (FAILED, 'Thất bại'),
+    )
+
+    source = models.ForeignKey(
+        Course, on_delete=models.SET_NULL, null=True, related_name="clone_jobs")
+    target = models.ForeignKey(
+        Course, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name="course_clone_jobs")
+    title = models.CharField(max_length=200, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    progress = models.PositiveSmallIntegerField(default=0)  # phần trăm
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # worker ghi sau mỗi lô
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} - {self.quiz.title} - {self.score}/10"
\ No newline at end of file
+        return f"{self.source_id} -> {self.target_id} ({self.status})"
@@ -1,6 +1,12 @@
 from rest_framework import serializers
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
 from django.contrib.auth.models import User
-from .models import Course, Section, Lesson, Quiz, Question, Choice, UserCourse, QuizAttempt
+from .models import (
+    Course, Section, Lesson, Quiz, Question, Choice, UserCourse, QuizAttempt, QuestionTag, QuizRule,
+    CourseCloneJob
+)
+from .utils import content_change
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -21,32 +27,42 @@ class QuestionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Question
         fields = ['id', 'text', 'position', 'choices']
-    
-    def to_representation(self, instance):
-        data = super().to_representation(instance)
-        # Sắp xếp choices theo thứ tự tạo (hoặc có thể thêm position field cho Choice)
-        data['choices'] = sorted(data['choices'], key=lambda x: x['id'])
-        return data
 
 
+class QuizRuleSerializer(serializers.ModelSerializer):
+    """Rule lấy mẫu câu hỏi từ ngân hàng; tag ghi/đọc theo tên, null = mọi tag"""
+    tag = serializers.CharField(allow_null=True, required=False, default=None)
+
+    class Meta:
+        model = QuizRule
+        fields = ['id', 'tag', 'difficulty', 'count']
+        extra_kwargs = {'count': {'min_value': 1}}
+
+    def validate_tag(self, value):
+        if value is None:
+            return None
+        tag = QuestionTag.objects.filter(course=self.context['course'], name=value).first()
+        if tag is None:
+            raise serializers.ValidationError(f"Tag '{value}' không có trong ngân hàng câu hỏi của khóa học")
+        return tag
+
+
+# Thứ tự lessons/quizzes/questions/choices do queryset quyết định: view cần prefetch
+# bằng course_syllabus_prefetches()/section_content_prefetches()/quiz_content_prefetches()
 class QuizSerializer(serializers.ModelSerializer):
     questions = QuestionSerializer(many=True, read_only=True)
     section_id = serializers.IntegerField(source='section.id', read_only=True)
     course_id = serializers.SerializerMethodField()
 
+    rules = QuizRuleSerializer(many=True, read_only=True)
+
     class Meta:
         model = Quiz
-        fields = ['id', 'title', 'position', 'questions', 'section_id', 'course_id']
+        fields = ['id', 'title', 'position', 'time_limit', 'questions', 'rules', 'section_id', 'course_id']
 
     def get_course_id(self, obj):
         # Trả về id của course thông qua section
-        return obj.section.course.id if obj.section and obj.section.course else None
-
-    def to_representation(self, instance):
-        data = super().to_representation(instance)
-        # Sắp xếp questions theo position
-        data['questions'] = sorted(data['questions'], key=lambda x: x['position'])
-        return data
+        return obj.section.course_id if obj.section else None
 
 
 class LessonSerializer(serializers.ModelSerializer):
@@ -75,19 +91,63 @@ class CourseSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'subtitle', 'description', 'created_at', 
             'last_updated_at', 'published_at', 'published', 'thumbnail',
-            'creator', 'category', 'price', 'sections', 'student_count', 'is_enrolled'
+            'creator', 'category', 'price', 'sections', 'student_count', 'is_enrolled',
+            'content_version'
         ]
     
+    # View có thể tính sẵn hai giá trị này (annotate_enrollment hoặc từ ETag)
     def get_student_count(self, obj):
+        if hasattr(obj, 'student_count'):
+            return obj.student_count
         return obj.students.count()
     
     def get_is_enrolled(self, obj):
+        if hasattr(obj, 'is_enrolled'):
+            return bool(obj.is_enrolled)
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return UserCourse.objects.filter(user=request.user, course=obj).exists()
         return False
 
 
+# Bản dành cho học viên/khách: không có is_correct. Cây syllabus chỉ gồm tiêu đề
+# lesson/quiz; câu hỏi và lựa chọn chỉ trả về khi mở một quiz (PublicQuizSerializer)
+class PublicChoiceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Choice
+        fields = ['id', 'text']
+
+
+class PublicQuestionSerializer(QuestionSerializer):
+    choices = PublicChoiceSerializer(many=True, read_only=True)
+
+
+class PublicQuizSerializer(QuizSerializer):
+    questions = PublicQuestionSerializer(many=True, read_only=True)
+
+
+class SyllabusLessonSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Lesson
+        fields = ['id', 'title', 'position', 'video_url']
+
+
+class SyllabusQuizSerializer(QuizSerializer):
+    questions = None
+
+    class Meta(QuizSerializer.Meta):
+        fields = ['id', 'title', 'position', 'time_limit', 'section_id', 'course_id']
+
+
+class SyllabusSectionSerializer(SectionSerializer):
+    lessons = SyllabusLessonSerializer(many=True, read_only=True)
+    quizzes = SyllabusQuizSerializer(many=True, read_only=True)
+
+
+class CourseSyllabusSerializer(CourseSerializer):
+    sections = SyllabusSectionSerializer(many=True, read_only=True)
+
+
 class CourseCreateUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Course
@@ -106,6 +166,47 @@ class UserCourseSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'course', 'enrolled_at', 'progress']
 
 
+class CourseCloneJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CourseCloneJob
+        fields = [
+            'id', 'source', 'target', 'title', 'status', 'progress', 'error',
+            'created_at', 'started_at', 'finished_at'
+        ]
+
+
+class BulkEnrollSerializer(serializers.Serializer):
+    user_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, default=list)
+    usernames = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+
+    def validate(self, attrs):
+        if not attrs['user_ids'] and not attrs['usernames']:
+            raise serializers.ValidationError("Cần cung cấp user_ids hoặc usernames")
+        return attrs
+
+
+class ReorderSerializer(serializers.Serializer):
+    """
+    Sắp xếp lại các mục cùng cha: hoặc `ids` là toàn bộ id theo thứ tự mới,
+    hoặc di chuyển một mục `id` tới sau `after` / trước `before` (null = lên đầu).
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+    id = serializers.IntegerField(min_value=1, required=False)
+    after = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+    before = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('id' in attrs):
+            raise serializers.ValidationError("Cần cung cấp ids (toàn bộ thứ tự) hoặc id (di chuyển một mục)")
+        if 'ids' in attrs and len(set(attrs['ids'])) != len(attrs['ids']):
+            raise serializers.ValidationError("ids bị trùng")
+        if attrs.get('after') is not None and attrs.get('before') is not None:
+            raise serializers.ValidationError("Chỉ dùng một trong after hoặc before")
+        if attrs.get('id') is not None and attrs['id'] in (attrs.get('after'), attrs.get('before')):
+            raise serializers.ValidationError("Không thể di chuyển một mục tới cạnh chính nó")
+        return attrs
+
+
 class SectionCreateUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Section
@@ -123,63 +224,55 @@ class QuizCreateUpdateSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Quiz
-        fields = ['title', 'position', 'questions']
+        fields = ['title', 'position', 'time_limit', 'questions']
     
     def create(self, validated_data):
         questions_data = validated_data.pop('questions', [])
-        quiz = Quiz.objects.create(**validated_data)
-        
-        # Tạo questions và choices
-        for i, question_data in enumerate(questions_data):
-            choices_data = question_data.pop('choices', [])
-            question = Question.objects.create(
-                quiz=quiz,
-                text=question_data.get('text', ''),
-                position=question_data.get('position', i + 1)
-            )
-            
-            # Tạo choices cho question
-            for choice_data in choices_data:
-                choice_text = choice_data.get('text', '').strip()
-                if choice_text:  # Chỉ tạo choice có text
-                    Choice.objects.create(
-                        question=question,
-                        text=choice_text,
-                        is_correct=choice_data.get('is_correct', False)                    )
-        
+        with transaction.atomic(), content_change(validated_data['section'].course_id):
+            quiz = Quiz.objects.create(**validated_data)
+            self._create_questions(quiz, questions_data)
         return quiz
     
     def update(self, instance, validated_data):
         questions_data = validated_data.pop('questions', [])
         
-        # Cập nhật quiz
-        instance.title = validated_data.get('title', instance.title)
-        instance.position = validated_data.get('position', instance.position)
-        instance.save()
-        
-        # Xóa tất cả questions cũ (và choices sẽ tự động xóa theo cascade)
-        instance.questions.all().delete()
+        with transaction.atomic(), content_change(instance.section.course_id):
+            # Cập nhật quiz
+            instance.title = validated_data.get('title', instance.title)
+            instance.position = validated_data.get('position', instance.position)
+            instance.time_limit = validated_data.get('time_limit', instance.time_limit)
+            instance.save()
+            
+            # Xóa tất cả questions cũ (và choices sẽ tự động xóa theo cascade)
+            instance.questions.all().delete()
+            
+            # Tạo lại questions và choices
+            self._create_questions(instance, questions_data)
         
-        # Tạo lại questions và choices
-        for i, question_data in enumerate(questions_data):
-            choices_data = question_data.pop('choices', [])
-            question = Question.objects.create(
-                quiz=instance,
+        return instance
+
+    def _create_questions(self, quiz, questions_data):
+        """Tạo questions và choices bằng hai lần bulk_create thay vì từng dòng"""
+        questions = Question.objects.bulk_create([
+            Question(
+                quiz=quiz,
                 text=question_data.get('text', ''),
                 position=question_data.get('position', i + 1)
             )
-            
-            # Tạo choices cho question
-            for choice_data in choices_data:
-                choice_text = choice_data.get('text', '').strip()
-                if choice_text:  # Chỉ tạo choice có text
-                    Choice.objects.create(
-                        question=question,
-                        text=choice_text,
-                        is_correct=choice_data.get('is_correct', False)
-                    )
+            for i, question_data in enumerate(questions_data)
+        ])
         
-        return instance
+        # Chỉ tạo choice có text
+        Choice.objects.bulk_create([
+            Choice(
+                question=question,
+                text=choice_data.get('text', '').strip(),
+                is_correct=choice_data.get('is_correct', False)
+            )
+            for question, question_data in zip(questions, questions_data)
+            for choice_data in question_data.get('choices', [])
+            if choice_data.get('text', '').strip()
+        ])
 
 
 class QuestionCreateUpdateSerializer(serializers.ModelSerializer):
@@ -194,6 +287,71 @@ class ChoiceCreateUpdateSerializer(serializers.ModelSerializer):
         fields = ['text', 'is_correct']
 
 
+class BankQuestionSerializer(QuestionSerializer):
+    tags = serializers.SlugRelatedField(slug_field='name', many=True, read_only=True)
+
+    class Meta(QuestionSerializer.Meta):
+        fields = ['id', 'text', 'position', 'difficulty', 'tags', 'choices']
+
+
+class BankQuestionCreateUpdateSerializer(serializers.ModelSerializer):
+    """
+    Tạo/sửa câu hỏi trong ngân hàng câu hỏi của khóa học. Tag truyền theo tên (tạo
+    mới nếu chưa có); choices nếu gửi lên sẽ thay toàn bộ lựa chọn cũ.
+    """
+    tags = serializers.ListField(child=serializers.CharField(max_length=100), write_only=True, required=False)
+    choices = serializers.ListField(child=serializers.DictField(), write_only=True, required=False)
+
+    class Meta:
+        model = Question
+        fields = ['text', 'position', 'difficulty', 'tags', 'choices']
+
+    def create(self, validated_data):
+        tags = validated_data.pop('tags', [])
+        choices_data = validated_data.pop('choices', [])
+        with transaction.atomic(), content_change(validated_data['bank_course'].id):
+            question = Question.objects.create(**validated_data)
+            self._set_tags(question, tags)
+            self._create_choices(question, choices_data)
+        return question
+
+    def update(self, instance, validated_data):
+        tags = validated_data.pop('tags', None)
+        choices_data = validated_data.pop('choices', None)
+        with transaction.atomic(), content_change(instance.bank_course_id):
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save()
+            if tags is not None:
+                self._set_tags(instance, tags)
+            if choices_data is not None:
+                instance.choices.all().delete()
+                self._create_choices(instance, choices_data)
+        return instance
+
+    def _set_tags(self, question, names):
+        course_id = question.bank_course_id
+        names = {name.strip() for name in names if name.strip()}
+        existing = {tag.name: tag for tag in QuestionTag.objects.filter(course_id=course_id, name__in=names)}
+        missing = [QuestionTag(course_id=course_id, name=name) for name in names if name not in existing]
+        # ignore_conflicts: hai request đồng thời cùng tạo một tag mới
+        QuestionTag.objects.bulk_create(missing, ignore_conflicts=True)
+        if missing:
+            existing = {tag.name: tag for tag in QuestionTag.objects.filter(course_id=course_id, name__in=names)}
+        question.tags.set(existing.values())
+
+    def _create_choices(self, question, choices_data):
+        Choice.objects.bulk_create([
+            Choice(
+                question=question,
+                text=choice_data.get('text', '').strip(),
+                is_correct=choice_data.get('is_correct', False)
+            )
+            for choice_data in choices_data
+            if choice_data.get('text', '').strip()
+        ])
+
+
 class QuizAttemptSerializer(serializers.ModelSerializer):
     quiz_title = serializers.CharField(source="quiz.title", read_only=True)
     class Meta:
@@ -219,7 +377,25 @@ class TeacherQuizAttemptSerializer(serializers.ModelSerializer):
         """
         if not obj.answers:
             return []
-            
+
+        rows = (
+            obj.answer_rows
+            .annotate(correct_choice_text=Subquery(
+                Choice.objects.filter(question=OuterRef('question_id'), is_correct=True)
+                .order_by('id').values('text')[:1]
+            ))
+            .order_by('question__position', 'question_id')
+            .values('question__text', 'choice__text', 'correct_choice_text', 'is_correct')
+        )
+        if rows:
+            return [{
+                "question": row['question__text'],
+                "your_choice": row['choice__text'] or "Không trả lời",
+                "correct_choice": row['correct_choice_text'] or "Không xác định",
+                "is_correct": row['is_correct'],
+            } for row in rows]
+
+        # Lần làm bài cũ chưa có AttemptAnswer: tính lại từ answers
         detailed = []
         quiz = obj.quiz
         questions = quiz.questions.all()
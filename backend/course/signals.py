@@ -0,0 +1,57 @@
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import Course, Section, Lesson, Quiz, Question, Choice, QuestionTag, QuizRule
+from .utils import content_version_deferred
+
+
+def _course_filter(instance):
+    """Điều kiện lọc Course chứa đối tượng nội dung (không cần tải các bản ghi cha)"""
+    if isinstance(instance, (Section, QuestionTag)):
+        return Q(id=instance.course_id)
+    if isinstance(instance, (Lesson, Quiz)):
+        return Q(sections=instance.section_id)
+    if isinstance(instance, QuizRule):
+        return Q(sections__quizzes=instance.quiz_id)
+    if isinstance(instance, Question):
+        if instance.quiz_id is None:
+            return Q(id=instance.bank_course_id)
+        return Q(sections__quizzes=instance.quiz_id)
+    # Choice: câu hỏi có thể thuộc quiz hoặc thuộc ngân hàng câu hỏi
+    return Q(sections__quizzes__questions=instance.question_id) | Q(question_bank=instance.question_id)
+
+
+@receiver(post_save, sender=Section)
+@receiver(post_save, sender=Lesson)
+@receiver(post_save, sender=Quiz)
+@receiver(post_save, sender=Question)
+@receiver(post_save, sender=Choice)
+@receiver(post_save, sender=QuestionTag)
+@receiver(post_save, sender=QuizRule)
+def bump_course_content_version_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw or content_version_deferred():
+        return
+    Course.bump_content_version(_course_filter(instance))
+
+
+@receiver(post_delete, sender=Section)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_delete, sender=Quiz)
+@receiver(post_delete, sender=Question)
+@receiver(post_delete, sender=Choice)
+@receiver(post_delete, sender=QuestionTag)
+@receiver(post_delete, sender=QuizRule)
+def bump_course_content_version_on_delete(sender, instance, **kwargs):
+    if content_version_deferred():
+        return
+    Course.bump_content_version(_course_filter(instance))
+
+
+@receiver(m2m_changed, sender=Question.tags.through)
+def bump_course_content_version_on_tags_change(sender, instance, action, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear') or content_version_deferred():
+        return
+    if isinstance(instance, Question):
+        Course.bump_content_version(_course_filter(instance))
+    else:
+        Course.bump_content_version(id=instance.course_id)
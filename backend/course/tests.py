@@ -1,3 +1,881 @@
-from django.test import TestCase
+import io
+import json
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+
+from user.tokens import RoleRefreshToken
+from user.utils import create_user_with_profile
+from .models import (
+    Course, Section, Lesson, Quiz, Question, Choice, UserCourse, QuizAttempt, CourseCloneJob, AttemptAnswer
+)
+from .clone import (
+    CloneJobLost, claim_clone_job, copy_course_content, count_clone_rows, create_course_copy, run_clone_job
+)
+from .utils import (
+    SIMULATED_AI_REPLY, bulk_enroll_users, content_change, finalize_expired_attempts, get_attempt_result, get_quiz_blob
+)
+
+
+def run_in_threads(count, func):
+    """Chạy func(i) trên `count` thread cùng lúc (chờ nhau ở barrier), trả về danh sách kết quả"""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def worker(index):
+        try:
+            barrier.wait()
+            results[index] = func(index)
+        except Exception as e:  # lưu lại để test báo lỗi thay vì treo thread
+            results[index] = e
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Concurrency tests need PostgreSQL (SQLite serializes writers)')
+class ConcurrentWriteTests(TransactionTestCase):
+    """Gửi song song nhiều request ghi và kiểm tra không mất cập nhật, không có lỗi 500"""
+    THREADS = 8
+
+    def setUp(self):
+        self.teacher = create_user_with_profile('teacher', 'pw', user_type='teacher')
+        self.student = create_user_with_profile('student', 'pw', user_type='student')
+        self.course = Course.objects.create(
+            title='Concurrency', description='d', creator=self.teacher, published=True)
+        section = Section.objects.create(title='S', position=1, course=self.course)
+        # 19 bài học + 1 quiz = 20 mục, mỗi lần nộp bài tăng 5%
+        Lesson.objects.bulk_create([
+            Lesson(title=f'L{i}', content='c', position=i, section=section) for i in range(19)
+        ])
+        self.quiz = Quiz.objects.create(title='Q', section=section, position=1)
+        question = Question.objects.create(quiz=self.quiz, text='q', position=1)
+        self.correct_choice = Choice.objects.create(question=question, text='a', is_correct=True)
+        Choice.objects.create(question=question, text='b', is_correct=False)
+        self.question = question
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=user.pk))
+        return client
+
+    def test_concurrent_enroll_creates_single_enrollment(self):
+        results = run_in_threads(self.THREADS, lambda i: self.client_for(self.student).post(
+            f'/api/student/courses/{self.course.id}/enroll/').status_code)
+
+        self.assertFalse([r for r in results if isinstance(r, Exception)], results)
+        self.assertEqual(sorted(results), [201] + [400] * (self.THREADS - 1))
+        self.assertEqual(UserCourse.objects.filter(user=self.student, course=self.course).count(), 1)
+
+    def test_concurrent_quiz_start_opens_single_attempt(self):
+        results = run_in_threads(self.THREADS, lambda i: self.client_for(self.student).post(
+            f'/api/student/quizzes/{self.quiz.id}/start/').json()['attempt_id'])
+
+        self.assertFalse([r for r in results if isinstance(r, Exception)], results)
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(QuizAttempt.objects.filter(status=QuizAttempt.IN_PROGRESS).count(), 1)
+
+    def test_concurrent_quiz_submissions_do_not_lose_progress(self):
+        UserCourse.objects.create(user=self.student, course=self.course)
+        answers = {str(self.question.id): str(self.correct_choice.id)}
+
+        results = run_in_threads(self.THREADS, lambda i: self.client_for(self.student).post(
+            f'/api/student/quizzes/{self.quiz.id}/submit/', {'answers': answers}, format='json').status_code)
+
+        self.assertEqual(results, [200] * self.THREADS)
+        self.assertEqual(QuizAttempt.objects.filter(user=self.student, quiz=self.quiz).count(), self.THREADS)
+        progress = UserCourse.objects.get(user=self.student, course=self.course).progress
+        self.assertAlmostEqual(progress, 5.0 * self.THREADS)
+
+    def test_concurrent_progress_is_capped_at_100(self):
+        UserCourse.objects.create(user=self.student, course=self.course, progress=90.0)
+        answers = {str(self.question.id): str(self.correct_choice.id)}
+
+        results = run_in_threads(self.THREADS, lambda i: self.client_for(self.student).post(
+            f'/api/student/quizzes/{self.quiz.id}/submit/', {'answers': answers}, format='json').status_code)
+
+        self.assertEqual(results, [200] * self.THREADS)
+        self.assertEqual(UserCourse.objects.get(user=self.student, course=self.course).progress, 100.0)
+
+
+class ContentVersionTests(TestCase):
+    """content_version tăng khi nội dung con thay đổi và được dùng làm ETag"""
+
+    def setUp(self):
+        # id khóa học có thể bị dùng lại giữa các test nên xóa cache cây nội dung
+        caches[settings.COURSE_TREE_CACHE_ALIAS].clear()
+        self.teacher = create_user_with_profile('teacher', 'pw', user_type='teacher')
+        self.course = Course.objects.create(
+            title='Versioned', description='d', creator=self.teacher, published=True)
+        self.section = Section.objects.create(title='S', position=1, course=self.course)
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def version(self):
+        return Course.objects.values_list('content_version', flat=True).get(pk=self.course.pk)
+
+    def test_nested_edits_bump_version(self):
+        before = self.version()
+        lesson = Lesson.objects.create(title='L', content='c', position=1, section=self.section)
+        quiz = Quiz.objects.create(title='Q', section=self.section, position=1)
+        question = Question.objects.create(quiz=quiz, text='q', position=1)
+        choice = Choice.objects.create(question=question, text='a', is_correct=True)
+        choice.delete()
+        lesson.delete()
+        self.assertEqual(self.version(), before + 6)
+
+    def test_nested_quiz_write_bumps_version_once(self):
+        before = self.version()
+        response = self.client.post(f'/api/sections/{self.section.id}/quizzes/', {
+            'title': 'Q', 'position': 1,
+            'questions': [{'text': 'q', 'choices': [{'text': 'a', 'is_correct': True}, {'text': 'b'}]}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Choice.objects.filter(question__quiz__section=self.section).count(), 2)
+        self.assertEqual(self.version(), before + 1)
+
+        response = self.client.delete(f'/api/sections/{self.section.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.version(), before + 2)
+
+    def test_failed_content_change_keeps_original_error_and_version(self):
+        before = self.version()
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic(), content_change(self.course.id):
+                Section.objects.create(title='S2', position=2, course=self.course)
+                Course.objects.create(title='Versioned', description='d', creator=self.teacher)
+        with self.assertRaises(ValueError):
+            with content_change(self.course.id):
+                raise ValueError
+        self.assertEqual(self.version(), before)
+
+    def test_conditional_get_returns_304_until_content_changes(self):
+        url = f'/api/sections/{self.section.id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Lesson.objects.create(title='L', content='c', position=1, section=self.section)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_if_modified_since_alone_never_returns_stale_304(self):
+        url = f'/api/sections/{self.section.id}/'
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)  # response khác nhau theo vai trò
+        since = http_date(time.time() + 60)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+
+        # Sửa trong cùng giây với lần đọc trước
+        Lesson.objects.create(title='L', content='c', position=1, section=self.section)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['lessons']), 1)
+
+    def test_enrolling_invalidates_conditional_course_detail(self):
+        student = create_user_with_profile('student', 'pw', user_type='student')
+        self.client.force_authenticate(student)
+        url = f'/api/courses/{self.course.id}/'
+        etag = self.client.get(url)['ETag']
+        since = http_date(time.time() + 60)
+
+        UserCourse.objects.create(user=student, course=self.course)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['is_enrolled'])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_student_course_detail_cache_merges_user_fields(self):
+        student = create_user_with_profile('student', 'pw', user_type='student')
+        UserCourse.objects.create(user=student, course=self.course)
+        url = f'/api/student/courses/{self.course.id}/'
+
+        anonymous = APIClient().get(url).json()
+        self.client.force_authenticate(student)
+        enrolled = self.client.get(url).json()
+        self.assertEqual((anonymous['is_enrolled'], enrolled['is_enrolled']), (False, True))
+        self.assertEqual(enrolled['student_count'], 1)
+
+        Lesson.objects.create(title='New', content='c', position=1, section=self.section)
+        sections = self.client.get(url).json()['sections']
+        self.assertEqual([lesson['title'] for lesson in sections[0]['lessons']], ['New'])
+
+    @override_settings(ALLOWED_HOSTS=['a.example', 'b.example'])
+    def test_student_course_detail_cache_is_host_independent(self):
+        Course.objects.filter(id=self.course.id).update(thumbnail='thumbnails/cover.png')
+        url = f'/api/student/courses/{self.course.id}/'
+        first = APIClient().get(url, HTTP_HOST='a.example').json()
+        second = APIClient().get(url, HTTP_HOST='b.example').json()
+        self.assertEqual(first['thumbnail'], 'http://a.example/media/thumbnails/cover.png')
+        self.assertEqual(second['thumbnail'], 'http://b.example/media/thumbnails/cover.png')
+
+
+class SyllabusVisibilityTests(TestCase):
+    """Học viên/khách không nhận được đáp án (is_correct) qua các API syllabus"""
+
+    def setUp(self):
+        self.teacher = create_user_with_profile('teacher', 'pw', user_type='teacher')
+        self.student = create_user_with_profile('student', 'pw', user_type='student')
+        self.course = Course.objects.create(
+            title='Visible', description='d', creator=self.teacher, published=True)
+        section = Section.objects.create(title='S', position=1, course=self.course)
+        self.quiz = Quiz.objects.create(title='Q', section=section, position=1)
+        question = Question.objects.create(quiz=self.quiz, text='q', position=1)
+        Choice.objects.create(question=question, text='a', is_correct=True)
+
+    def get(self, user, url):
+        client = APIClient()
+        if user:
+            client.force_authenticate(user)
+        return client.get(url)
+
+    def test_student_syllabus_has_no_questions_or_answers(self):
+        for user in (None, self.student):
+            for url in ('/api/courses/', f'/api/courses/{self.course.id}/'):
+                content = self.get(user, url).content.decode()
+                self.assertNotIn('is_correct', content)
+                self.assertNotIn('"questions"', content)
+
+        content = self.get(self.teacher, f'/api/courses/{self.course.id}/').content.decode()
+        self.assertIn('is_correct', content)
+
+    def test_opened_quiz_has_questions_without_answers(self):
+        data = self.get(self.student, f'/api/quizzes/{self.quiz.id}/').json()
+        self.assertEqual(data['questions'][0]['choices'], [{'id': data['questions'][0]['choices'][0]['id'], 'text': 'a'}])
+
+
+class TimedAttemptTests(TestCase):
+    """Autosave trong hạn và chốt bài quá hạn bằng câu trả lời đã lưu"""
+
+    def setUp(self):
+        caches[settings.COURSE_TREE_CACHE_ALIAS].clear()  # quiz blob cache theo id
+        teacher = create_user_with_profile('teacher', 'pw', user_type='teacher')
+        self.student = create_user_with_profile('student', 'pw', user_type='student')
+        course = Course.objects.create(title='Timed', description='d', creator=teacher, published=True)
+        section = Section.objects.create(title='S', position=1, course=course)
+        self.quiz = Quiz.objects.create(title='Q', section=section, position=1, time_limit=10)
+        self.question = Question.objects.create(quiz=self.quiz, text='q', position=1)
+        self.correct_choice = Choice.objects.create(question=self.question, text='a', is_correct=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def test_autosaved_answers_are_graded_by_sweeper(self):
+        attempt_id = self.client.post(f'/api/student/quizzes/{self.quiz.id}/start/').json()['attempt_id']
+        response = self.client.patch(f'/api/student/quiz-attempts/{attempt_id}/', {
+            'answers': {str(self.question.id): str(self.correct_choice.id)}
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        QuizAttempt.objects.filter(id=attempt_id).update(deadline=timezone.now() - timedelta(hours=1))
+        response = self.client.patch(f'/api/student/quiz-attempts/{attempt_id}/', {'answers': {}}, format='json')
+        self.assertEqual(response.status_code, 409)
+
+        self.assertEqual(finalize_expired_attempts(), 1)
+        attempt = QuizAttempt.objects.get(id=attempt_id)
+        self.assertEqual((attempt.status, attempt.correct_count, attempt.score), (QuizAttempt.SUBMITTED, 1, 10))
+
+    def test_timed_quiz_cannot_be_submitted_without_start(self):
+        response = self.client.post(f'/api/student/quizzes/{self.quiz.id}/submit/', {
+            'answers': {str(self.question.id): str(self.correct_choice.id)}
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(QuizAttempt.objects.exists())
+
+
+class QuizGradingTests(TestCase):
+    """Chấm bài theo answer key trong cache và đọc lại kết quả từ AttemptAnswer"""
+
+    def setUp(self):
+        caches[settings.COURSE_TREE_CACHE_ALIAS].clear()
+        teacher = create_user_with_profile('teacher', 'pw', user_type='teacher')
+        self.student = create_user_with_profile('student', 'pw', user_type='student')
+        course = Course.objects.create(title='Graded', description='d', creator=teacher, published=True)
+        section = Section.objects.create(title='S', position=1, course=course)
+        self.quiz = Quiz.objects.create(title='Q', section=section, position=1)
+        self.questions = [Question.objects.create(quiz=self.quiz, text=f'q{i}', position=i) for i in range(2)]
+        self.right = [Choice.objects.create(question=q, text='a', is_correct=True) for q in self.questions]
+        self.wrong = [Choice.objects.create(question=q, text='b') for q in self.questions]
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def submit(self, answers):
+        return self.client.post(f'/api/student/quizzes/{self.quiz.id}/submit/', {'answers': answers}, format='json')
+
+    def test_attempt_result_matches_submitted_answers(self):
+        first, second = self.questions
+        response = self.submit({str(first.id): self.right[0].id, str(second.id): str(self.wrong[1].id)})
+        self.assertEqual(response.json()['score'], 5)
+        attempt = QuizAttempt.objects.get()
+        self.assertEqual(
+            list(attempt.answer_rows.order_by('question_id').values_list('choice_id', 'is_correct')),
+            [(self.right[0].id, True), (self.wrong[1].id, False)],
+        )
+
+        correct, total, detail = get_attempt_result(attempt)
+        self.assertEqual((correct, total), (1, 2))
+        # your_choice là giá trị đã gửi, giống kết quả chấm lại từ answers (lần làm bài chưa backfill)
+        self.assertEqual([d['your_choice'] for d in detail], [self.right[0].id, str(self.wrong[1].id)])
+        self.assertEqual(response.json()['answers'], detail)
+        attempt.answer_rows.all().delete()
+        self.assertEqual(get_attempt_result(attempt), (correct, total, detail))
+
+    def test_answer_key_is_cached_until_content_changes(self):
+        quiz = Quiz.objects.select_related('section__course').get(id=self.quiz.id)
+        get_quiz_blob(quiz)
+        with self.assertNumQueries(0):
+            get_quiz_blob(quiz)
+
+        self.submit({str(self.questions[0].id): self.right[0].id})
+        with CaptureQueriesContext(connection) as queries:
+            self.submit({str(self.questions[0].id): self.right[0].id})
+        # Answer key lấy từ cache: không đọc lại câu hỏi/lựa chọn
+        self.assertFalse([q['sql'] for q in queries if '"course_choice"' in q['sql'] or 'FROM "course_question"' in q['sql']])
+
+        # Đổi đáp án đúng: content_version tăng, bài nộp sau chấm theo answer key mới
+        Choice.objects.filter(id=self.right[0].id).update(is_correct=False)
+        self.wrong[0].is_correct = True
+        self.wrong[0].save()
+        response = self.submit({str(self.questions[0].id): self.wrong[0].id})
+        self.assertEqual(response.json()['correct'], 1)
+
+
+class QuestionBankTests(TestCase):
+    """Quiz lấy mẫu từ ngân hàng câu hỏi theo tag: câu rút cố định cho từng lần làm bài"""
+
+    def setUp(self):
+        caches[settings.COURSE_TREE_CACHE_ALIAS].clear()
+        self.teacher = create_user_with_profile('teacher', 'pw', user_type='teacher')
+        self.student = create_user_with_profile('student', 'pw', user_type='student')
+        self.course = Course.objects.create(title='Bank', description='d', creator=self.teacher, published=True)
+        section = Section.objects.create(title='S', position=1, course=self.course)
+        self.quiz = Quiz.objects.create(title='Q', section=section, position=1)
+        self.teacher_client = APIClient()
+        self.teacher_client.force_authenticate(self.teacher)
+        for i in range(5):
+            response = self.teacher_client.post(f'/api/courses/{self.course.id}/question-bank/', {
+                'text': f'q{i}', 'tags': ['alg' if i < 3 else 'geo'],
+                'choices': [{'text': 'a', 'is_correct': True}, {'text': 'b'}],
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+
+    def test_attempt_draws_questions_by_rule(self):
+        response = self.teacher_client.put(f'/api/quizzes/{self.quiz.id}/rules/', [
+            {'tag': 'alg', 'count': 2}, {'tag': 'geo', 'count': 1},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+
+        client = APIClient()
+        client.force_authenticate(self.student)
+        data = client.post(f'/api/student/quizzes/{self.quiz.id}/start/').json()
+        attempt = QuizAttempt.objects.get(id=data['attempt_id'])
+        self.assertEqual(len(attempt.question_ids), 3)
+        self.assertEqual({q['id'] for q in data['questions']}, set(attempt.question_ids))
+        tags = Question.objects.filter(id__in=attempt.question_ids).values_list('tags__name', flat=True)
+        self.assertEqual(sorted(tags), ['alg', 'alg', 'geo'])
+
+        answers = {str(q['id']): str(q['choices'][0]['id']) for q in data['questions']}
+        response = client.post(f'/api/student/quizzes/{self.quiz.id}/submit/', {'answers': answers}, format='json')
+        self.assertEqual(response.json()['total'], 3)
+        stats = self.teacher_client.get(f'/api/courses/{self.course.id}/question-bank/stats/').json()
+        self.assertEqual(sum(row['attempts'] for row in stats['question_stats']), 3)
+
+
+class BulkEnrollTests(TestCase):
+    """Đăng ký hàng loạt: kết quả từng người dùng qua hàm, endpoint và lệnh quản trị"""
+
+    def setUp(self):
+        self.teacher = create_user_with_profile('teacher', 'pw', user_type='teacher')
+        self.course = Course.objects.create(title='Bulk', description='d', creator=self.teacher)
+        self.students = [create_user_with_profile(f'student{i}', 'pw') for i in range(3)]
+        UserCourse.objects.create(user=self.students[2], course=self.course)
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def statuses(self, results):
+        return {(result['user_id'], result['username']): result['status'] for result in results}
+
+    def test_mixed_ids_and_usernames(self):
+        first, second, enrolled = self.students
+        results = bulk_enroll_users(
+            self.course,
+            user_ids=[first.id, enrolled.id, self.teacher.id, 999999],
+            usernames=['student1', 'student0', 'ghost'],
+            batch_size=1,
+        )
+        self.assertEqual(self.statuses(results), {
+            (first.id, 'student0'): 'enrolled',
+            (second.id, 'student1'): 'enrolled',
+            (enrolled.id, 'student2'): 'already_enrolled',
+            (self.teacher.id, 'teacher'): 'not_student',
+            (999999, None): 'not_found',
+            (None, 'ghost'): 'not_found',
+        })
+        self.assertEqual(
+            set(UserCourse.objects.filter(course=self.course).values_list('user_id', flat=True)),
+            {student.id for student in self.students},
+        )
+
+    def test_enrollment_created_concurrently_is_reported(self):
+        first, second, _ = self.students
+        real_filter = UserCourse.objects.filter
+        raced = []
+
+        def filter_after_race(*args, **kwargs):
+            if not raced:
+                # Request khác đăng ký student0 ngay sau lần đọc danh sách đã đăng ký
+                raced.append(True)
+                queryset = real_filter(pk__in=[])
+                UserCourse.objects.create(user=first, course=self.course)
+                return queryset
+            return real_filter(*args, **kwargs)
+
+        with mock.patch.object(UserCourse.objects, 'filter', side_effect=filter_after_race):
+            results = bulk_enroll_users(self.course, usernames=['student0', 'student1'])
+        self.assertEqual(self.statuses(results), {
+            (first.id, 'student0'): 'already_enrolled',
+            (second.id, 'student1'): 'enrolled',
+        })
+        self.assertEqual(UserCourse.objects.filter(course=self.course).count(), 3)
+
+    def test_endpoint(self):
+        url = f'/api/courses/{self.course.id}/enroll/bulk/'
+        response = self.client.post(url, {'usernames': ['student0', 'teacher']}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['enrolled_count'], 1)
+
+        response = self.client.post(url, {'user_ids': [self.students[0].id]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['status'], 'already_enrolled')
+        self.assertEqual(self.client.post(url, {}, format='json').status_code, 400)
+
+        self.client.force_authenticate(self.students[1])
+        self.assertEqual(self.client.post(url, {'usernames': ['student1']}, format='json').status_code, 403)
+
+    def test_management_command(self):
+        out = io.StringIO()
+        call_command('bulk_enroll', self.course.id, usernames=['student0', 'ghost'],
+                     user_ids=[self.students[2].id], stdout=out)
+        self.assertIn('ghost: not_found', out.getvalue())
+        self.assertIn('already_enrolled=1, enrolled=1, not_found=1', out.getvalue())
+        self.assertTrue(UserCourse.objects.filter(course=self.course, user=self.students[0]).exists())
+
+        with self.assertRaises(CommandError):
+            call_command('bulk_enroll', 999999, usernames=['student0'], stdout=out)
+        with self.assertRaises(CommandError):
+            call_command('bulk_enroll', self.course.id, stdout=out)
+
+
+class QueryCountTests(TestCase):
+    """Số truy vấn của các endpoint đọc không tăng theo số khóa học/mục nội dung (JWT thật, vai trò đọc một lần)"""
+
+    def setUp(self):
+        self.teacher = create_user_with_profile('teacher', 'pw', user_type='teacher')
+        self.student = create_user_with_profile('student', 'pw', user_type='student')
+        self.course = self.add_course()
+        self.section = self.course.sections.get()
+        self.quiz = self.section.quizzes.get()
+        self.lesson = self.section.lessons.get()
+        self.client = APIClient()
+
+    def add_course(self):
+        course = Course.objects.create(title=f'Counted {Course.objects.count()}', description='d', creator=self.teacher, published=True)
+        self.add_content(course)
+        UserCourse.objects.create(user=self.student, course=course)
+        return course
+
+    def add_content(self, course):
+        section = Section.objects.create(title='S', position=course.sections.count() + 1, course=course)
+        Lesson.objects.create(title='L', content='c', position=1, section=section)
+        quiz = Quiz.objects.create(title='Q', section=section, position=2)
+        for i in range(2):
+            question = Question.objects.create(quiz=quiz, text=f'q{i}', position=i)
+            Choice.objects.create(question=question, text='a', is_correct=True)
+            Choice.objects.create(question=question, text='b')
+
+    def grow(self):
+        """Thêm khóa học, section, câu hỏi: số truy vấn của mọi endpoint phải giữ nguyên"""
+        self.add_course()
+        self.add_content(self.course)
+        question = Question.objects.create(quiz=self.quiz, text='extra', position=9)
+        Choice.objects.create(question=question, text='a', is_correct=True)
+
+    def assert_queries(self, user, num, url):
+        caches[settings.COURSE_TREE_CACHE_ALIAS].clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RoleRefreshToken.for_user(user).access_token}')
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+
+    def check(self, user, num, url):
+        self.assert_queries(user, num, url)
+        self.grow()
+        self.assert_queries(user, num, url)
+
+    def test_course_list(self):
+        self.check(self.student, 5, '/api/courses/')
+
+    def test_my_courses(self):
+        self.check(self.teacher, 8, '/api/courses/my-courses/')
+
+    def test_course_detail(self):
+        self.check(self.teacher, 9, f'/api/courses/{self.course.id}/')
+
+    def test_section_list(self):
+        self.check(self.teacher, 8, f'/api/courses/{self.course.id}/sections/')
+
+    def test_quiz_detail(self):
+        self.check(self.teacher, 5, f'/api/quizzes/{self.quiz.id}/')
+
+    def test_question_list(self):
+        self.check(self.teacher, 4, f'/api/quizzes/{self.quiz.id}/questions/')
+
+    def test_lesson_detail(self):
+        self.check(self.teacher, 2, f'/api/lessons/{self.lesson.id}/')
+
+    def test_student_course_tree(self):
+        self.check(self.student, 6, f'/api/student/courses/{self.course.id}/')
+
+
+class ReorderTests(TestCase):
+    """Sắp xếp lại lesson: cả danh sách hoặc di chuyển một mục vào khe position"""
+
+    def setUp(self):
+        teacher = create_user_with_profile('teacher', 'pw', user_type='teacher')
+        course = Course.objects.create(title='Reorder', description='d', creator=teacher)
+        self.section = Section.objects.create(title='S', position=1, course=course)
+        self.lessons = [
+            Lesson.objects.create(title=f'L{i}', content='c', position=i, section=self.section)
+            for i in range(4)
+        ]
+        self.url = f'/api/sections/{self.section.id}/lessons/reorder/'
+        self.client = APIClient()
+        self.client.force_authenticate(teacher)
+
+    def ordered_ids(self):
+        return list(self.section.lessons.order_by('position', 'id').values_list('id', flat=True))
+
+    def test_reorder_full_list_and_move_single_item(self):
+        ids = [lesson.id for lesson in reversed(self.lessons)]
+        response = self.client.put(self.url, {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.ordered_ids(), ids)
+
+        # Sau khi đánh số cách khe, di chuyển một mục chỉ ghi đúng một dòng
+        response = self.client.put(self.url, {'id': ids[3], 'after': ids[0]}, format='json')
+        self.assertEqual(response.json()['updated'], 1)
+        self.assertEqual(self.ordered_ids(), [ids[0], ids[3], ids[1], ids[2]])
+
+    def content_version(self):
+        return Course.objects.values_list('content_version', flat=True).get(id=self.section.course_id)
+
+    def test_partial_id_list_is_rejected(self):
+        version = self.content_version()
+        response = self.client.put(self.url, {'ids': [self.lessons[0].id]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.content_version(), version)
+
+    def test_move_in_place_writes_nothing(self):
+        version = self.content_version()
+        response = self.client.put(
+            self.url, {'id': self.lessons[2].id, 'after': self.lessons[1].id}, format='json')
+        self.assertEqual(response.json()['updated'], 0)
+        self.assertEqual(self.content_version(), version)
+
+        response = self.client.put(
+            self.url, {'id': self.lessons[3].id, 'before': self.lessons[1].id}, format='json')
+        self.assertGreater(response.json()['updated'], 0)
+        self.assertEqual(self.content_version(), version + 1)
+
+    def test_question_reorder_resolves_course_through_quiz(self):
+        quiz = Quiz.objects.create(title='Q', section=self.section, position=10)
+        questions = [Question.objects.create(quiz=quiz, text=f'q{i}', position=i) for i in range(2)]
+        ids = [questions[1].id, questions[0].id]
+        response = self.client.put(f'/api/quizzes/{quiz.id}/questions/reorder/', {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['id'] for p in response.json()['positions']], ids)
+        self.assertEqual(self.client.put('/api/quizzes/0/questions/reorder/', {'ids': []}, format='json').status_code, 404)
+
+
+class CourseArchiveTests(TestCase):
+    """Export archive zip rồi import lại thành khóa học mới với đủ cây nội dung"""
+
+    def setUp(self):
+        self.teacher = create_user_with_profile('teacher', 'pw', user_type='teacher')
+        self.course = Course.objects.create(title='Archive', description='d', creator=self.teacher, published=True)
+        section = Section.objects.create(title='S', position=1, course=self.course)
+        Lesson.objects.create(title='L', content='c', position=1, section=section)
+        quiz = Quiz.objects.create(title='Q', section=section, position=2, time_limit=5)
+        question = Question.objects.create(quiz=quiz, text='q', position=1)
+        Choice.objects.create(question=question, text='a', is_correct=True)
+        Choice.objects.create(question=question, text='b')
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def test_export_then_import_copies_tree(self):
+        response = self.client.get(f'/api/courses/{self.course.id}/export/')
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = io.BytesIO(b''.join(response.streaming_content))
+
+        response = self.client.post('/api/courses/import/', {'file': archive}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        copy = Course.objects.get(id=response.json()['id'])
+        self.assertEqual((copy.title, copy.published, copy.creator), ('Archive (2)', False, self.teacher))
+        quiz = Quiz.objects.get(section__course=copy)
+        self.assertEqual(quiz.time_limit, 5)
+        self.assertEqual(
+            list(Choice.objects.filter(question__quiz=quiz).order_by('id').values_list('text', 'is_correct')),
+            [('a', True), ('b', False)]
+        )
+        self.assertEqual(Lesson.objects.filter(section__course=copy).count(), 1)
+
+    def test_invalid_archive_is_rejected(self):
+        response = self.client.post('/api/courses/import/', {'file': io.BytesIO(b'junk')}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+    def test_constraint_violations_are_rejected(self):
+        base = {'format': 'course-archive', 'version': 1, 'course': {'title': 'Bad', 'description': 'd'}}
+        for sections in (
+            [{'title': None}],
+            [{'title': 'S', 'quizzes': [{'title': 'Q', 'rules': [{'count': -1}]}]}],
+        ):
+            response = self.client.post('/api/courses/import/', {**base, 'sections': sections}, format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Course.objects.filter(title='Bad').exists())
+
+    def test_default_positions_restart_per_parent(self):
+        quizzes = [{'title': f'Q{i}', 'questions': [{'text': 'a'}, {'text': 'b'}]} for i in range(2)]
+        response = self.client.post('/api/courses/import/', {
+            'format': 'course-archive', 'version': 1, 'course': {'title': 'Numbered', 'description': 'd'},
+            'sections': [{'title': 'S1', 'quizzes': quizzes}, {'title': 'S2', 'quizzes': quizzes}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        course_id = response.json()['id']
+        self.assertEqual(
+            list(Quiz.objects.filter(section__course_id=course_id).order_by('id').values_list('position', flat=True)),
+            [1, 2, 1, 2],
+        )
+        self.assertEqual(
+            list(Question.objects.filter(quiz__section__course_id=course_id).order_by('id')
+                 .values_list('position', flat=True)),
+            [1, 2] * 4,
+        )
+
+    def archive_with(self, course_json, thumbnail=None):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('course.json', course_json)
+            if thumbnail is not None:
+                zf.writestr('thumbnail/cover.png', thumbnail)
+        archive.seek(0)
+        return archive
+
+    def test_invalid_thumbnail_is_rejected(self):
+        course_json = json.dumps({
+            'format': 'course-archive', 'version': 1,
+            'course': {'title': 'Thumb', 'description': 'd', 'thumbnail': 'thumbnail/cover.png'},
+        })
+        archive = self.archive_with(course_json, thumbnail=b'not an image')
+        response = self.client.post('/api/courses/import/', {'file': archive}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Course.objects.filter(title='Thumb').exists())
+
+    @override_settings(COURSE_ARCHIVE_MAX_JSON_SIZE=1024)
+    def test_oversized_course_json_is_rejected(self):
+        course_json = json.dumps({'format': 'course-archive', 'version': 1, 'padding': ' ' * 10_000})
+        response = self.client.post(
+            '/api/courses/import/', {'file': self.archive_with(course_json)}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('course.json', response.json()['detail'])
+
+
+class CourseCloneTests(TestCase):
+    """Sao chép khóa học: cùng nội dung, không có học viên/lần làm bài; job nền báo tiến độ"""
+
+    def setUp(self):
+        self.teacher = create_user_with_profile('teacher', 'pw', user_type='teacher')
+        student = create_user_with_profile('student', 'pw', user_type='student')
+        self.course = Course.objects.create(title='Clone', description='d', creator=self.teacher)
+        section = Section.objects.create(title='S', position=1, course=self.course)
+        Lesson.objects.create(title='L', content='c', position=1, section=section)
+        quiz = Quiz.objects.create(title='Q', section=section, position=2)
+        question = Question.objects.create(quiz=quiz, text='q', position=1)
+        Choice.objects.create(question=question, text='a', is_correct=True)
+        UserCourse.objects.create(user=student, course=self.course)
+        QuizAttempt.objects.create(user=student, quiz=quiz, submitted_at=timezone.now())
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def test_clone_copies_content_without_enrollments(self):
+        response = self.client.post(f'/api/courses/{self.course.id}/clone/', {}, format='json')
+        self.assertEqual(response.status_code, 201)
+        copy = Course.objects.get(id=response.json()['id'])
+        self.assertEqual(count_clone_rows(copy), count_clone_rows(self.course))
+        self.assertEqual(copy.students.count(), 0)
+        self.assertFalse(QuizAttempt.objects.filter(quiz__section__course=copy).exists())
+        self.assertTrue(Choice.objects.get(question__quiz__section__course=copy).is_correct)
+
+    def test_background_clone_job_reports_progress(self):
+        response = self.client.post(f'/api/courses/{self.course.id}/clone/', {'background': True}, format='json')
+        self.assertEqual(response.status_code, 202)
+        run_clone_job(claim_clone_job())
+
+        job = self.client.get(f"/api/clone-jobs/{response.json()['id']}/").json()
+        self.assertEqual((job['status'], job['progress']), (CourseCloneJob.DONE, 100))
+        self.assertEqual(Lesson.objects.filter(section__course_id=job['target']).count(), 1)
+
+    def test_stale_running_job_is_reclaimed(self):
+        response = self.client.post(f'/api/courses/{self.course.id}/clone/', {'background': True}, format='json')
+        job = claim_clone_job()
+        # Worker bị kill sau khi tạo bản sao dở dang
+        partial = create_course_copy(self.course, self.teacher, 'Partial')
+        CourseCloneJob.objects.filter(id=job.id).update(target=partial)
+        self.assertIsNone(claim_clone_job())
+
+        # Job chạy lâu nhưng vẫn ghi heartbeat thì không bị nhận lại
+        CourseCloneJob.objects.filter(id=job.id).update(started_at=timezone.now() - timedelta(days=1))
+        self.assertIsNone(claim_clone_job())
+
+        CourseCloneJob.objects.filter(id=job.id).update(
+            heartbeat_at=timezone.now() - timedelta(seconds=settings.COURSE_CLONE_JOB_TIMEOUT + 1))
+        reclaimed = claim_clone_job()
+        self.assertEqual(reclaimed.id, response.json()['id'])
+        course = run_clone_job(reclaimed)
+        self.assertFalse(Course.objects.filter(id=partial.id).exists())
+        self.assertEqual(count_clone_rows(course), count_clone_rows(self.course))
+
+    def test_worker_stops_when_job_is_reclaimed(self):
+        self.client.post(f'/api/courses/{self.course.id}/clone/', {'background': True}, format='json')
+        job = claim_clone_job()
+        reclaimed = []
+
+        def copy_then_lose_job(source, course, on_progress=None):
+            on_progress(10)
+            # Worker khác nhận lại job (ví dụ heartbeat trễ) trong lúc worker này vẫn chạy
+            CourseCloneJob.objects.filter(id=job.id).update(heartbeat_at=timezone.now() - timedelta(days=1))
+            reclaimed.append(claim_clone_job())
+            on_progress(20)
+
+        with mock.patch('course.clone.copy_course_content', side_effect=copy_then_lose_job):
+            with self.assertRaises(CloneJobLost):
+                run_clone_job(job)
+        current = CourseCloneJob.objects.get(id=job.id)
+        self.assertEqual(current.status, CourseCloneJob.RUNNING)
+        self.assertEqual(list(Course.objects.values_list('id', flat=True)), [self.course.id])
+
+        course = run_clone_job(reclaimed[0])
+        self.assertEqual(CourseCloneJob.objects.get(id=job.id).status, CourseCloneJob.DONE)
+        self.assertEqual(count_clone_rows(course), count_clone_rows(self.course))
+
+    def test_rows_added_during_copy_are_skipped(self):
+        copy = create_course_copy(self.course, self.teacher, 'Copy')
+        calls = []
+
+        def on_progress(percent):
+            calls.append(percent)
+            if len(calls) == 2:
+                # Sau lô lessons đầu tiên (sections đã xong): cây con mới không có cha trong bản sao
+                section = Section.objects.create(title='S2', position=2, course=self.course)
+                Lesson.objects.create(title='L2', content='c', position=1, section=section)
+                quiz = Quiz.objects.create(title='Q2', section=section, position=2)
+                question = Question.objects.create(quiz=quiz, text='q2', position=1)
+                Choice.objects.create(question=question, text='b')
+
+        copy_course_content(self.course, copy, on_progress=on_progress)
+        self.assertEqual(Section.objects.filter(course=copy).count(), 1)
+        self.assertEqual(Lesson.objects.filter(section__course=copy).count(), 1)
+        self.assertEqual(Choice.objects.filter(question__quiz__section__course=copy).count(), 1)
+
+
+class BenchDataTests(TestCase):
+    """Bộ sinh dữ liệu benchmark tạo đúng số dòng theo tham số"""
+
+    def test_generate_bench_data_counts(self):
+        call_command(
+            'generate_bench_data', prefix='t', teachers=2, courses=3, sections=2, lessons=2, quizzes=1,
+            questions=3, choices=2, students=4, enrollments=2, attempts=2, batch_size=5, stdout=io.StringIO(),
+        )
+        self.assertEqual(Course.objects.count(), 3)
+        self.assertEqual(Lesson.objects.count(), 3 * 2 * 2)
+        self.assertEqual(Choice.objects.count(), 3 * 2 * 3 * 2)
+        self.assertEqual(UserCourse.objects.count(), 4 * 2)
+        self.assertEqual(QuizAttempt.objects.count(), 4 * 2)
+        self.assertEqual(AttemptAnswer.objects.count(), 4 * 2 * 3)
+
+
+def wrapped_exception_handler(exc, context):
+    """EXCEPTION_HANDLER dùng trong test: bọc lỗi trong khóa 'error'"""
+    return Response({'error': str(exc), 'view': context['view'].__class__.__name__}, status=exc.status_code)
+
+
+@override_settings(AI_SIMULATED_LATENCY=0.01)
+class AsyncAIViewTests(TransactionTestCase):
+    """Các endpoint AI chạy bằng view async (api.async_views) vẫn xác thực và trả lỗi như DRF"""
+
+    def setUp(self):
+        self.student = create_user_with_profile('student', 'pw', user_type='student')
+        course = Course.objects.create(title='AI', description='d', published=True)
+        section = Section.objects.create(title='S', position=1, course=course)
+        lesson = Lesson.objects.create(title='L', content='x' * 200, position=1, section=section)
+        UserCourse.objects.create(user=self.student, course=course)
+        self.url = f'/api/student/lessons/{lesson.id}/summarize/'
+
+    def test_summarize_with_jwt(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RoleRefreshToken.for_user(self.student).access_token}')
+        response = client.post(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'summary': SIMULATED_AI_REPLY})
+
+    def test_errors_match_drf(self):
+        response = APIClient().post(self.url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+
+        client = APIClient()
+        client.force_authenticate(self.student)
+        self.assertEqual(client.get(self.url).status_code, 405)
+        response = client.post('/api/student/lessons/0/summarize/')
+        self.assertEqual((response.status_code, response.json()), (404, {'detail': 'No Lesson matches the given query.'}))
+
+    def test_drf_exception_handler_and_negotiation_are_used(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        with override_settings(REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK, 'EXCEPTION_HANDLER': 'course.tests.wrapped_exception_handler',
+        }):
+            response = client.get(self.url)
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response.json()['view'], 'student_lesson_summarize')
+
+        response = client.post(self.url, HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+
+    def test_unexpected_errors_are_not_swallowed(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        with mock.patch('student.views.asummarize_content_with_ai', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                client.post(self.url)
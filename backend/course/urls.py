@@ -10,9 +10,14 @@ urlpatterns = [
     path('courses/<int:pk>/update/', views.CourseUpdateView.as_view(), name='course-update'),
     path('courses/<int:pk>/delete/', views.CourseDeleteView.as_view(), name='course-delete'),
     path('courses/my-courses/', views.MyCourseListView.as_view(), name='my-courses'),
+    path('courses/<int:pk>/export/', views.CourseExportView.as_view(), name='course-export'),
+    path('courses/import/', views.CourseImportView.as_view(), name='course-import'),
+    path('courses/<int:pk>/clone/', views.CourseCloneView.as_view(), name='course-clone'),
+    path('clone-jobs/<int:pk>/', views.CourseCloneJobDetailView.as_view(), name='course-clone-job'),
     
     # Course Enrollment URLs
     path('courses/<int:course_id>/enroll/', views.CourseEnrollView.as_view(), name='course-enroll'),
+    path('courses/<int:course_id>/enroll/bulk/', views.CourseBulkEnrollView.as_view(), name='course-bulk-enroll'),
     path('courses/<int:course_id>/unenroll/', views.CourseUnenrollView.as_view(), name='course-unenroll'),
     path('courses/<int:course_id>/students/', views.CourseStudentsView.as_view(), name='course-students'),
     
@@ -35,6 +40,18 @@ urlpatterns = [
     path('questions/<int:question_id>/choices/', views.ChoiceListCreateView.as_view(), name='choice-list-create'),
     path('choices/<int:pk>/', views.ChoiceDetailView.as_view(), name='choice-detail'),
     
+    # Reorder URLs (PUT/POST {"ids": [...]} hoặc {"id", "after"/"before"})
+    path('courses/<int:parent_id>/sections/reorder/', views.SectionReorderView.as_view(), name='section-reorder'),
+    path('sections/<int:parent_id>/lessons/reorder/', views.LessonReorderView.as_view(), name='lesson-reorder'),
+    path('sections/<int:parent_id>/quizzes/reorder/', views.QuizReorderView.as_view(), name='quiz-reorder'),
+    path('quizzes/<int:parent_id>/questions/reorder/', views.QuestionReorderView.as_view(), name='question-reorder'),
+
+    # Question Bank URLs
+    path('courses/<int:course_id>/question-bank/', views.QuestionBankListCreateView.as_view(), name='question-bank-list-create'),
+    path('courses/<int:course_id>/question-bank/stats/', views.QuestionBankStatsView.as_view(), name='question-bank-stats'),
+    path('question-bank/<int:pk>/', views.QuestionBankDetailView.as_view(), name='question-bank-detail'),
+    path('quizzes/<int:quiz_id>/rules/', views.QuizRuleView.as_view(), name='quiz-rules'),
+
     # Auto Quiz Generation URLs
     path('sections/<int:section_id>/generate-quiz/', views.generate_auto_quiz, name='generate-auto-quiz'),
     
@@ -1,12 +1,25 @@
 import re
 import json
+import asyncio
 import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import SimpleNamespace
+from asgiref.sync import sync_to_async
 from google import genai
 from youtube_transcript_api import YouTubeTranscriptApi
 from django.conf import settings
 
+from api.async_views import database_sync_to_async
+from api.metrics import TRANSCRIPT_LATENCY, record_cache_lookup, track_ai_call
+from api.profiling import record_timing
+
 logger = logging.getLogger(__name__)
 
+# Khoảng cách position khi sắp xếp lại: chèn/di chuyển một mục chỉ cần ghi một dòng
+POSITION_GAP = 1024
+
 def extract_youtube_video_id(url):
     """Extract YouTube video ID from URL"""
     patterns = [
@@ -24,6 +37,19 @@ def extract_youtube_video_id(url):
 
 def get_youtube_transcript(video_url):
     """Get transcript from YouTube video. Prefer Vietnamese, then English, then any."""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        transcript = _fetch_youtube_transcript(video_url)
+        outcome = 'found' if transcript else 'not_found'
+        return transcript
+    finally:
+        elapsed = time.perf_counter() - started
+        TRANSCRIPT_LATENCY.labels(outcome).observe(elapsed)
+        record_timing('transcript', elapsed)
+
+
+def _fetch_youtube_transcript(video_url):
     try:
         video_id = extract_youtube_video_id(video_url)
         if not video_id:
@@ -46,12 +72,42 @@ def get_youtube_transcript(video_url):
     return None
 
 
-def generate_quiz_with_ai(content, num_questions=10):
+# Câu trả lời cố định khi AI_SIMULATED_LATENCY > 0: hợp lệ với mọi helper (kể cả sinh quiz)
+SIMULATED_AI_REPLY = json.dumps([{
+    "question": "Simulated question?",
+    "choices": ["Choice A", "Choice B", "Choice C", "Choice D"],
+    "correct_answer": 0,
+}])
+
+
+async def aget_youtube_transcript(video_url):
+    """
+    Bản async của get_youtube_transcript: thư viện transcript chỉ có API đồng bộ nên chạy
+    trong thread pool của event loop, không chiếm thread dùng chung cho ORM
+    """
+    return await sync_to_async(get_youtube_transcript, thread_sensitive=False)(video_url)
+
+
+async def agenerate_ai_content(helper, prompt):
+    """
+    Gọi Gemini bằng client async (không giữ thread trong lúc chờ); latency và lỗi được ghi
+    vào metrics theo tên helper. AI_SIMULATED_LATENCY > 0 (chỉ dùng khi load test) thay lời
+    gọi thật bằng một khoảng chờ và SIMULATED_AI_REPLY.
+    """
+    with track_ai_call(helper):
+        if settings.AI_SIMULATED_LATENCY > 0:
+            await asyncio.sleep(settings.AI_SIMULATED_LATENCY)
+            return SimpleNamespace(text=SIMULATED_AI_REPLY)
+        async with genai.Client(api_key=getattr(settings, 'GOOGLE_AI_API_KEY', '')).aio as client:
+            return await client.models.generate_content(
+                model="gemini-2.0-flash",
+                contents=prompt,
+            )
+
+
+async def agenerate_quiz_with_ai(content, num_questions=10):
     """Generate quiz questions using Google Gemini AI"""
     try:
-        # Configure Gemini AI
-        client = genai.Client(api_key=getattr(settings, 'GOOGLE_AI_API_KEY', ''))
-        
         prompt = f"""
         Based on the following educational content, generate {num_questions} multiple choice questions.
         Each question should have exactly 4 answer choices with only one correct answer.
@@ -81,10 +137,7 @@ def generate_quiz_with_ai(content, num_questions=10):
         - Focus on key concepts and important information
         """
         
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt,
-            )
+        response = await agenerate_ai_content('generate_quiz_with_ai', prompt)
         
         # Extract JSON from response
         response_text = response.text.strip()
@@ -116,7 +169,7 @@ def generate_quiz_with_ai(content, num_questions=10):
     
     return []
 
-def extract_lesson_content(lesson):
+async def aextract_lesson_content(lesson):
     """Extract text content from lesson"""
     content_parts = []
     
@@ -128,74 +181,50 @@ def extract_lesson_content(lesson):
     
     # Extract YouTube transcript if video_url exists
     if lesson.video_url:
-        transcript = get_youtube_transcript(lesson.video_url)
+        transcript = await aget_youtube_transcript(lesson.video_url)
         if transcript:
             content_parts.append(f"Video Transcript: {transcript}")
     
     return "\n\n".join(content_parts)
 
-def generate_quiz_from_lessons(section, num_questions=10):
+async def _agenerate_quiz_from(lessons, num_questions):
+    """Lấy nội dung (transcript các bài học được tải đồng thời) rồi sinh câu hỏi bằng AI"""
+    lessons = await database_sync_to_async(list)(lessons)
+    if not lessons:
+        return []
+
+    # Combine content from all lessons
+    contents = await asyncio.gather(*(aextract_lesson_content(lesson) for lesson in lessons))
+    all_content = [content for content in contents if content.strip()]
+    if not all_content:
+        return []
+
+    combined_content = "\n\n--- Lesson Separator ---\n\n".join(all_content)
+
+    # Generate questions using AI
+    return await agenerate_quiz_with_ai(combined_content, num_questions)
+
+async def agenerate_quiz_from_lessons(section, num_questions=10):
     """Generate quiz questions from all lessons in a section"""
     try:
-        lessons = section.lessons.all()
-        if not lessons:
-            return []
-        
-        # Combine content from all lessons
-        all_content = []
-        for lesson in lessons:
-            content = extract_lesson_content(lesson)
-            if content.strip():
-                all_content.append(content)
-        
-        if not all_content:
-            return []
-        
-        combined_content = "\n\n--- Lesson Separator ---\n\n".join(all_content)
-        
-        # Generate questions using AI
-        questions = generate_quiz_with_ai(combined_content, num_questions)
-        
-        return questions
-        
+        return await _agenerate_quiz_from(section.lessons.all(), num_questions)
     except Exception as e:
         logger.error(f"Error generating quiz from lessons: {str(e)}")
         return []
 
-def generate_quiz_from_selected_lessons(lesson_ids, num_questions=10):
+async def agenerate_quiz_from_selected_lessons(lesson_ids, num_questions=10):
     """Generate quiz questions from selected lessons"""
     try:
         from .models import Lesson
-        
-        lessons = Lesson.objects.filter(id__in=lesson_ids)
-        if not lessons:
-            return []
-        
-        # Combine content from selected lessons
-        all_content = []
-        for lesson in lessons:
-            content = extract_lesson_content(lesson)
-            if content.strip():
-                all_content.append(content)
-        
-        if not all_content:
-            return []
-        
-        combined_content = "\n\n--- Lesson Separator ---\n\n".join(all_content)
-        
-        # Generate questions using AI
-        questions = generate_quiz_with_ai(combined_content, num_questions)
-        
-        return questions
-        
+
+        return await _agenerate_quiz_from(Lesson.objects.filter(id__in=lesson_ids), num_questions)
     except Exception as e:
         logger.error(f"Error generating quiz from selected lessons: {str(e)}")
         return []
 
-def summarize_content_with_ai(content):
+async def asummarize_content_with_ai(content):
     """Summarize content using Google Gemini AI"""
     try:
-        client = genai.Client(api_key=getattr(settings, 'GOOGLE_AI_API_KEY', ''))
         prompt = f"""
             Bạn là một trợ lý AI. Hãy đọc kỹ phần nội dung sau và tóm tắt thành danh sách các ý chính ngắn gọn, dễ hiểu. Mỗi ý nên thể hiện một điểm quan trọng. 
 
@@ -211,26 +240,629 @@ def summarize_content_with_ai(content):
             {content[:10000]}
             \"\"\"
         """
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt,
-        )
+        response = await agenerate_ai_content('summarize_content_with_ai', prompt)
         response_text = response.text.strip()
         return response_text
     except Exception as e:
         logger.error(f"Error summarizing content with AI: {str(e)}")
         return None
 
-def generate_quiz_feedback_with_ai(prompt):
+async def agenerate_quiz_feedback_with_ai(prompt):
     """Sinh nhận xét AI cho kết quả quiz với prompt tự do (không ép dạng tóm tắt)"""
     try:
-        client = genai.Client(api_key=getattr(settings, 'GOOGLE_AI_API_KEY', ''))
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt,
-        )
+        response = await agenerate_ai_content('generate_quiz_feedback_with_ai', prompt)
         response_text = response.text.strip()
         return response_text
     except Exception as e:
         logger.error(f"Error generating quiz feedback with AI: {str(e)}")
         return None
+
+
+def load_quiz_answer_key(quiz_id):
+    """Tải danh sách câu hỏi và đáp án của một quiz (2 truy vấn, không lặp theo câu hỏi)"""
+    from .models import Question, Choice
+
+    questions = list(
+        Question.objects.filter(quiz_id=quiz_id)
+        .order_by('position', 'id')
+        .values('id', 'text')
+    )
+    choice_question = {}
+    correct_choice = {}
+    for choice_id, question_id, is_correct in (
+        Choice.objects.filter(question__quiz_id=quiz_id)
+        .order_by('id')
+        .values_list('id', 'question_id', 'is_correct')
+    ):
+        choice_question[choice_id] = question_id
+        if is_correct:
+            correct_choice.setdefault(question_id, choice_id)
+    return {
+        'questions': questions,
+        'choice_question': choice_question,
+        'correct_choice': correct_choice,
+    }
+
+
+def grade_quiz_answers(answers, answer_key):
+    """
+    Chấm bài làm {question_id: choice_id} theo answer_key của load_quiz_answer_key.
+    Trả về (correct, total, answer_detail, answer_rows) với answer_rows là các
+    AttemptAnswer chưa lưu (chưa gán attempt) để bulk_create.
+    """
+    from .models import AttemptAnswer
+
+    answers = answers or {}
+    correct = 0
+    answer_detail = []
+    answer_rows = []
+    for q in answer_key['questions']:
+        selected = answers.get(str(q['id']))
+        correct_id = answer_key['correct_choice'].get(q['id'])
+        is_correct = str(correct_id) == str(selected)
+        if is_correct:
+            correct += 1
+        try:
+            choice_id = int(selected)
+        except (TypeError, ValueError):
+            choice_id = None
+        if answer_key['choice_question'].get(choice_id) != q['id']:
+            choice_id = None
+        answer_detail.append({
+            "question": q['text'],
+            "your_choice": selected,
+            "correct_choice": str(correct_id),
+        })
+        answer_rows.append(AttemptAnswer(
+            question_id=q['id'],
+            choice_id=choice_id,
+            is_correct=is_correct,
+        ))
+    return correct, len(answer_key['questions']), answer_detail, answer_rows
+
+
+def get_attempt_result(attempt):
+    """
+    Lấy (correct, total, answer_detail) của một lần làm bài từ bảng AttemptAnswer.
+    Các lần làm bài cũ chưa backfill thì chấm lại từ QuizAttempt.answers.
+    your_choice giữ nguyên giá trị học viên đã gửi (như grade_quiz_answers), kể cả
+    id không thuộc câu hỏi mà AttemptAnswer lưu là NULL.
+    """
+    from django.db.models import OuterRef, Subquery
+    from .models import AttemptAnswer, Choice
+
+    rows = list(
+        AttemptAnswer.objects.filter(attempt=attempt)
+        .annotate(correct_choice_id=Subquery(
+            Choice.objects.filter(question=OuterRef('question_id'), is_correct=True)
+            .order_by('id').values('id')[:1]
+        ))
+        .order_by('question__position', 'question_id')
+        .values('question_id', 'question__text', 'is_correct', 'correct_choice_id')
+    )
+    if not rows:
+        correct, total, answer_detail, _ = grade_quiz_answers(
+            attempt.answers, load_quiz_answer_key(attempt.quiz_id))
+        return correct, total, answer_detail
+
+    answers = attempt.answers or {}
+    answer_detail = [{
+        "question": row['question__text'],
+        "your_choice": answers.get(str(row['question_id'])),
+        "correct_choice": str(row['correct_choice_id']),
+    } for row in rows]
+    correct = sum(1 for row in rows if row['is_correct'])
+    return correct, len(rows), answer_detail
+
+
+def bulk_enroll_users(course, user_ids=None, usernames=None, batch_size=1000):
+    """
+    Đăng ký hàng loạt học viên vào khóa học bằng bulk_create theo từng lô.
+    Trả về danh sách kết quả cho từng người dùng: enrolled, already_enrolled, not_found, not_student.
+    Trạng thái enrolled/already_enrolled được quyết định sau khi ghi: người được request khác
+    đăng ký xen giữa lần đọc và lần ghi được báo already_enrolled.
+    """
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from django.db.models import Q
+    from .models import UserCourse
+
+    user_ids = {int(user_id) for user_id in (user_ids or [])}
+    usernames = {str(username).strip() for username in (usernames or []) if str(username).strip()}
+
+    found = list(
+        User.objects.filter(Q(id__in=user_ids) | Q(username__in=usernames))
+        .values_list('id', 'username', 'profile__user_type')
+    )
+    found_ids = {user_id for user_id, _, _ in found}
+    found_usernames = {username for _, username, _ in found}
+    already_enrolled = set(
+        UserCourse.objects.filter(course=course, user_id__in=found_ids).values_list('user_id', flat=True)
+    )
+    to_enroll = [
+        user_id for user_id, _, user_type in found
+        if user_type == 'student' and user_id not in already_enrolled
+    ]
+
+    with transaction.atomic():
+        for start in range(0, len(to_enroll), batch_size):
+            already_enrolled |= _enroll_batch(course, to_enroll[start:start + batch_size])
+
+    results = []
+    for user_id, username, user_type in found:
+        if user_type != 'student':
+            status = 'not_student'
+        elif user_id in already_enrolled:
+            status = 'already_enrolled'
+        else:
+            status = 'enrolled'
+        results.append({'user_id': user_id, 'username': username, 'status': status})
+    results.extend(
+        {'user_id': user_id, 'username': None, 'status': 'not_found'}
+        for user_id in sorted(user_ids - found_ids)
+    )
+    results.extend(
+        {'user_id': None, 'username': username, 'status': 'not_found'}
+        for username in sorted(usernames - found_usernames)
+    )
+    return results
+
+
+def _enroll_batch(course, user_ids):
+    """
+    Ghi một lô đăng ký trong savepoint. Lô vi phạm unique (request khác vừa đăng ký một
+    số người trong lô) thì ghi lại từng dòng; trả về user_id của các dòng đã tồn tại.
+    """
+    from django.db import IntegrityError, transaction
+    from .models import UserCourse
+
+    try:
+        with transaction.atomic():
+            UserCourse.objects.bulk_create([UserCourse(user_id=user_id, course=course) for user_id in user_ids])
+        return set()
+    except IntegrityError:
+        pass
+
+    conflicted = set()
+    for user_id in user_ids:
+        try:
+            with transaction.atomic():
+                UserCourse.objects.bulk_create([UserCourse(user_id=user_id, course=course)])
+        except IntegrityError:
+            conflicted.add(user_id)
+    return conflicted
+
+
+def count_course_items(course_id):
+    """Đếm số bài học và số quiz của khóa học bằng một truy vấn"""
+    from django.db.models import Count
+    from .models import Course
+
+    counts = Course.objects.filter(id=course_id).aggregate(
+        lessons=Count('sections__lessons', distinct=True),
+        quizzes=Count('sections__quizzes', distinct=True),
+    )
+    return counts['lessons'], counts['quizzes']
+
+
+def increment_course_progress(user_id, course_id, increment):
+    """
+    Tăng tiến độ học bằng một câu UPDATE nguyên tử (F-expression, tối đa 100%),
+    nên các request đồng thời không ghi đè lên nhau. Trả về số dòng được cập nhật.
+    """
+    from django.db.models import F, FloatField, Value
+    from django.db.models.functions import Least
+    from .models import UserCourse
+
+    if increment <= 0:
+        return 0
+    return UserCourse.objects.filter(
+        user_id=user_id, course_id=course_id, progress__lt=100
+    ).update(progress=Least(F('progress') + increment, Value(100.0, output_field=FloatField())))
+
+
+def get_enrollment_etag_parts(course, user):
+    """
+    Số học viên và trạng thái đăng ký của user (một truy vấn), dùng cho ETag của
+    các API chi tiết khóa học vì hai giá trị này không nằm trong content_version
+    """
+    from django.db.models import Count, Q
+    from .models import UserCourse
+
+    if not user.is_authenticated:
+        return (UserCourse.objects.filter(course=course).count(), 0)
+    counts = UserCourse.objects.filter(course=course).aggregate(
+        students=Count('id'),
+        enrolled=Count('id', filter=Q(user_id=user.id)),
+    )
+    return (counts['students'], counts['enrolled'])
+
+
+# True khi đang trong khối content_change(): signal không tự tăng content_version
+_content_version_deferred = ContextVar('content_version_deferred', default=False)
+
+
+def content_version_deferred():
+    return _content_version_deferred.get()
+
+
+@contextmanager
+def content_change(course_id):
+    """
+    Gom mọi thay đổi nội dung của một khóa học trong khối thành đúng một lần
+    tăng content_version khi kết thúc. Dùng cho thao tác hàng loạt: bulk_create,
+    QuerySet.update()/delete() không phát signal từng dòng (hoặc phát N lần khi
+    xóa cascade). Khối ném lỗi thì không tăng: không có gì thay đổi, và trong
+    transaction đã hỏng (PostgreSQL) lệnh UPDATE sẽ che mất lỗi gốc.
+    """
+    from .models import Course
+
+    token = _content_version_deferred.set(True)
+    try:
+        yield
+    finally:
+        _content_version_deferred.reset(token)
+    Course.bump_content_version(id=course_id)
+
+
+def get_or_build_cached(cache, key, build, timeout, lock_timeout=10, poll_interval=0.05):
+    """
+    Đọc giá trị từ cache; khi miss chỉ một request (giữ lock qua cache.add) gọi
+    build() và ghi cache, các request khác chờ bản vừa dựng xong thay vì cùng
+    truy vấn DB (chống cache stampede). Quá lock_timeout thì tự build.
+    """
+    value = cache.get(key)
+    record_cache_lookup(key, value is not None)
+    if value is not None:
+        return value
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, lock_timeout):
+        try:
+            value = build()
+            cache.set(key, value, timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if cache.get(lock_key) is None:
+            break
+    return build()
+
+
+def quiz_content_prefetches(prefix=''):
+    """Prefetch câu hỏi (theo position), lựa chọn (theo id) và rule lấy mẫu của quiz, mỗi cấp một truy vấn"""
+    from django.db.models import Prefetch
+    from .models import Question, Choice, QuizRule
+
+    return [
+        Prefetch(f'{prefix}questions', queryset=Question.objects.order_by('position', 'id')),
+        Prefetch(f'{prefix}questions__choices', queryset=Choice.objects.order_by('id')),
+        Prefetch(f'{prefix}rules', queryset=QuizRule.objects.select_related('tag').order_by('id')),
+    ]
+
+
+def section_content_prefetches(prefix='', questions=True):
+    """Prefetch bài học và quiz (kèm câu hỏi nếu questions=True) của section, đã sắp xếp theo position"""
+    from django.db.models import Prefetch
+    from .models import Lesson, Quiz
+
+    prefetches = [
+        Prefetch(f'{prefix}lessons', queryset=Lesson.objects.order_by('position', 'id')),
+        Prefetch(f'{prefix}quizzes', queryset=Quiz.objects.order_by('position', 'id')),
+    ]
+    if questions:
+        prefetches += quiz_content_prefetches(f'{prefix}quizzes__')
+    return prefetches
+
+
+def course_syllabus_prefetches(questions=True):
+    """
+    Prefetch toàn bộ cây syllabus của khóa học theo đúng thứ tự hiển thị:
+    sections, lessons, quizzes (+ questions, choices) - mỗi cấp một truy vấn,
+    serializer không cần sắp xếp lại.
+    """
+    from django.db.models import Prefetch
+    from .models import Section
+
+    return [
+        Prefetch('sections', queryset=Section.objects.order_by('position', 'id')),
+        *section_content_prefetches('sections__', questions=questions),
+    ]
+
+
+def reorder_positions(siblings, ids):
+    """
+    Gán position cách đều POSITION_GAP theo thứ tự ids cho các mục cùng cha
+    (siblings: list đối tượng đã khóa). Chỉ ghi các dòng đổi position, một bulk_update.
+    """
+    items = {obj.id: obj for obj in siblings}
+    changed = []
+    for i, item_id in enumerate(ids, start=1):
+        obj = items[item_id]
+        if obj.position != i * POSITION_GAP:
+            obj.position = i * POSITION_GAP
+            changed.append(obj)
+    if changed:
+        type(changed[0]).objects.bulk_update(changed, ['position'])
+    return changed
+
+
+def move_position(siblings, item_id, after_id=None, before_id=None):
+    """
+    Di chuyển một mục tới sau after_id (hoặc trước before_id; cả hai None = lên đầu).
+    Còn khe giữa hai mục kề thì chỉ ghi position của mục đó; hết khe thì đánh số lại
+    cả nhóm theo POSITION_GAP. Như reorder_positions, ghi bằng bulk_update (không phát
+    signal) và trả về các mục đã đổi. siblings: list đối tượng đã khóa, sắp theo (position, id).
+    """
+    item = next(obj for obj in siblings if obj.id == item_id)
+    ordered = [obj for obj in siblings if obj.id != item_id]
+    ids = [obj.id for obj in ordered]
+    if after_id is not None:
+        index = ids.index(after_id) + 1
+    elif before_id is not None:
+        index = ids.index(before_id)
+    else:
+        index = 0
+    if siblings.index(item) == index:
+        return []  # Hai mục kề không đổi: mục đã ở đúng chỗ
+
+    low = ordered[index - 1].position if index > 0 else 0
+    high = ordered[index].position if index < len(ordered) else None
+    if high is None:
+        position = low + POSITION_GAP
+    elif high - low >= 2:
+        position = (low + high) // 2
+    else:
+        ids.insert(index, item_id)
+        return reorder_positions(siblings, ids)
+
+    item.position = position
+    type(item).objects.bulk_update([item], ['position'])
+    return [item]
+
+
+def annotate_enrollment(queryset, user):
+    """Thêm student_count và is_enrolled (của user) vào queryset Course, tránh N+1 khi serialize danh sách"""
+    from django.db.models import Count, Exists, OuterRef, Value, BooleanField
+    from .models import UserCourse
+
+    queryset = queryset.annotate(student_count=Count('students', distinct=True))
+    if not user.is_authenticated:
+        return queryset.annotate(is_enrolled=Value(False, output_field=BooleanField()))
+    return queryset.annotate(is_enrolled=Exists(
+        UserCourse.objects.filter(course=OuterRef('pk'), user_id=user.id)
+    ))
+
+
+def build_quiz_blob(quiz_id):
+    """
+    Dựng bản quiz phục vụ làm bài: 'questions' là phần gửi cho học viên (không có
+    is_correct), 'answer_key' cùng dạng với load_quiz_answer_key để chấm bài.
+
+    Quiz có QuizRule thì 'questions' là toàn bộ ngân hàng câu hỏi của khóa học,
+    kèm 'pool' {question_id: (tag_ids, difficulty)} và 'rules' [(tag_id, difficulty, count)]
+    để rút câu hỏi cho từng lần làm bài (draw_quiz_questions).
+    """
+    from .models import Question, Choice, QuizRule
+
+    rules = list(
+        QuizRule.objects.filter(quiz_id=quiz_id).order_by('id')
+        .values_list('tag_id', 'difficulty', 'count', 'quiz__section__course_id')
+    )
+    if rules:
+        questions_qs = Question.objects.filter(bank_course_id=rules[0][3])
+    else:
+        questions_qs = Question.objects.filter(quiz_id=quiz_id)
+
+    questions = list(
+        questions_qs.order_by('position', 'id')
+        .values('id', 'text', 'difficulty')
+    )
+    public_choices = {q['id']: [] for q in questions}
+    choice_question = {}
+    correct_choice = {}
+    for choice_id, question_id, text, is_correct in (
+        Choice.objects.filter(question__in=questions_qs)
+        .order_by('id')
+        .values_list('id', 'question_id', 'text', 'is_correct')
+    ):
+        public_choices[question_id].append({'id': choice_id, 'text': text})
+        choice_question[choice_id] = question_id
+        if is_correct:
+            correct_choice.setdefault(question_id, choice_id)
+    blob = {
+        'questions': [
+            {'id': q['id'], 'text': q['text'], 'choices': public_choices[q['id']]}
+            for q in questions
+        ],
+        'answer_key': {
+            'questions': [{'id': q['id'], 'text': q['text']} for q in questions],
+            'choice_question': choice_question,
+            'correct_choice': correct_choice,
+        },
+    }
+    if rules:
+        question_tags = {q['id']: [] for q in questions}
+        for question_id, tag_id in Question.tags.through.objects.filter(
+            question__in=questions_qs
+        ).values_list('question_id', 'questiontag_id'):
+            question_tags[question_id].append(tag_id)
+        blob['pool'] = {q['id']: (question_tags[q['id']], q['difficulty']) for q in questions}
+        blob['rules'] = [(tag_id, difficulty, count) for tag_id, difficulty, count, _ in rules]
+    return blob
+
+
+def get_quiz_blob(quiz):
+    """
+    build_quiz_blob có cache theo (quiz id, content_version của khóa học), nên lúc
+    thi nhiều học viên cùng bắt đầu/nộp bài chỉ đọc cache. quiz cần select_related('section__course').
+    """
+    from django.core.cache import caches
+
+    return get_or_build_cached(
+        caches[settings.COURSE_TREE_CACHE_ALIAS],
+        f'quiz_blob:{quiz.id}:v{quiz.section.course.content_version}',
+        lambda: build_quiz_blob(quiz.id),
+        timeout=settings.COURSE_TREE_CACHE_TIMEOUT,
+        lock_timeout=settings.COURSE_TREE_CACHE_LOCK_TIMEOUT,
+    )
+
+
+def shuffle_quiz_questions(questions, seed):
+    """Xáo trộn thứ tự câu hỏi và lựa chọn theo seed của lần làm bài (cùng seed → cùng thứ tự)"""
+    import random
+
+    rng = random.Random(seed)
+    shuffled = [dict(q, choices=list(q['choices'])) for q in questions]
+    rng.shuffle(shuffled)
+    for question in shuffled:
+        rng.shuffle(question['choices'])
+    return shuffled
+
+
+def draw_quiz_questions(blob, seed):
+    """
+    Rút câu hỏi ngân hàng theo các rule của quiz (cùng seed → cùng kết quả), không
+    lặp câu giữa các rule. Rule thiếu câu thì lấy hết số câu khớp. Trả về list id.
+    """
+    import random
+
+    rng = random.Random(seed)
+    drawn = []
+    taken = set()
+    for tag_id, difficulty, count in blob.get('rules', ()):
+        candidates = [
+            question_id for question_id, (tag_ids, question_difficulty) in blob['pool'].items()
+            if question_id not in taken
+            and (tag_id is None or tag_id in tag_ids)
+            and (difficulty is None or difficulty == question_difficulty)
+        ]
+        picked = rng.sample(candidates, min(count, len(candidates)))
+        taken.update(picked)
+        drawn.extend(picked)
+    return drawn
+
+
+def get_attempt_blob(blob, attempt):
+    """
+    Phần blob áp dụng cho một lần làm bài: với quiz lấy mẫu từ ngân hàng chỉ giữ
+    các câu đã rút (attempt.question_ids, theo thứ tự rút); quiz thường giữ nguyên.
+    """
+    if not blob.get('rules'):
+        return blob
+    question_ids = set(attempt.question_ids)
+    order = {question_id: i for i, question_id in enumerate(attempt.question_ids)}
+    answer_key = blob['answer_key']
+    return {
+        'questions': sorted(
+            (q for q in blob['questions'] if q['id'] in question_ids), key=lambda q: order[q['id']]),
+        'answer_key': {
+            'questions': sorted(
+                (q for q in answer_key['questions'] if q['id'] in question_ids), key=lambda q: order[q['id']]),
+            'choice_question': {
+                choice_id: question_id for choice_id, question_id in answer_key['choice_question'].items()
+                if question_id in question_ids
+            },
+            'correct_choice': {
+                question_id: choice_id for question_id, choice_id in answer_key['correct_choice'].items()
+                if question_id in question_ids
+            },
+        },
+    }
+
+
+def find_invalid_answers(answers, answer_key):
+    """Các question_id trong answers không thuộc quiz hoặc chọn lựa chọn không thuộc câu hỏi đó"""
+    question_ids = {q['id'] for q in answer_key['questions']}
+    invalid = []
+    for question_id, choice_id in answers.items():
+        try:
+            question_id = int(question_id)
+            choice_id = int(choice_id) if choice_id not in (None, '') else None
+        except (TypeError, ValueError):
+            invalid.append(question_id)
+            continue
+        if question_id not in question_ids or (
+            choice_id is not None and answer_key['choice_question'].get(choice_id) != question_id
+        ):
+            invalid.append(question_id)
+    return invalid
+
+
+def finalize_quiz_attempts(attempt_ids, now=None):
+    """
+    Chấm và chốt hàng loạt các lần làm bài đang mở bằng câu trả lời đã autosave:
+    một bulk_update cho QuizAttempt, một bulk_create cho AttemptAnswer và một
+    UPDATE tiến độ cho mỗi (học viên, khóa học). Dòng đang bị request khác khóa
+    (ví dụ học viên đang nộp bài) được bỏ qua. Trả về số lần làm bài đã chốt.
+    """
+    from collections import Counter
+    from django.db import transaction
+    from django.utils import timezone
+    from .models import QuizAttempt, AttemptAnswer
+
+    now = now or timezone.now()
+    with transaction.atomic():
+        attempts = list(
+            QuizAttempt.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(id__in=attempt_ids, status=QuizAttempt.IN_PROGRESS)
+            .select_related('quiz__section__course')
+        )
+        blobs = {}
+        answer_rows = []
+        finished = Counter()
+        for attempt in attempts:
+            if attempt.quiz_id not in blobs:
+                blobs[attempt.quiz_id] = get_quiz_blob(attempt.quiz)
+            answer_key = get_attempt_blob(blobs[attempt.quiz_id], attempt)['answer_key']
+            correct, total, _, rows = grade_quiz_answers(attempt.answers, answer_key)
+            attempt.status = QuizAttempt.SUBMITTED
+            attempt.score = round((correct / total) * 10, 2) if total > 0 else 0
+            attempt.correct_count = correct
+            attempt.total_count = total
+            attempt.submitted_at = now
+            for row in rows:
+                row.attempt = attempt
+            answer_rows.extend(rows)
+            finished[(attempt.user_id, attempt.quiz.section.course_id)] += 1
+
+        QuizAttempt.objects.bulk_update(
+            attempts, ['status', 'score', 'correct_count', 'total_count', 'submitted_at'], batch_size=500)
+        AttemptAnswer.objects.bulk_create(answer_rows, batch_size=1000)
+
+        course_items = {}
+        for (user_id, course_id), count in finished.items():
+            if course_id not in course_items:
+                course_items[course_id] = sum(count_course_items(course_id))
+            if course_items[course_id] > 0:
+                increment_course_progress(user_id, course_id, count * 100 / course_items[course_id])
+    return len(attempts)
+
+
+def finalize_expired_attempts(batch_size=500, now=None):
+    """Chốt mọi lần làm bài đã quá deadline (cộng thời gian ân hạn) theo từng lô"""
+    from datetime import timedelta
+    from django.utils import timezone
+    from .models import QuizAttempt
+
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=settings.QUIZ_DEADLINE_GRACE_SECONDS)
+    expired = QuizAttempt.objects.filter(
+        status=QuizAttempt.IN_PROGRESS, deadline__lt=cutoff
+    ).order_by('id').values_list('id', flat=True)
+
+    total = 0
+    last_id = 0
+    while True:
+        ids = list(expired.filter(id__gt=last_id)[:batch_size])
+        if not ids:
+            return total
+        total += finalize_quiz_attempts(ids, now=now)
+        last_id = ids[-1]
@@ -1,50 +1,84 @@
 import logging
 from django.shortcuts import render, get_object_or_404
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from rest_framework import generics, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from django.db.models import Q, Count
+from django.db import transaction
+from django.db.models import Q, Count, Prefetch
 from django.contrib.auth.models import User
 import json
+from operator import attrgetter
 
 # Import custom permissions
-from user.permissions import IsTeacherOrAdmin, IsTeacher, IsStudent, IsOwnerOrAdminOrTeacher
+from api.async_views import async_api_view, database_sync_to_async
+from api.db_routers import REPLICA, read_preference
+from user.permissions import (
+    IsTeacherOrAdmin, IsTeacher, IsStudent, IsOwnerOrAdminOrTeacher,
+    get_user_role, can_manage_course
+)
 
 # Import models and serializers
-from .models import Course, Section, Lesson, Quiz, Question, Choice, UserCourse, QuizAttempt
+from .models import (
+    Course, Section, Lesson, Quiz, Question, Choice, UserCourse, QuizAttempt, AttemptAnswer,
+    QuizRule, CourseCloneJob
+)
+from .mixins import ConditionalRetrieveMixin
+from .clone import clone_course, count_clone_rows
+from .archive import (
+    ArchiveError, stream_course_archive, read_archive_upload, import_course_archive, archive_filename
+)
 from .serializers import (
     CourseSerializer, CourseCreateUpdateSerializer, SectionSerializer, 
     LessonSerializer, QuizSerializer, QuestionSerializer, ChoiceSerializer,
     UserCourseSerializer, SectionCreateUpdateSerializer, LessonCreateUpdateSerializer,
     QuizCreateUpdateSerializer, QuestionCreateUpdateSerializer, ChoiceCreateUpdateSerializer,
-    QuizAttemptSerializer, UserSerializer, TeacherQuizAttemptSerializer
+    QuizAttemptSerializer, UserSerializer, TeacherQuizAttemptSerializer, BulkEnrollSerializer,
+    CourseSyllabusSerializer, SyllabusSectionSerializer, SyllabusQuizSerializer, PublicQuizSerializer,
+    BankQuestionSerializer, BankQuestionCreateUpdateSerializer, QuizRuleSerializer, ReorderSerializer,
+    CourseCloneJobSerializer
 )
 
 # Import utils for AI quiz generation
-from .utils import generate_quiz_from_lessons, generate_quiz_from_selected_lessons, generate_quiz_feedback_with_ai
+from .utils import (
+    agenerate_quiz_from_lessons, agenerate_quiz_from_selected_lessons, agenerate_quiz_feedback_with_ai,
+    get_attempt_result, bulk_enroll_users, get_enrollment_etag_parts, content_change,
+    course_syllabus_prefetches, section_content_prefetches, quiz_content_prefetches,
+    annotate_enrollment, reorder_positions, move_position
+)
 
 logger = logging.getLogger(__name__)
 
 
 # Course Views
+@read_preference(REPLICA)
 class CourseListView(generics.ListAPIView):
     """
     Danh sách tất cả khóa học đã được xuất bản (cho học viên)
     Hoặc tất cả khóa học (cho giáo viên và admin)
     """
-    serializer_class = CourseSerializer
     permission_classes = [AllowAny]  # Cho phép xem danh sách khóa học công khai
     
+    def get_serializer_class(self):
+        # Học viên/khách chỉ nhận syllabus rút gọn (không có câu hỏi, đáp án)
+        if get_user_role(self.request.user).is_teacher_or_admin:
+            return CourseSerializer
+        return CourseSyllabusSerializer
+    
     def get_queryset(self):
-        queryset = Course.objects.all()
+        is_author = get_user_role(self.request.user).is_teacher_or_admin
+        queryset = annotate_enrollment(
+            Course.objects.select_related('creator').prefetch_related(
+                *course_syllabus_prefetches(questions=is_author)
+            ),
+            self.request.user
+        )
         
         # Nếu user không phải teacher/admin, chỉ hiển thị khóa học đã xuất bản
-        if not (self.request.user.is_authenticated and 
-                (self.request.user.is_staff or 
-                 (hasattr(self.request.user, 'profile') and 
-                  self.request.user.profile.user_type in ['teacher', 'admin']))):
+        if not is_author:
             queryset = queryset.filter(published=True)
         
         # Tìm kiếm theo từ khóa
@@ -64,30 +98,40 @@ class CourseListView(generics.ListAPIView):
         return queryset.order_by('-created_at')
 
 
-class CourseDetailView(generics.RetrieveAPIView):
+class CourseDetailView(ConditionalRetrieveMixin, generics.RetrieveAPIView):
     """
     Chi tiết khóa học
+    Creator/giáo viên/admin nhận cây đầy đủ (kèm đáp án), còn lại nhận syllabus rút gọn
     """
-    serializer_class = CourseSerializer
     permission_classes = [AllowAny]
+    is_author = False  # gán lại trong get_object
     
     def get_object(self):
         course_id = self.kwargs['pk']
-        course = get_object_or_404(Course, id=course_id)
+        course = get_object_or_404(Course.objects.select_related('creator'), id=course_id)
         
         # Nếu khóa học chưa xuất bản, chỉ creator, teacher và admin mới xem được
         if not course.published:
             if not self.request.user.is_authenticated:
                 self.permission_denied(self.request)
             
-            if not (course.creator == self.request.user or 
-                    self.request.user.is_staff or
-                    (hasattr(self.request.user, 'profile') and 
-                     self.request.user.profile.user_type in ['teacher', 'admin'])):
+            if not can_manage_course(self.request.user, course):
                 self.permission_denied(self.request)
         
+        self.is_author = can_manage_course(self.request.user, course)
         return course
 
+    def get_serializer_class(self):
+        return CourseSerializer if self.is_author else CourseSyllabusSerializer
+
+    def get_etag_parts(self, instance, course):
+        # Dùng lại cho student_count/is_enrolled khi serialize
+        instance.student_count, instance.is_enrolled = get_enrollment_etag_parts(course, self.request.user)
+        return instance.student_count, instance.is_enrolled, 'author' if self.is_author else 'syllabus'
+
+    def get_render_prefetch(self):
+        return course_syllabus_prefetches(questions=self.is_author)
+
 
 class CourseCreateView(generics.CreateAPIView):
     """
@@ -111,10 +155,7 @@ class CourseUpdateView(generics.UpdateAPIView):
         course = get_object_or_404(Course, id=self.kwargs['pk'])
         
         # Kiểm tra quyền: chỉ creator, teacher hoặc admin mới được sửa
-        if not (course.creator == self.request.user or 
-                self.request.user.is_staff or
-                (hasattr(self.request.user, 'profile') and 
-                 self.request.user.profile.user_type in ['teacher', 'admin'])):
+        if not can_manage_course(self.request.user, course):
             self.permission_denied(self.request)
         
         return course
@@ -130,33 +171,121 @@ class CourseDeleteView(generics.DestroyAPIView):
         course = get_object_or_404(Course, id=self.kwargs['pk'])
         
         # Kiểm tra quyền: chỉ creator, teacher hoặc admin mới được xóa
-        if not (course.creator == self.request.user or 
-                self.request.user.is_staff or
-                (hasattr(self.request.user, 'profile') and 
-                 self.request.user.profile.user_type in ['teacher', 'admin'])):
+        if not can_manage_course(self.request.user, course):
             self.permission_denied(self.request)
         
         return course
 
+    def perform_destroy(self, instance):
+        # Xóa cascade không cần tăng content_version cho từng dòng con
+        with content_change(instance.id):
+            instance.delete()
+
 
 class MyCourseListView(generics.ListAPIView):
     """
     Danh sách khóa học của tôi (giáo viên xem khóa học đã tạo, học viên xem khóa học đã đăng ký)
     """
-    serializer_class = CourseSerializer
     permission_classes = [IsAuthenticated]
     
+    def get_serializer_class(self):
+        if get_user_role(self.request.user).is_teacher_or_admin:
+            return CourseSerializer
+        return CourseSyllabusSerializer
+    
     def get_queryset(self):
         user = self.request.user
+        is_author = get_user_role(user).is_teacher_or_admin
         
         # Nếu là teacher hoặc admin, hiển thị khóa học đã tạo
-        if (user.is_staff or 
-            (hasattr(user, 'profile') and user.profile.user_type in ['teacher', 'admin'])):
-            return Course.objects.filter(creator=user).order_by('-created_at')
+        queryset = annotate_enrollment(
+            Course.objects.select_related('creator').prefetch_related(
+                *course_syllabus_prefetches(questions=is_author)
+            ),
+            user
+        )
+        if is_author:
+            return queryset.filter(creator=user).order_by('-created_at')
         
         # Nếu là student, hiển thị khóa học đã đăng ký
         enrolled_courses = UserCourse.objects.filter(user=user).values_list('course', flat=True)
-        return Course.objects.filter(id__in=enrolled_courses).order_by('-created_at')
+        return queryset.filter(id__in=enrolled_courses).order_by('-created_at')
+
+
+# Course Archive Views
+class CourseExportView(APIView):
+    """
+    Xuất toàn bộ khóa học (kể cả đáp án và ngân hàng câu hỏi) thành archive zip, stream theo từng lô section
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        course = get_object_or_404(Course, id=pk)
+        if not can_manage_course(request.user, course):
+            self.permission_denied(request)
+
+        response = StreamingHttpResponse(stream_course_archive(course), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{archive_filename(course)}"'
+        return response
+
+
+class CourseImportView(APIView):
+    """
+    Tạo khóa học mới (chưa xuất bản) từ archive: file zip (trường `file`, có thể kèm `title`)
+    hoặc nội dung course.json gửi trực tiếp dạng JSON
+    """
+    permission_classes = [IsTeacherOrAdmin]
+
+    def post(self, request):
+        try:
+            data, thumbnail = read_archive_upload(request)
+            course = import_course_archive(data, request.user, thumbnail=thumbnail, title=request.data.get('title'))
+        except ArchiveError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "id": course.id,
+            "title": course.title,
+            "sections": course.sections.count(),
+        }, status=status.HTTP_201_CREATED)
+
+
+
+class CourseCloneView(APIView):
+    """
+    Sao chép khóa học (nội dung, ngân hàng câu hỏi; không gồm học viên và lần làm bài).
+    Khóa học nhỏ được sao chép ngay (201); khóa học lớn hoặc gửi "background": true
+    thì tạo job chạy nền (202) để theo dõi tiến độ qua clone-jobs/<id>/.
+    """
+    permission_classes = [IsTeacherOrAdmin]
+
+    def post(self, request, pk):
+        source = get_object_or_404(Course, id=pk)
+        if not can_manage_course(request.user, source):
+            self.permission_denied(request)
+
+        title = request.data.get('title') or ''
+        totals = count_clone_rows(source)
+        if not request.data.get('background') and sum(totals.values()) <= settings.COURSE_CLONE_SYNC_MAX_ROWS:
+            course = clone_course(source, request.user, title=title or None, totals=totals)
+            return Response({"id": course.id, "title": course.title}, status=status.HTTP_201_CREATED)
+
+        job = CourseCloneJob.objects.create(source=source, requested_by=request.user, title=title)
+        return Response(CourseCloneJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class CourseCloneJobDetailView(generics.RetrieveAPIView):
+    """
+    Trạng thái và tiến độ (%) của một job sao chép khóa học (người tạo job hoặc admin)
+    """
+    serializer_class = CourseCloneJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_object(self):
+        job = get_object_or_404(CourseCloneJob, id=self.kwargs['pk'])
+        if job.requested_by_id != self.request.user.id and not self.request.user.is_staff:
+            self.permission_denied(self.request)
+        return job
 
 
 # Course Enrollment Views
@@ -169,16 +298,14 @@ class CourseEnrollView(APIView):
     def post(self, request, course_id):
         course = get_object_or_404(Course, id=course_id, published=True)
         
-        # Kiểm tra xem đã đăng ký chưa
-        if UserCourse.objects.filter(user=request.user, course=course).exists():
+        # Tạo đăng ký mới; get_or_create an toàn khi có request đồng thời
+        _, created = UserCourse.objects.get_or_create(user=request.user, course=course)
+        if not created:
             return Response(
                 {"detail": "Bạn đã đăng ký khóa học này rồi"}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Tạo đăng ký mới
-        UserCourse.objects.create(user=request.user, course=course)
-        
         return Response(
             {"detail": "Đăng ký khóa học thành công"}, 
             status=status.HTTP_201_CREATED
@@ -208,6 +335,34 @@ class CourseUnenrollView(APIView):
             )
 
 
+class CourseBulkEnrollView(APIView):
+    """
+    Đăng ký hàng loạt học viên vào khóa học theo user_ids hoặc usernames (chỉ creator, giáo viên và admin)
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, course_id):
+        course = get_object_or_404(Course, id=course_id)
+
+        # Kiểm tra quyền: chỉ creator, teacher hoặc admin mới được đăng ký cho học viên
+        if not can_manage_course(request.user, course):
+            self.permission_denied(request)
+
+        serializer = BulkEnrollSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = bulk_enroll_users(
+            course,
+            user_ids=serializer.validated_data['user_ids'],
+            usernames=serializer.validated_data['usernames'],
+        )
+        enrolled_count = sum(1 for result in results if result['status'] == 'enrolled')
+        return Response({
+            "course_id": course.id,
+            "enrolled_count": enrolled_count,
+            "results": results,
+        }, status=status.HTTP_201_CREATED if enrolled_count else status.HTTP_200_OK)
+
+
 class CourseStudentsView(generics.ListAPIView):
     """
     Danh sách học viên đã đăng ký khóa học (chỉ creator, giáo viên và admin)
@@ -219,10 +374,7 @@ class CourseStudentsView(generics.ListAPIView):
         course = get_object_or_404(Course, id=self.kwargs['course_id'])
         
         # Kiểm tra quyền: chỉ creator, teacher hoặc admin mới được xem
-        if not (course.creator == self.request.user or 
-                self.request.user.is_staff or
-                (hasattr(self.request.user, 'profile') and 
-                 self.request.user.profile.user_type in ['teacher', 'admin'])):
+        if not can_manage_course(self.request.user, course):
             self.permission_denied(self.request)
         
         return UserCourse.objects.filter(course=course).order_by('-enrolled_at')
@@ -238,56 +390,65 @@ class SectionListCreateView(generics.ListCreateAPIView):
     
     def get_queryset(self):
         course = get_object_or_404(Course, id=self.kwargs['course_id'])
-        return Section.objects.filter(course=course).order_by('position')
+        is_author = get_user_role(self.request.user).is_teacher_or_admin
+        return Section.objects.filter(course=course).order_by('position').prefetch_related(
+            *section_content_prefetches(questions=is_author)
+        )
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return SectionCreateUpdateSerializer
-        return SectionSerializer
+        if get_user_role(self.request.user).is_teacher_or_admin:
+            return SectionSerializer
+        return SyllabusSectionSerializer
     
     def perform_create(self, serializer):
         course = get_object_or_404(Course, id=self.kwargs['course_id'])
         
         # Kiểm tra quyền: chỉ creator, teacher hoặc admin mới được tạo
-        if not (course.creator == self.request.user or 
-                self.request.user.is_staff or
-                (hasattr(self.request.user, 'profile') and 
-                 self.request.user.profile.user_type in ['teacher', 'admin'])):
+        if not can_manage_course(self.request.user, course):
             self.permission_denied(self.request)
         
         serializer.save(course=course)
 
 
-class SectionDetailView(generics.RetrieveUpdateDestroyAPIView):
+class SectionDetailView(ConditionalRetrieveMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     Chi tiết, cập nhật và xóa section
     """
     permission_classes = [IsAuthenticated]
+    is_author = False  # gán lại trong get_object
     
     def get_serializer_class(self):
         if self.request.method in ['PUT', 'PATCH']:
             return SectionCreateUpdateSerializer
-        return SectionSerializer
+        return SectionSerializer if self.is_author else SyllabusSectionSerializer
     
     def get_object(self):
-        section = get_object_or_404(
-            Section.objects.prefetch_related(
-                'lessons',
-                'quizzes__questions__choices'
-            ), 
-            id=self.kwargs['pk']
-        )
+        section = get_object_or_404(Section.objects.select_related('course'), id=self.kwargs['pk'])
+        self.is_author = can_manage_course(self.request.user, section.course)
         
         # Kiểm tra quyền cho các thao tác sửa/xóa
         if self.request.method in ['PUT', 'PATCH', 'DELETE']:
-            if not (section.course.creator == self.request.user or 
-                    self.request.user.is_staff or
-                    (hasattr(self.request.user, 'profile') and 
-                     self.request.user.profile.user_type in ['teacher', 'admin'])):
+            if not self.is_author:
                 self.permission_denied(self.request)
         
         return section
 
+    def get_content_course(self, instance):
+        return instance.course
+
+    def get_etag_parts(self, instance, course):
+        return ('author' if self.is_author else 'syllabus',)
+
+    def get_render_prefetch(self):
+        return section_content_prefetches(questions=self.is_author)
+
+    def perform_destroy(self, instance):
+        # Lesson/quiz/question/choice bị xóa cascade: chỉ tăng content_version một lần
+        with content_change(instance.course_id):
+            instance.delete()
+
 
 # Lesson Views  
 class LessonListCreateView(generics.ListCreateAPIView):
@@ -306,13 +467,10 @@ class LessonListCreateView(generics.ListCreateAPIView):
         return LessonSerializer
     
     def perform_create(self, serializer):
-        section = get_object_or_404(Section, id=self.kwargs['section_id'])
+        section = get_object_or_404(Section.objects.select_related('course'), id=self.kwargs['section_id'])
         
         # Kiểm tra quyền: chỉ creator, teacher hoặc admin mới được tạo
-        if not (section.course.creator == self.request.user or 
-                self.request.user.is_staff or
-                (hasattr(self.request.user, 'profile') and 
-                 self.request.user.profile.user_type in ['teacher', 'admin'])):
+        if not can_manage_course(self.request.user, section.course):
             self.permission_denied(self.request)
         
         serializer.save(section=section)
@@ -330,14 +488,11 @@ class LessonDetailView(generics.RetrieveUpdateDestroyAPIView):
         return LessonSerializer
     
     def get_object(self):
-        lesson = get_object_or_404(Lesson, id=self.kwargs['pk'])
+        lesson = get_object_or_404(Lesson.objects.select_related('section__course'), id=self.kwargs['pk'])
         
         # Kiểm tra quyền cho các thao tác sửa/xóa
         if self.request.method in ['PUT', 'PATCH', 'DELETE']:
-            if not (lesson.section.course.creator == self.request.user or 
-                    self.request.user.is_staff or
-                    (hasattr(self.request.user, 'profile') and 
-                     self.request.user.profile.user_type in ['teacher', 'admin'])):
+            if not can_manage_course(self.request.user, lesson.section.course):
                 self.permission_denied(self.request)
         
         return lesson
@@ -352,53 +507,65 @@ class QuizListCreateView(generics.ListCreateAPIView):
     
     def get_queryset(self):
         section = get_object_or_404(Section, id=self.kwargs['section_id'])
-        return Quiz.objects.filter(section=section).order_by('position')
+        queryset = Quiz.objects.filter(section=section).select_related('section').order_by('position')
+        if get_user_role(self.request.user).is_teacher_or_admin:
+            queryset = queryset.prefetch_related(*quiz_content_prefetches())
+        return queryset
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return QuizCreateUpdateSerializer
-        return QuizSerializer
+        if get_user_role(self.request.user).is_teacher_or_admin:
+            return QuizSerializer
+        return SyllabusQuizSerializer
     
     def perform_create(self, serializer):
-        section = get_object_or_404(Section, id=self.kwargs['section_id'])
+        section = get_object_or_404(Section.objects.select_related('course'), id=self.kwargs['section_id'])
         
         # Kiểm tra quyền: chỉ creator, teacher hoặc admin mới được tạo
-        if not (section.course.creator == self.request.user or 
-                self.request.user.is_staff or
-                (hasattr(self.request.user, 'profile') and 
-                 request.user.profile.user_type in ['teacher', 'admin'])):
+        if not can_manage_course(self.request.user, section.course):
             self.permission_denied(self.request)
         
         serializer.save(section=section)
 
 
-class QuizDetailView(generics.RetrieveUpdateDestroyAPIView):
+class QuizDetailView(ConditionalRetrieveMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     Chi tiết, cập nhật và xóa quiz
     """
     permission_classes = [IsAuthenticated]
+    is_author = False  # gán lại trong get_object
     
     def get_serializer_class(self):
         if self.request.method in ['PUT', 'PATCH']:
             return QuizCreateUpdateSerializer
-        return QuizSerializer
+        # Học viên mở quiz để làm bài: có câu hỏi, lựa chọn nhưng không có đáp án
+        return QuizSerializer if self.is_author else PublicQuizSerializer
     
     def get_object(self):
-        quiz = get_object_or_404(
-            Quiz.objects.prefetch_related('questions__choices'), 
-            id=self.kwargs['pk']
-        )
+        quiz = get_object_or_404(Quiz.objects.select_related('section__course'), id=self.kwargs['pk'])
+        self.is_author = can_manage_course(self.request.user, quiz.section.course)
         
         # Kiểm tra quyền cho các thao tác sửa/xóa
         if self.request.method in ['PUT', 'PATCH', 'DELETE']:
-            if not (quiz.section.course.creator == self.request.user or 
-                    self.request.user.is_staff or
-                    (hasattr(self.request.user, 'profile') and 
-                     self.request.user.profile.user_type in ['teacher', 'admin'])):
+            if not self.is_author:
                 self.permission_denied(self.request)
         
         return quiz
 
+    def get_content_course(self, instance):
+        return instance.section.course
+
+    def get_etag_parts(self, instance, course):
+        return ('author' if self.is_author else 'public',)
+
+    def get_render_prefetch(self):
+        return quiz_content_prefetches()
+
+    def perform_destroy(self, instance):
+        with content_change(instance.section.course_id):
+            instance.delete()
+
 
 # Question Views
 class QuestionListCreateView(generics.ListCreateAPIView):
@@ -409,7 +576,9 @@ class QuestionListCreateView(generics.ListCreateAPIView):
     
     def get_queryset(self):
         quiz = get_object_or_404(Quiz, id=self.kwargs['quiz_id'])
-        return Question.objects.filter(quiz=quiz).order_by('position')
+        return Question.objects.filter(quiz=quiz).order_by('position').prefetch_related(
+            Prefetch('choices', queryset=Choice.objects.order_by('id'))
+        )
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -433,7 +602,18 @@ class QuestionDetailView(generics.RetrieveUpdateDestroyAPIView):
         return QuestionSerializer
     
     def get_object(self):
-        return get_object_or_404(Question, id=self.kwargs['pk'])
+        # Câu hỏi ngân hàng (quiz = null) quản lý qua QuestionBankDetailView
+        return get_object_or_404(
+            Question.objects.select_related('quiz__section').prefetch_related(
+                Prefetch('choices', queryset=Choice.objects.order_by('id'))
+            ),
+            id=self.kwargs['pk'],
+            quiz__isnull=False
+        )
+
+    def perform_destroy(self, instance):
+        with content_change(instance.quiz.section.course_id):
+            instance.delete()
 
 
 # Choice Views
@@ -473,6 +653,235 @@ class ChoiceDetailView(generics.RetrieveUpdateDestroyAPIView):
 
 
 # Dashboard Views
+# Reorder Views
+class BaseReorderView(APIView):
+    """
+    Sắp xếp lại các mục cùng cha trong một transaction (xem ReorderSerializer):
+    khóa các mục anh em, cập nhật position bằng một bulk_update và tăng
+    content_version của khóa học một lần nếu có mục đổi position.
+
+    View con khai báo model, parent_field, parent_model và course_lookup (đường dẫn
+    từ cha tới khóa học, rỗng khi cha chính là khóa học).
+    """
+    permission_classes = [IsAuthenticated]
+    model = None
+    parent_field = None
+    parent_model = Course
+    course_lookup = ''
+
+    def get_course(self, parent_id):
+        """Khóa học chứa cha của các mục (404 nếu cha không tồn tại)"""
+        queryset = self.parent_model.objects.all()
+        if self.course_lookup:
+            queryset = queryset.select_related(self.course_lookup)
+        parent = get_object_or_404(queryset, id=parent_id)
+        if not self.course_lookup:
+            return parent
+        return attrgetter(self.course_lookup.replace('__', '.'))(parent)
+
+    def put(self, request, parent_id):
+        course = self.get_course(parent_id)
+        if not can_manage_course(request.user, course):
+            self.permission_denied(request)
+
+        serializer = ReorderSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        with transaction.atomic():
+            siblings = list(
+                self.model.objects.select_for_update()
+                .filter(**{self.parent_field: parent_id})
+                .only('id', 'position', self.parent_field)
+                .order_by('position', 'id')
+            )
+            sibling_ids = {obj.id for obj in siblings}
+            if 'ids' in data:
+                if set(data['ids']) != sibling_ids:
+                    return Response({
+                        "detail": "ids phải gồm đúng toàn bộ các mục cần sắp xếp",
+                        "missing": sorted(sibling_ids - set(data['ids'])),
+                        "unknown": sorted(set(data['ids']) - sibling_ids),
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                changed = reorder_positions(siblings, data['ids'])
+            else:
+                unknown = {data['id'], data.get('after'), data.get('before')} - sibling_ids - {None}
+                if unknown:
+                    return Response(
+                        {"detail": "Mục không thuộc danh sách cần sắp xếp", "unknown": sorted(unknown)},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                changed = move_position(siblings, data['id'], data.get('after'), data.get('before'))
+            # bulk_update không phát signal: tăng content_version ở đây, chỉ khi thứ tự thực sự đổi
+            if changed:
+                Course.bump_content_version(id=course.id)
+
+        return Response({
+            "updated": len(changed),
+            "positions": [
+                {"id": obj.id, "position": obj.position}
+                for obj in sorted(siblings, key=lambda obj: (obj.position, obj.id))
+            ],
+        })
+
+    def post(self, request, parent_id):
+        return self.put(request, parent_id)
+
+
+class SectionReorderView(BaseReorderView):
+    model = Section
+    parent_field = 'course_id'
+
+
+class LessonReorderView(BaseReorderView):
+    model = Lesson
+    parent_field = 'section_id'
+    parent_model = Section
+    course_lookup = 'course'
+
+
+class QuizReorderView(BaseReorderView):
+    model = Quiz
+    parent_field = 'section_id'
+    parent_model = Section
+    course_lookup = 'course'
+
+
+class QuestionReorderView(BaseReorderView):
+    model = Question
+    parent_field = 'quiz_id'
+    parent_model = Quiz
+    course_lookup = 'section__course'
+
+
+# Question Bank Views
+class QuestionBankListCreateView(generics.ListCreateAPIView):
+    """
+    Danh sách (lọc theo ?tag=&difficulty=) và tạo câu hỏi trong ngân hàng câu hỏi của khóa học
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_course(self):
+        course = get_object_or_404(Course, id=self.kwargs['course_id'])
+        if not can_manage_course(self.request.user, course):
+            self.permission_denied(self.request)
+        return course
+
+    def get_queryset(self):
+        queryset = Question.objects.filter(bank_course=self.get_course())
+        tag = self.request.query_params.get('tag')
+        if tag:
+            queryset = queryset.filter(tags__name=tag)
+        difficulty = self.request.query_params.get('difficulty')
+        if difficulty:
+            queryset = queryset.filter(difficulty=difficulty)
+        return queryset.order_by('position', 'id').prefetch_related(
+            'tags', Prefetch('choices', queryset=Choice.objects.order_by('id'))
+        )
+
+    def get_serializer_class(self):
+        if self.request.method == 'POST':
+            return BankQuestionCreateUpdateSerializer
+        return BankQuestionSerializer
+
+    def perform_create(self, serializer):
+        serializer.save(bank_course=self.get_course())
+
+
+class QuestionBankDetailView(generics.RetrieveUpdateDestroyAPIView):
+    """
+    Chi tiết, cập nhật và xóa câu hỏi trong ngân hàng câu hỏi
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_serializer_class(self):
+        if self.request.method in ['PUT', 'PATCH']:
+            return BankQuestionCreateUpdateSerializer
+        return BankQuestionSerializer
+
+    def get_object(self):
+        question = get_object_or_404(
+            Question.objects.select_related('bank_course').prefetch_related(
+                'tags', Prefetch('choices', queryset=Choice.objects.order_by('id'))
+            ),
+            id=self.kwargs['pk'],
+            bank_course__isnull=False
+        )
+        if not can_manage_course(self.request.user, question.bank_course):
+            self.permission_denied(self.request)
+        return question
+
+    def perform_destroy(self, instance):
+        with content_change(instance.bank_course_id):
+            instance.delete()
+
+
+@read_preference(REPLICA)
+class QuestionBankStatsView(APIView):
+    """
+    Thống kê từng câu hỏi ngân hàng trên mọi quiz đã rút câu đó (tính bằng SQL trên AttemptAnswer)
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, course_id):
+        course = get_object_or_404(Course, id=course_id)
+        if not can_manage_course(request.user, course):
+            self.permission_denied(request)
+
+        stats = list(
+            AttemptAnswer.objects.filter(question__bank_course=course)
+            .values('question_id', 'question__text', 'question__difficulty')
+            .annotate(
+                attempts=Count('id'),
+                answered=Count('id', filter=Q(choice__isnull=False)),
+                correct=Count('id', filter=Q(is_correct=True)),
+                quizzes=Count('attempt__quiz', distinct=True),
+            )
+            .order_by('question__position', 'question_id')
+        )
+        for row in stats:
+            row['correct_rate'] = round(row['correct'] / row['attempts'], 4) if row['attempts'] else None
+        return Response({
+            'course_id': course.id,
+            'question_stats': stats,
+        })
+
+
+class QuizRuleView(APIView):
+    """
+    GET: các rule lấy mẫu câu hỏi của quiz.
+    PUT: thay toàn bộ rule bằng danh sách [{"tag", "difficulty", "count"}] (danh sách rỗng
+    = quiz trở lại dùng câu hỏi riêng của quiz).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_quiz(self, request, quiz_id):
+        quiz = get_object_or_404(Quiz.objects.select_related('section__course'), id=quiz_id)
+        if not can_manage_course(request.user, quiz.section.course):
+            self.permission_denied(request)
+        return quiz
+
+    def get(self, request, quiz_id):
+        quiz = self.get_quiz(request, quiz_id)
+        rules = quiz.rules.select_related('tag').order_by('id')
+        return Response(QuizRuleSerializer(rules, many=True).data)
+
+    def put(self, request, quiz_id):
+        quiz = self.get_quiz(request, quiz_id)
+        serializer = QuizRuleSerializer(
+            data=request.data, many=True, context={'course': quiz.section.course}
+        )
+        serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic(), content_change(quiz.section.course_id):
+            quiz.rules.all().delete()
+            rules = QuizRule.objects.bulk_create([
+                QuizRule(quiz=quiz, **rule) for rule in serializer.validated_data
+            ])
+        return Response(QuizRuleSerializer(rules, many=True).data)
+
+
+@read_preference(REPLICA)
 class TeacherDashboardView(APIView):
     """
     Dashboard cho giáo viên - thống kê khóa học
@@ -508,6 +917,7 @@ class TeacherDashboardView(APIView):
         })
 
 
+@read_preference(REPLICA)
 class AdminDashboardView(APIView):
     """
     Dashboard cho admin - thống kê tổng quan
@@ -535,20 +945,17 @@ class AdminDashboardView(APIView):
 
 
 # Auto Quiz Generation Views
-@api_view(['POST'])
-@permission_classes([IsTeacherOrAdmin])
-def generate_auto_quiz(request, section_id):
+@async_api_view(['POST'], permission_classes=[IsTeacherOrAdmin])
+async def generate_auto_quiz(request, section_id):
     """
     Generate quiz questions automatically from section lessons using AI
     """
     try:
-        section = get_object_or_404(Section, id=section_id)
+        section = await database_sync_to_async(get_object_or_404)(
+            Section.objects.select_related('course'), id=section_id)
         
         # Kiểm tra quyền: chỉ creator, teacher hoặc admin mới được tạo
-        if not (section.course.creator == request.user or 
-                request.user.is_staff or
-                (hasattr(request.user, 'profile') and 
-                 request.user.profile.user_type in ['teacher', 'admin'])):
+        if not can_manage_course(request.user, section.course):
             return Response(
                 {"error": "Bạn không có quyền tạo quiz cho chương này"}, 
                 status=status.HTTP_403_FORBIDDEN
@@ -566,7 +973,7 @@ def generate_auto_quiz(request, section_id):
             )
         
         # Check if section has lessons
-        if not section.lessons.exists():
+        if not await database_sync_to_async(section.lessons.exists)():
             return Response(
                 {"error": "Chương này chưa có bài học nào để tạo quiz"}, 
                 status=status.HTTP_400_BAD_REQUEST
@@ -575,16 +982,18 @@ def generate_auto_quiz(request, section_id):
         # Generate questions using AI
         if selected_lesson_ids:
             # Validate selected lessons belong to this section
-            valid_lesson_ids = list(section.lessons.filter(id__in=selected_lesson_ids).values_list('id', flat=True))
+            valid_lesson_ids = await database_sync_to_async(list)(
+                section.lessons.filter(id__in=selected_lesson_ids).values_list('id', flat=True)
+            )
             if not valid_lesson_ids:
                 return Response(
                     {"error": "Không tìm thấy bài học hợp lệ để tạo quiz"}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            questions = generate_quiz_from_selected_lessons(valid_lesson_ids, num_questions)
+            questions = await agenerate_quiz_from_selected_lessons(valid_lesson_ids, num_questions)
         else:
             # Use all lessons in section
-            questions = generate_quiz_from_lessons(section, num_questions)
+            questions = await agenerate_quiz_from_lessons(section, num_questions)
         
         if not questions:
             return Response(
@@ -609,6 +1018,7 @@ def generate_auto_quiz(request, section_id):
 
 
 # Teacher Quiz Results View
+@read_preference(REPLICA)
 @api_view(['GET'])
 @permission_classes([IsTeacherOrAdmin])
 def teacher_quiz_results(request, quiz_id):
@@ -617,9 +1027,27 @@ def teacher_quiz_results(request, quiz_id):
     Trả về danh sách các lần làm bài kiểm tra của học viên cho quiz này
     """
     quiz = get_object_or_404(Quiz, id=quiz_id)
-    attempts = QuizAttempt.objects.filter(quiz=quiz).select_related('user').order_by('-submitted_at')
+    attempts = QuizAttempt.objects.filter(
+        quiz=quiz, status=QuizAttempt.SUBMITTED
+    ).select_related('user').order_by('-submitted_at')
     serializer = TeacherQuizAttemptSerializer(attempts, many=True)
-    return Response({'quiz_id': quiz.id, 'quiz_title': quiz.title, 'results': serializer.data})
+    # Thống kê theo từng câu hỏi, tính bằng SQL trên bảng AttemptAnswer
+    question_stats = list(
+        AttemptAnswer.objects.filter(attempt__quiz=quiz)
+        .values('question_id', 'question__text')
+        .annotate(
+            answered=Count('id', filter=Q(choice__isnull=False)),
+            correct=Count('id', filter=Q(is_correct=True)),
+            attempts=Count('id'),
+        )
+        .order_by('question__position', 'question_id')
+    )
+    return Response({
+        'quiz_id': quiz.id,
+        'quiz_title': quiz.title,
+        'results': serializer.data,
+        'question_stats': question_stats,
+    })
 
 
 # Teacher Quiz Attempt Detail View
@@ -630,38 +1058,21 @@ def teacher_quiz_attempt_detail(request, attempt_id):
     API endpoint: GET /api/teacher/quiz-attempts/<attempt_id>/detail/
     Trả về chi tiết một lần làm bài cụ thể cho giáo viên
     """
-    attempt = get_object_or_404(QuizAttempt, id=attempt_id)
+    attempt = get_object_or_404(QuizAttempt, id=attempt_id, status=QuizAttempt.SUBMITTED)
     serializer = TeacherQuizAttemptSerializer(attempt)
     return Response(serializer.data)
 
 
 # Teacher Quiz AI Feedback View
-@api_view(['POST'])
-@permission_classes([IsTeacherOrAdmin])
-def teacher_quiz_attempt_ai_feedback(request, attempt_id):
+@async_api_view(['POST'], permission_classes=[IsTeacherOrAdmin])
+async def teacher_quiz_attempt_ai_feedback(request, attempt_id):
     """
     API endpoint: POST /api/teacher/quiz-attempts/<attempt_id>/ai-feedback/
     Giáo viên lấy nhận xét AI cho bất kỳ bài làm nào
     """
-    attempt = get_object_or_404(QuizAttempt, id=attempt_id)
-    quiz = attempt.quiz
-    questions = quiz.questions.all()
-    answers = attempt.answers or {}
-    answer_detail = []
-    correct = 0
-    total = questions.count()
-    for q in questions:
-        qid = str(q.id)
-        selected = answers.get(qid)
-        correct_choice = q.choices.filter(is_correct=True).first()
-        is_correct = str(getattr(correct_choice, 'id', None)) == str(selected)
-        if is_correct:
-            correct += 1
-        answer_detail.append({
-            "question": q.text,
-            "your_choice": selected,
-            "correct_choice": str(getattr(correct_choice, 'id', None)),
-        })
+    attempt = await database_sync_to_async(get_object_or_404)(
+        QuizAttempt, id=attempt_id, status=QuizAttempt.SUBMITTED)
+    correct, total, answer_detail = await database_sync_to_async(get_attempt_result)(attempt)
     quiz_result = {
         "score": attempt.score,
         "correct": correct,
@@ -682,22 +1093,15 @@ def teacher_quiz_attempt_ai_feedback(request, attempt_id):
         "Thông tin đầu vào: kết quả bài kiểm tra sau:\n"
         f"{json.dumps(quiz_result, ensure_ascii=False, indent=2)}"
     )
-    feedback = generate_quiz_feedback_with_ai(prompt)
+    feedback = await agenerate_quiz_feedback_with_ai(prompt)
     if not feedback:
         return Response({"detail": "Không thể tạo nhận xét AI. Vui lòng thử lại sau."}, status=500)
     return Response({"feedback": feedback})
 
 
 # Teacher Statistics View
-@api_view(['GET'])
-@permission_classes([IsTeacherOrAdmin])
-def teacher_statistics(request):
-    """
-    API endpoint: GET /api/teacher/statistics/
-    - Không có ?ai=1: chỉ trả về số liệu cho biểu đồ (nhanh)
-    - Có ?ai=1: chỉ trả về nhận xét AI (có thể chậm)
-    """
-    user = request.user
+def _teacher_statistics(user):
+    """Số liệu thống kê của giáo viên (truy vấn đồng bộ, view async gọi qua database_sync_to_async)"""
     # --- Số liệu thống kê ---
     # Doanh thu theo tháng (giả lập)
     months = ["01/2025", "02/2025", "03/2025", "04/2025", "05/2025"]
@@ -787,7 +1191,7 @@ def teacher_statistics(request):
     avg_scores = []
     for course in courses:
         quiz_ids = course.sections.values_list('quizzes__id', flat=True)
-        attempts = QuizAttempt.objects.filter(quiz_id__in=quiz_ids)
+        attempts = QuizAttempt.objects.filter(quiz_id__in=quiz_ids, status=QuizAttempt.SUBMITTED)
         avg_score = attempts.aggregate(avg=Avg('score'))['avg']
         course_names.append(course.title)
         avg_scores.append(round(avg_score, 2) if avg_score is not None else 0)
@@ -804,29 +1208,53 @@ def teacher_statistics(request):
     published_courses = courses.filter(published=True).count()
     draft_courses = courses.filter(published=False).count()
     total_students = user_courses.count()
+    return {
+        "revenue_chart": revenue_chart,
+        "new_students_chart": new_students_chart,
+        "course_scores_chart": course_scores_chart,
+        "total_courses": total_courses,
+        "published_courses": published_courses,
+        "draft_courses": draft_courses,
+        "total_students": total_students,
+        "revenue": revenue,
+        "new_students": new_students,
+        "course_names": course_names,
+        "avg_scores": avg_scores,
+    }
+
+
+@read_preference(REPLICA)
+@async_api_view(['GET'], permission_classes=[IsTeacherOrAdmin])
+async def teacher_statistics(request):
+    """
+    API endpoint: GET /api/teacher/statistics/
+    - Không có ?ai=1: chỉ trả về số liệu cho biểu đồ (nhanh)
+    - Có ?ai=1: chỉ trả về nhận xét AI (có thể chậm, chờ AI không giữ thread)
+    """
+    stats = await database_sync_to_async(_teacher_statistics)(request.user)
     # Nếu chỉ lấy số liệu (không có ?ai=1)
     if not request.GET.get('ai'):
         return Response({
-            "revenue_chart": revenue_chart,
-            "new_students_chart": new_students_chart,
-            "course_scores_chart": course_scores_chart,
-            "total_courses": total_courses,
-            "published_courses": published_courses,
-            "draft_courses": draft_courses,
-            "total_students": total_students,
+            "revenue_chart": stats["revenue_chart"],
+            "new_students_chart": stats["new_students_chart"],
+            "course_scores_chart": stats["course_scores_chart"],
+            "total_courses": stats["total_courses"],
+            "published_courses": stats["published_courses"],
+            "draft_courses": stats["draft_courses"],
+            "total_students": stats["total_students"],
             "ai_feedback": ""
         })
     # Nếu có ?ai=1 thì chỉ trả về nhận xét AI động dựa trên số liệu thực tế
     if request.GET.get('ai'):
         # Chuẩn bị dữ liệu thống kê thực tế
         summary = {
-            "Tổng số khóa học": total_courses,
-            "Khóa học đã xuất bản": published_courses,
-            "Bản nháp": draft_courses,
-            "Tổng học viên": total_students,
-            "Doanh thu theo tháng (USD)": revenue,
-            "Số học viên mới theo tháng": new_students,
-            "Điểm trung bình từng khóa học": dict(zip(course_names, avg_scores)),
+            "Tổng số khóa học": stats["total_courses"],
+            "Khóa học đã xuất bản": stats["published_courses"],
+            "Bản nháp": stats["draft_courses"],
+            "Tổng học viên": stats["total_students"],
+            "Doanh thu theo tháng (USD)": stats["revenue"],
+            "Số học viên mới theo tháng": stats["new_students"],
+            "Điểm trung bình từng khóa học": dict(zip(stats["course_names"], stats["avg_scores"])),
         }
         prompt = (
             "Bạn là một trợ lý AI cho giáo viên. Hãy phân tích số liệu thống kê sau và đưa ra nhận xét, khuyến nghị chi tiết.\n\n"
@@ -843,7 +1271,7 @@ def teacher_statistics(request):
             "- Không giải thích thêm, chỉ trả về markdown.\n\n"
             f"Số liệu thống kê:\n{json.dumps(summary, ensure_ascii=False, indent=2)}"
         )
-        feedback = generate_quiz_feedback_with_ai(prompt)
+        feedback = await agenerate_quiz_feedback_with_ai(prompt)
         if not feedback:
             return Response({"ai_feedback": "Không thể tạo nhận xét AI. Vui lòng thử lại sau."}, status=500)
         return Response({"ai_feedback": feedback})
@@ -0,0 +1,31 @@
+"""
+Cấu hình gunicorn: `gunicorn -c gunicorn.conf.py backend.wsgi`.
+
+Metrics Prometheus ở chế độ multiprocess: PROMETHEUS_MULTIPROC_DIR phải được đặt
+trước khi gunicorn khởi động; thư mục được làm rỗng khi master khởi động và file của
+worker đã thoát được đánh dấu để gauge không còn tính worker đó.
+"""
+import glob
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))  # các API AI có thể chạy lâu
+# Mỗi thread giữ tối đa một kết nối DB: với DATABASE_POOL nên đặt DATABASE_POOL_MAX_SIZE >= threads,
+# và workers x DATABASE_POOL_MAX_SIZE (hoặc workers x threads khi dùng CONN_MAX_AGE) < max_connections
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+
+
+def on_starting(server):
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, '*.db')):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
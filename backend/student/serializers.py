@@ -18,7 +18,8 @@ class StudentCourseListSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'subtitle', 'thumbnail', 
             'category', 'price', 'student_count', 
-            'lesson_count', 'quiz_count', 'is_enrolled', 'creator', 'published_at'
+            'lesson_count', 'quiz_count', 'is_enrolled', 'creator', 'published_at',
+            'content_version'
         ]
     
     def get_student_count(self, obj):
@@ -74,26 +75,24 @@ class StudentSectionSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'lessons', 'quizzes']
 
 
-class StudentCourseDetailSerializer(serializers.ModelSerializer):
-    """Serializer hiển thị thông tin chi tiết khóa học cho học viên"""
+class StudentCourseContentSerializer(serializers.ModelSerializer):
+    """
+    Phần chung (không phụ thuộc user) của chi tiết khóa học; JSON của phần này
+    được cache theo content_version, xem StudentCourseDetailView
+    """
     sections = StudentSectionSerializer(many=True, read_only=True)
-    student_count = serializers.SerializerMethodField()
     lesson_count = serializers.SerializerMethodField()
     quiz_count = serializers.SerializerMethodField()
-    is_enrolled = serializers.SerializerMethodField()
     
     class Meta:
         model = Course
         fields = [
             'id', 'title', 'subtitle', 'description',
             'thumbnail', 'category', 'price',
-            'student_count', 'lesson_count', 'quiz_count', 'sections',
-            'is_enrolled', 'published_at', 'last_updated_at'
+            'lesson_count', 'quiz_count', 'sections',
+            'published_at', 'last_updated_at', 'content_version'
         ]
     
-    def get_student_count(self, obj):
-        return obj.students.count()
-    
     def get_lesson_count(self, obj):
         lesson_count = 0
         for section in obj.sections.all():
@@ -105,6 +104,18 @@ class StudentCourseDetailSerializer(serializers.ModelSerializer):
         for section in obj.sections.all():
             quiz_count += section.quizzes.count()
         return quiz_count
+
+
+class StudentCourseDetailSerializer(StudentCourseContentSerializer):
+    """Serializer hiển thị thông tin chi tiết khóa học cho học viên"""
+    student_count = serializers.SerializerMethodField()
+    is_enrolled = serializers.SerializerMethodField()
+    
+    class Meta(StudentCourseContentSerializer.Meta):
+        fields = StudentCourseContentSerializer.Meta.fields + ['student_count', 'is_enrolled']
+    
+    def get_student_count(self, obj):
+        return obj.students.count()
     
     def get_is_enrolled(self, obj):
         request = self.context.get('request')
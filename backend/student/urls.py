@@ -1,6 +1,5 @@
 from django.urls import path
 from . import views
-from .views import StudentLessonSummarizeView, StudentQuizAIFeedbackView
 
 app_name = 'student'
 
@@ -24,12 +23,18 @@ urlpatterns = [
     path('quiz-history/', views.StudentQuizHistoryListView.as_view(), name='quiz-history'),
     path('quizzes/<int:quiz_id>/history/', views.StudentQuizHistoryByQuizView.as_view(), name='quiz-history-by-quiz'),
 
+    # Bắt đầu làm bài kiểm tra (câu hỏi xáo trộn theo lần làm bài)
+    path('quizzes/<int:quiz_id>/start/', views.StudentQuizStartView.as_view(), name='quiz-start'),
+
+    # Lưu dần câu trả lời trong lúc làm bài
+    path('quiz-attempts/<int:attempt_id>/', views.StudentQuizAttemptAutosaveView.as_view(), name='quiz-attempt-autosave'),
+
     # Nộp bài kiểm tra
     path('quizzes/<int:quiz_id>/submit/', views.StudentQuizSubmitView.as_view(), name='quiz-submit'),
 
     # Tóm tắt bài học
-    path('lessons/<int:lesson_id>/summarize/', StudentLessonSummarizeView.as_view(), name='student-lesson-summarize'),
+    path('lessons/<int:lesson_id>/summarize/', views.student_lesson_summarize, name='student-lesson-summarize'),
 
     # Nhận xét AI cho quiz attempt
-    path('quiz-attempts/<int:quiz_attempt_id>/ai-feedback/', StudentQuizAIFeedbackView.as_view(), name='quiz-attempt-ai-feedback'),
+    path('quiz-attempts/<int:quiz_attempt_id>/ai-feedback/', views.student_quiz_ai_feedback, name='quiz-attempt-ai-feedback'),
 ]
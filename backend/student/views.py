@@ -1,22 +1,40 @@
+from django.conf import settings
+from django.core.cache import caches
 from django.shortcuts import get_object_or_404
 from rest_framework import generics, status, filters
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from django.db.models import Q
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import Q, prefetch_related_objects
+from api.async_views import async_api_view, database_sync_to_async
+from api.db_routers import REPLICA, read_preference
 from user.permissions import IsStudent
-from course.models import Course, Section, Lesson, UserCourse, QuizAttempt, Quiz, Question, Choice
+from course.mixins import ConditionalRetrieveMixin
+from course.models import Course, Section, Lesson, UserCourse, QuizAttempt, Quiz, Question, Choice, AttemptAnswer
 from .serializers import (
     StudentCourseListSerializer, 
     StudentCourseDetailSerializer, 
+    StudentCourseContentSerializer,
     StudentLessonSerializer,
     EnrolledCourseSerializer
 )
 from course.serializers import QuizAttemptSerializer
-from course.utils import extract_lesson_content, get_youtube_transcript, summarize_content_with_ai, generate_quiz_feedback_with_ai
+from course.utils import (
+    aget_youtube_transcript, asummarize_content_with_ai, agenerate_quiz_feedback_with_ai,
+    grade_quiz_answers, get_attempt_result,
+    count_course_items, increment_course_progress, get_enrollment_etag_parts,
+    get_or_build_cached, course_syllabus_prefetches,
+    get_quiz_blob, shuffle_quiz_questions, find_invalid_answers, finalize_quiz_attempts,
+    draw_quiz_questions, get_attempt_blob
+)
 import json
+import secrets
+from datetime import timedelta
 
 
+@read_preference(REPLICA)
 class StudentCourseListView(generics.ListAPIView):
     """
     Danh sách tất cả các khóa học đã xuất bản (dành cho học viên)
@@ -47,7 +65,8 @@ class StudentCourseListView(generics.ListAPIView):
         return queryset.order_by('-published_at')
 
 
-class StudentCourseDetailView(generics.RetrieveAPIView):
+@read_preference(REPLICA)
+class StudentCourseDetailView(ConditionalRetrieveMixin, generics.RetrieveAPIView):
     """
     Chi tiết khóa học (cho học viên)
     Hiển thị thông tin chi tiết khóa học và danh sách các bài giảng
@@ -60,6 +79,34 @@ class StudentCourseDetailView(generics.RetrieveAPIView):
         # Chỉ hiển thị khóa học đã xuất bản
         return get_object_or_404(Course, id=course_id, published=True)
 
+    def get_etag_parts(self, instance, course):
+        # (số học viên, đã đăng ký hay chưa) - dùng lại khi ghép response
+        self.enrollment = get_enrollment_etag_parts(course, self.request.user)
+        return self.enrollment
+
+    def render_content(self, instance):
+        """
+        Phần nội dung chung (dữ liệu đã serialize, không phụ thuộc request) được
+        cache theo (course id, content_version); student_count, is_enrolled của từng
+        request và URL đầy đủ của ảnh bìa được gắn vào, không serialize lại cây.
+        """
+        def build():
+            prefetch_related_objects([instance], *course_syllabus_prefetches(questions=False))
+            # Không truyền request: ảnh bìa là URL tương đối, không gắn với host của request đầu tiên
+            return dict(StudentCourseContentSerializer(instance).data)
+
+        cache_key = f'student_course_data:{instance.id}:v{instance.content_version}'
+        data = get_or_build_cached(
+            caches[settings.COURSE_TREE_CACHE_ALIAS], cache_key, build,
+            timeout=settings.COURSE_TREE_CACHE_TIMEOUT,
+            lock_timeout=settings.COURSE_TREE_CACHE_LOCK_TIMEOUT,
+        )
+        student_count, enrolled = self.enrollment
+        data = {**data, 'student_count': student_count, 'is_enrolled': bool(enrolled)}
+        if data['thumbnail']:
+            data['thumbnail'] = self.request.build_absolute_uri(data['thumbnail'])
+        return Response(data)
+
 
 class StudentEnrollCourseView(APIView):
     """
@@ -70,16 +117,15 @@ class StudentEnrollCourseView(APIView):
     def post(self, request, pk):
         course = get_object_or_404(Course, id=pk, published=True)
         
-        # Kiểm tra xem học viên đã đăng ký khóa học này chưa
-        if UserCourse.objects.filter(user=request.user, course=course).exists():
+        # Đăng ký khóa học mới; get_or_create dựa trên unique (user, course)
+        # nên hai request đồng thời không tạo trùng hay gây lỗi IntegrityError
+        _, created = UserCourse.objects.get_or_create(user=request.user, course=course)
+        if not created:
             return Response(
                 {"detail": "Bạn đã đăng ký khóa học này rồi"}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Đăng ký khóa học mới
-        UserCourse.objects.create(user=request.user, course=course)
-        
         return Response(
             {"detail": "Đăng ký khóa học thành công"}, 
             status=status.HTTP_201_CREATED
@@ -106,7 +152,7 @@ class StudentLessonDetailView(generics.RetrieveAPIView):
     
     def get_object(self):
         lesson_id = self.kwargs['pk']
-        lesson = get_object_or_404(Lesson, id=lesson_id)
+        lesson = get_object_or_404(Lesson.objects.select_related('section__course'), id=lesson_id)
         
         # Kiểm tra xem học viên đã đăng ký khóa học chứa bài giảng này chưa
         course = lesson.section.course
@@ -121,23 +167,16 @@ class StudentLessonDetailView(generics.RetrieveAPIView):
         
         # Cập nhật tiến độ học tập nếu cần (logic đơn giản)
         # Trong thực tế, bạn có thể muốn lưu trữ tiến độ chi tiết hơn cho từng bài giảng
-        course = instance.section.course
-        user_course = UserCourse.objects.get(user=request.user, course=course)
+        course_id = instance.section.course_id
         
         # Logic đơn giản: Tính tổng số bài giảng và tiến độ dựa trên số bài đã xem
         # Logic này sẽ cập nhật tiến độ mỗi khi học viên xem bài giảng
-        total_lessons = 0
-        for section in course.sections.all():
-            total_lessons += section.lessons.count()
+        total_lessons, _ = count_course_items(course_id)
         
         # Trong thực tế, bạn sẽ cần một bảng riêng để theo dõi các bài giảng đã xem
-        # Ở đây chỉ làm đơn giản bằng cách tăng tiến độ mỗi khi xem bài
+        # Ở đây chỉ làm đơn giản bằng cách tăng tiến độ mỗi khi xem bài (UPDATE nguyên tử, tối đa 100)
         if total_lessons > 0:
-            progress_increment = (100 / total_lessons) 
-            # Chỉ cập nhật nếu tiến độ chưa đạt tối đa
-            if user_course.progress < 100:
-                user_course.progress = min(user_course.progress + progress_increment, 100)
-                user_course.save()
+            increment_course_progress(request.user.id, course_id, 100 / total_lessons)
         
         return Response(serializer.data)
 
@@ -150,7 +189,7 @@ class StudentQuizHistoryListView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return QuizAttempt.objects.filter(user=self.request.user)
+        return QuizAttempt.objects.filter(user=self.request.user, status=QuizAttempt.SUBMITTED)
 
 class StudentQuizHistoryByQuizView(APIView):
     """
@@ -159,28 +198,12 @@ class StudentQuizHistoryByQuizView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, quiz_id):
-        attempt = QuizAttempt.objects.filter(user=request.user, quiz_id=quiz_id).order_by('-submitted_at').first()
+        attempt = QuizAttempt.objects.filter(
+            user=request.user, quiz_id=quiz_id, status=QuizAttempt.SUBMITTED
+        ).order_by('-submitted_at').first()
         if not attempt:
             return Response(None)
-        # Lấy quiz và questions
-        quiz = attempt.quiz
-        questions = quiz.questions.all()
-        answers = attempt.answers or {}
-        answer_detail = []
-        correct = 0
-        total = questions.count()
-        for q in questions:
-            qid = str(q.id)
-            selected = answers.get(qid)
-            correct_choice = q.choices.filter(is_correct=True).first()
-            is_correct = str(getattr(correct_choice, 'id', None)) == str(selected)
-            if is_correct:
-                correct += 1
-            answer_detail.append({
-                "question": q.text,
-                "your_choice": selected,
-                "correct_choice": str(getattr(correct_choice, 'id', None)),
-            })
+        correct, total, answer_detail = get_attempt_result(attempt)
         return Response({
             "score": attempt.score,
             "correct": correct,
@@ -191,63 +214,187 @@ class StudentQuizHistoryByQuizView(APIView):
         })
 
 
+class StudentQuizStartView(APIView):
+    """
+    Bắt đầu làm quiz: tạo lần làm bài đang mở (hoặc tiếp tục lần đang mở) và trả về
+    câu hỏi/lựa chọn đã xáo trộn theo seed của lần làm bài, không có đáp án.
+    Dữ liệu quiz đọc từ cache (get_quiz_blob), không serialize lại cho từng học viên.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, quiz_id):
+        quiz = get_object_or_404(Quiz.objects.select_related('section__course'), id=quiz_id)
+        blob = get_quiz_blob(quiz)
+        now = timezone.now()
+
+        # Lần làm bài cũ đã hết giờ thì chốt (bằng câu trả lời đã lưu) trước khi mở lần mới
+        open_attempt = QuizAttempt.objects.filter(
+            user=request.user, quiz=quiz, status=QuizAttempt.IN_PROGRESS
+        ).first()
+        if open_attempt is not None and open_attempt.is_expired(now):
+            finalize_quiz_attempts([open_attempt.id], now=now)
+            open_attempt = None
+
+        created = False
+        if open_attempt is None:
+            # Ràng buộc unique_in_progress_attempt đảm bảo hai request đồng thời
+            # không mở hai lần làm bài cho cùng một quiz
+            deadline = now + timedelta(minutes=quiz.time_limit) if quiz.time_limit else None
+            seed = secrets.randbelow(2 ** 31)
+            open_attempt, created = QuizAttempt.objects.get_or_create(
+                user=request.user,
+                quiz=quiz,
+                status=QuizAttempt.IN_PROGRESS,
+                defaults={
+                    'seed': seed,
+                    # Quiz lấy mẫu từ ngân hàng: lưu id các câu đã rút cho lần làm bài này
+                    'question_ids': draw_quiz_questions(blob, seed),
+                    'started_at': now,
+                    'deadline': deadline,
+                },
+            )
+        attempt = open_attempt
+        questions = get_attempt_blob(blob, attempt)['questions']
+        return Response({
+            "attempt_id": attempt.id,
+            "quiz": quiz.id,
+            "title": quiz.title,
+            "time_limit": quiz.time_limit,
+            "started_at": attempt.started_at,
+            "deadline": attempt.deadline,
+            # Client tính thời gian còn lại theo giờ server, tránh lệch đồng hồ
+            "server_time": now,
+            "answers": attempt.answers,
+            "questions": shuffle_quiz_questions(questions, attempt.seed),
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+
+class StudentQuizAttemptAutosaveView(APIView):
+    """
+    Lưu dần câu trả lời trong lúc làm bài: PATCH {"answers": {question_id: choice_id}}
+    chỉ gửi các câu vừa thay đổi (choice_id = null để bỏ chọn), được gộp vào
+    QuizAttempt.answers. Bị từ chối khi lần làm bài đã nộp hoặc đã hết giờ.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def patch(self, request, attempt_id):
+        answers = request.data.get("answers")
+        if not isinstance(answers, dict):
+            return Response({"detail": "answers phải là dict {question_id: choice_id}"}, status=400)
+
+        attempt = get_object_or_404(
+            QuizAttempt.objects.select_related('quiz__section__course'), id=attempt_id, user=request.user
+        )
+        invalid = find_invalid_answers(answers, get_attempt_blob(get_quiz_blob(attempt.quiz), attempt)['answer_key'])
+        if invalid:
+            return Response(
+                {"detail": "Câu trả lời không thuộc bài kiểm tra này", "invalid_questions": invalid},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        with transaction.atomic():
+            # Khóa dòng để các PATCH song song (nhiều tab) không ghi đè lẫn nhau
+            attempt = QuizAttempt.objects.select_for_update().get(id=attempt.id)
+            if attempt.status != QuizAttempt.IN_PROGRESS:
+                return Response({"detail": "Lần làm bài này đã được nộp"}, status=status.HTTP_409_CONFLICT)
+            if attempt.is_expired():
+                return Response({"detail": "Đã hết thời gian làm bài"}, status=status.HTTP_409_CONFLICT)
+            for question_id, choice_id in answers.items():
+                if choice_id in (None, ''):
+                    attempt.answers.pop(str(question_id), None)
+                else:
+                    attempt.answers[str(question_id)] = str(choice_id)
+            attempt.save(update_fields=['answers'])
+
+        return Response({
+            "attempt_id": attempt.id,
+            "saved": len(answers),
+            "answered": len(attempt.answers),
+            "deadline": attempt.deadline,
+        })
+
+
 class StudentQuizSubmitView(APIView):
     """
-    Học sinh nộp bài kiểm tra, chấm điểm và lưu lịch sử làm bài
+    Học sinh nộp bài kiểm tra, chấm điểm và lưu lịch sử làm bài.
+    Nếu có lần làm bài đang mở (attempt_id hoặc lần đang mở của quiz) thì chốt lần đó.
     """
     permission_classes = [IsAuthenticated]
 
     def post(self, request, quiz_id):
-        quiz = get_object_or_404(Quiz, id=quiz_id)
+        quiz = get_object_or_404(Quiz.objects.select_related('section__course'), id=quiz_id)
         answers = request.data.get("answers", {})  # {question_id: choice_id}
         if not isinstance(answers, dict):
             return Response({"detail": "answers phải là dict {question_id: choice_id}"}, status=400)
 
-        questions = quiz.questions.all()
-        total = questions.count()
-        correct = 0
-        answer_detail = []
-        for q in questions:
-            qid = str(q.id)
-            selected = answers.get(qid)
-            correct_choice = q.choices.filter(is_correct=True).first()
-            is_correct = str(getattr(correct_choice, 'id', None)) == str(selected)
-            if is_correct:
-                correct += 1
-            answer_detail.append({
-                "question": q.text,
-                "your_choice": selected,
-                "correct_choice": str(getattr(correct_choice, 'id', None)),
-            })
-        score = round((correct / total) * 10, 2) if total > 0 else 0
-        # Lưu QuizAttempt
-        attempt = QuizAttempt.objects.create(
-            user=request.user,
-            quiz=quiz,
-            score=score,
-            correct_count=correct,
-            total_count=total,
-            answers=answers
-        )
+        attempt_id = request.data.get("attempt_id")
+        open_attempts = QuizAttempt.objects.filter(user=request.user, quiz=quiz, status=QuizAttempt.IN_PROGRESS)
+        if attempt_id is not None:
+            attempt = open_attempts.filter(id=attempt_id).first()
+            if attempt is None:
+                return Response(
+                    {"detail": "Lần làm bài không tồn tại hoặc đã được nộp"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        else:
+            attempt = open_attempts.first()
+
+        blob = get_quiz_blob(quiz)
+        if attempt is not None:
+            answer_key = get_attempt_blob(blob, attempt)['answer_key']
+        elif blob.get('rules') or quiz.time_limit:
+            # Câu hỏi được rút riêng cho từng lần làm bài, hoặc quiz tính giờ từ lúc bắt đầu:
+            # phải bắt đầu qua API start (không thì nộp bài không có deadline)
+            return Response(
+                {"detail": "Bài kiểm tra này cần được bắt đầu trước khi nộp"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        else:
+            answer_key = blob['answer_key']
+        invalid = find_invalid_answers(answers, answer_key)
+        if invalid:
+            return Response(
+                {"detail": "Câu trả lời không thuộc bài kiểm tra này", "invalid_questions": invalid},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if attempt is not None:
+            # Quá giờ: chỉ chấm phần đã autosave; còn hạn thì gộp với câu trả lời gửi kèm
+            answers = dict(attempt.answers) if attempt.is_expired() else {
+                **attempt.answers, **{str(k): v for k, v in answers.items()}
+            }
 
-        # --- Update progress after quiz submission ---
-        course = quiz.section.course
-        user_course = UserCourse.objects.get(user=request.user, course=course)
-        # Count total lessons and quizzes
-        total_lessons = 0
-        total_quizzes = 0
-        for section in course.sections.all():
-            total_lessons += section.lessons.count()
-            total_quizzes += section.quizzes.count()
+        correct, total, answer_detail, answer_rows = grade_quiz_answers(answers, answer_key)
+        score = round((correct / total) * 10, 2) if total > 0 else 0
+        total_lessons, total_quizzes = count_course_items(quiz.section.course_id)
         total_items = total_lessons + total_quizzes
-        # Count completed lessons and quizzes (simple: +1 for this quiz if not already counted)
-        # For real tracking, should have a table for completed lessons/quizzes per user
-        # Here, just increment progress if not 100%
-        if total_items > 0 and user_course.progress < 100:
-            progress_increment = 100 / total_items
-            user_course.progress = min(user_course.progress + progress_increment, 100)
-            user_course.save()
-        # --- End update progress ---
+        result = dict(score=score, correct_count=correct, total_count=total, answers=answers)
+
+        with transaction.atomic():
+            # Lưu QuizAttempt
+            if attempt is None:
+                attempt = QuizAttempt.objects.create(
+                    user=request.user, quiz=quiz, submitted_at=timezone.now(), **result
+                )
+            else:
+                # Chỉ chốt được khi vẫn đang mở: hai lần nộp đồng thời chỉ một lần thành công
+                finalized = QuizAttempt.objects.filter(
+                    id=attempt.id, status=QuizAttempt.IN_PROGRESS
+                ).update(status=QuizAttempt.SUBMITTED, submitted_at=timezone.now(), **result)
+                if not finalized:
+                    return Response(
+                        {"detail": "Lần làm bài này đã được nộp"},
+                        status=status.HTTP_409_CONFLICT
+                    )
+            for row in answer_rows:
+                row.attempt = attempt
+            AttemptAnswer.objects.bulk_create(answer_rows)
+
+            # --- Update progress after quiz submission ---
+            # For real tracking, should have a table for completed lessons/quizzes per user
+            # Here, just increment progress (atomic UPDATE with F(), capped at 100%)
+            if total_items > 0:
+                increment_course_progress(request.user.id, quiz.section.course_id, 100 / total_items)
+            # --- End update progress ---
 
         return Response({
             "score": score,
@@ -258,93 +405,75 @@ class StudentQuizSubmitView(APIView):
         })
 
 
-class StudentLessonSummarizeView(APIView):
+@async_api_view(['POST'], permission_classes=[IsAuthenticated])
+async def student_lesson_summarize(request, lesson_id):
     """
     API: POST /student/lessons/<lesson_id>/summarize/
     Tóm tắt nội dung bài học (text + phụ đề video nếu có)
     """
-    permission_classes = [IsAuthenticated]
+    lesson = await database_sync_to_async(get_object_or_404)(
+        Lesson.objects.select_related('section'), id=lesson_id)
+    # Check permission: must be enrolled
+    enrolled = UserCourse.objects.filter(user=request.user, course_id=lesson.section.course_id)
+    if not await database_sync_to_async(enrolled.exists)():
+        return Response({"detail": "Bạn chưa đăng ký khóa học này"}, status=403)
+    # Gather content
+    content = lesson.content or ""
+    transcript = await aget_youtube_transcript(lesson.video_url) if lesson.video_url else ""
+    content_ok = content and len(content.strip()) > 100
+    transcript_ok = transcript and len(transcript.strip()) > 100
+    if not content_ok and not transcript_ok:
+        return Response({"detail": "Nội dung bài học và phụ đề video không đủ để tóm tắt (cần > 100 ký tự)."}, status=400)
+    # Ưu tiên content, nếu có transcript thì nối vào
+    full_content = ""
+    if content_ok:
+        full_content += content.strip()
+    if transcript_ok:
+        if full_content:
+            full_content += "\n\n--- Phụ đề video ---\n\n"
+        full_content += transcript.strip()
+    # Gọi AI
+    summary = await asummarize_content_with_ai(full_content)
+    if not summary:
+        return Response({"detail": "Không thể tóm tắt nội dung. Vui lòng thử lại sau."}, status=500)
+    return Response({"summary": summary})
 
-    def post(self, request, lesson_id):
-        from course.models import Lesson
-        lesson = get_object_or_404(Lesson, id=lesson_id)
-        # Check permission: must be enrolled
-        course = lesson.section.course
-        if not UserCourse.objects.filter(user=request.user, course=course).exists():
-            return Response({"detail": "Bạn chưa đăng ký khóa học này"}, status=403)
-        # Gather content
-        content = lesson.content or ""
-        transcript = get_youtube_transcript(lesson.video_url) if lesson.video_url else ""
-        content_ok = content and len(content.strip()) > 100
-        transcript_ok = transcript and len(transcript.strip()) > 100
-        if not content_ok and not transcript_ok:
-            return Response({"detail": "Nội dung bài học và phụ đề video không đủ để tóm tắt (cần > 100 ký tự)."}, status=400)
-        # Ưu tiên content, nếu có transcript thì nối vào
-        full_content = ""
-        if content_ok:
-            full_content += content.strip()
-        if transcript_ok:
-            if full_content:
-                full_content += "\n\n--- Phụ đề video ---\n\n"
-            full_content += transcript.strip()
-        # Gọi AI
-        summary = summarize_content_with_ai(full_content)
-        if not summary:
-            return Response({"detail": "Không thể tóm tắt nội dung. Vui lòng thử lại sau."}, status=500)
-        return Response({"summary": summary})
-
-class StudentQuizAIFeedbackView(APIView):
+
+@async_api_view(['POST'], permission_classes=[IsAuthenticated])
+async def student_quiz_ai_feedback(request, quiz_attempt_id):
     """
     Nhận xét AI cho kết quả làm bài quiz của học sinh
     POST /student/quiz-attempts/<int:quiz_attempt_id>/ai-feedback/
     """
-    permission_classes = [IsAuthenticated]
-
-    def post(self, request, quiz_attempt_id):
-        # Lấy QuizAttempt theo id
-        attempt = get_object_or_404(QuizAttempt, id=quiz_attempt_id, user=request.user)
-        # Lấy dữ liệu kết quả quiz
-        quiz = attempt.quiz
-        questions = quiz.questions.all()
-        answers = attempt.answers or {}
-        answer_detail = []
-        correct = 0
-        total = questions.count()
-        for q in questions:
-            qid = str(q.id)
-            selected = answers.get(qid)
-            correct_choice = q.choices.filter(is_correct=True).first()
-            is_correct = str(getattr(correct_choice, 'id', None)) == str(selected)
-            if is_correct:
-                correct += 1
-            answer_detail.append({
-                "question": q.text,
-                "your_choice": selected,
-                "correct_choice": str(getattr(correct_choice, 'id', None)),
-            })
-        quiz_result = {
-            "score": attempt.score,
-            "correct": correct,
-            "total": total,
-            "answers": answer_detail,
-            "attempt_id": attempt.id,
-            "submitted_at": str(attempt.submitted_at)
-        }
-        # Prompt mẫu
-        prompt = (
-            "Bạn là một trợ lý học tập. Hãy đánh giá kết quả bài kiểm tra trắc nghiệm của học sinh và đưa ra phản hồi chi tiết.\n\n"
-            "Yêu cầu:\n"
-            "1. Đưa ra **điểm mạnh** của học sinh: nêu rõ các phần kiến thức hoặc dạng câu hỏi học sinh làm tốt.\n"
-            "2. Chỉ ra **kiến thức hoặc kỹ năng học sinh cần cải thiện**: liệt kê các chủ đề hoặc dạng câu hỏi mà học sinh làm sai hoặc còn yếu.\n"
-            "3. Gợi ý **hướng học tập tiếp theo** để cải thiện kết quả trong tương lai (ngắn gọn).\n\n"
-            "**Yêu cầu định dạng:**\n"
-            "- Trả về kết quả ở dạng markdown, sử dụng tiêu đề, danh sách, in đậm, in nghiêng, bảng nếu cần.\n"
-            "- Không giải thích thêm, chỉ trả về markdown, 3 yêu cầu in đậm, từ khóa in nghiêng, có đánh số.\n\n"
-            "Thông tin đầu vào: kết quả bài kiểm tra sau:\n"
-            f"{json.dumps(quiz_result, ensure_ascii=False, indent=2)}"
-        )
-        # Gọi AI
-        feedback = generate_quiz_feedback_with_ai(prompt)
-        if not feedback:
-            return Response({"detail": "Không thể tạo nhận xét AI. Vui lòng thử lại sau."}, status=500)
-        return Response({"feedback": feedback})
+    # Lấy QuizAttempt theo id
+    attempt = await database_sync_to_async(get_object_or_404)(
+        QuizAttempt, id=quiz_attempt_id, user=request.user, status=QuizAttempt.SUBMITTED
+    )
+    # Lấy dữ liệu kết quả quiz
+    correct, total, answer_detail = await database_sync_to_async(get_attempt_result)(attempt)
+    quiz_result = {
+        "score": attempt.score,
+        "correct": correct,
+        "total": total,
+        "answers": answer_detail,
+        "attempt_id": attempt.id,
+        "submitted_at": str(attempt.submitted_at)
+    }
+    # Prompt mẫu
+    prompt = (
+        "Bạn là một trợ lý học tập. Hãy đánh giá kết quả bài kiểm tra trắc nghiệm của học sinh và đưa ra phản hồi chi tiết.\n\n"
+        "Yêu cầu:\n"
+        "1. Đưa ra **điểm mạnh** của học sinh: nêu rõ các phần kiến thức hoặc dạng câu hỏi học sinh làm tốt.\n"
+        "2. Chỉ ra **kiến thức hoặc kỹ năng học sinh cần cải thiện**: liệt kê các chủ đề hoặc dạng câu hỏi mà học sinh làm sai hoặc còn yếu.\n"
+        "3. Gợi ý **hướng học tập tiếp theo** để cải thiện kết quả trong tương lai (ngắn gọn).\n\n"
+        "**Yêu cầu định dạng:**\n"
+        "- Trả về kết quả ở dạng markdown, sử dụng tiêu đề, danh sách, in đậm, in nghiêng, bảng nếu cần.\n"
+        "- Không giải thích thêm, chỉ trả về markdown, 3 yêu cầu in đậm, từ khóa in nghiêng, có đánh số.\n\n"
+        "Thông tin đầu vào: kết quả bài kiểm tra sau:\n"
+        f"{json.dumps(quiz_result, ensure_ascii=False, indent=2)}"
+    )
+    # Gọi AI
+    feedback = await agenerate_quiz_feedback_with_ai(prompt)
+    if not feedback:
+        return Response({"detail": "Không thể tạo nhận xét AI. Vui lòng thử lại sau."}, status=500)
+    return Response({"feedback": feedback})
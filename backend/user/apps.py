@@ -7,3 +7,4 @@ class UserConfig(AppConfig):
     
     def ready(self):
         import user.signals  # Register signals
+        import user.checks  # Register system checks
@@ -0,0 +1,103 @@
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import ClaimsUser, UserProfile
+from .permissions import UserRole, get_user_role
+
+
+class ProfileJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that loads the user together with its profile in a single
+    query and resolves the user's role once for the whole request.
+    """
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = self.user_model.objects.select_related('profile').get(
+                **{api_settings.USER_ID_FIELD: user_id}
+            )
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        get_user_role(user)
+        return user
+
+
+class ClaimsJWTAuthentication(ProfileJWTAuthentication):
+    """
+    Stateless mode: with safe methods (GET/HEAD/OPTIONS) the user and role are
+    built from the token claims (user_type, is_staff, profile_version) with no
+    DB query. Writes, tokens without claims, or tokens whose profile_version is
+    stale go through the normal DB lookup.
+
+    profile_version is bumped when the role, is_active, is_staff, is_superuser
+    or the password changes (see user.signals), so CHECK_USER_IS_ACTIVE and
+    CHECK_REVOKE_TOKEN are enforced by the DB lookup for any token issued
+    before the change. Requires a cache shared by all workers (check user.E001).
+    """
+    CLAIM_FIELDS = ('username', 'user_type', 'is_staff', 'is_superuser', 'is_active', 'profile_version')
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+
+        if request.method in SAFE_METHODS:
+            user = self.get_user_from_claims(validated_token)
+            if user is not None:
+                return user, validated_token
+
+        return self.get_user(validated_token), validated_token
+
+    def get_user_from_claims(self, validated_token):
+        if any(claim not in validated_token for claim in self.CLAIM_FIELDS):
+            return None
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not validated_token['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if UserProfile.get_version(user_id) != validated_token['profile_version']:
+            return None
+
+        known = {
+            api_settings.USER_ID_FIELD: user_id,
+            'username': validated_token['username'],
+            'is_staff': validated_token['is_staff'],
+            'is_superuser': validated_token['is_superuser'],
+            'is_active': validated_token['is_active'],
+        }
+        # from_db nhận giá trị theo thứ tự các field của model
+        field_names = [f.attname for f in ClaimsUser._meta.concrete_fields if f.attname in known]
+        user = ClaimsUser.from_db(DEFAULT_DB_ALIAS, field_names, [known[name] for name in field_names])
+        user._role = UserRole(validated_token['user_type'], validated_token['is_staff'])
+        return user
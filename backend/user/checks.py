@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+from api.checks import is_local_cache
+
+
+@register(Tags.security, Tags.caches)
+def check_stateless_auth_cache(app_configs, **kwargs):
+    """
+    JWT_STATELESS_AUTH vô hiệu hóa claims cũ qua UserProfile.version được cache trong cache
+    'default'. Cache riêng của từng process không thấy lần tăng version ở worker khác, nên token
+    của user đã bị khóa/hạ quyền vẫn được tin tới khi cache hết hạn.
+    """
+    if getattr(settings, 'JWT_STATELESS_AUTH', False) and is_local_cache('default'):
+        return [Error(
+            "JWT_STATELESS_AUTH requires a cache shared by all workers.",
+            hint="Set CACHE_BACKEND to Redis, Memcached or DatabaseCache, or disable JWT_STATELESS_AUTH.",
+            id='user.E001',
+        )]
+    return []
@@ -0,0 +1,42 @@
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from user.utils import read_users_csv, bulk_create_users, CSV_FIELDS
+
+
+class Command(BaseCommand):
+    help = f"Bulk import users from a CSV file with columns: {','.join(CSV_FIELDS)}"
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='Path to the CSV file')
+        parser.add_argument('--default-password', default=None,
+                            help='Password for rows without one (hashed once for the whole file)')
+        parser.add_argument('--user-type', default='student',
+                            help='Role for rows without user_type (default: student)')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['default_password']:
+            try:
+                validate_password(options['default_password'])
+            except ValidationError as e:
+                raise CommandError(f"Invalid --default-password: {' '.join(e.messages)}")
+        try:
+            with open(options['csv_file'], encoding='utf-8-sig', newline='') as f:
+                rows = read_users_csv(f)
+        except OSError as e:
+            raise CommandError(f"Cannot read {options['csv_file']}: {e}")
+
+        self.stdout.write(self.style.NOTICE(f"Importing {len(rows)} users..."))
+        result = bulk_create_users(
+            rows,
+            default_password=options['default_password'],
+            default_user_type=options['user_type'],
+            batch_size=options['batch_size'],
+        )
+
+        for error in result['errors']:
+            self.stdout.write(self.style.WARNING(
+                f"Row {error['row']} ({error['username']}): {error['error']}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Created {len(result['created'])} users, {len(result['errors'])} rows skipped"))
@@ -1,7 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.contrib.auth.models import User
-from user.models.user_profile import UserProfile
+from user.utils import create_user_with_profile
 
 class Command(BaseCommand):
     help = 'Seeds the database with users (admin, teachers, students)'
@@ -24,25 +24,16 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.WARNING(f"User {username} already exists. Skipping..."))
                 return User.objects.get(username=username)
             
-            # Create user
-            user = User.objects.create_user(
+            # Create user (profile được tạo cùng lúc với vai trò đúng)
+            user = create_user_with_profile(
                 username=username,
                 password=password,
                 email=email,
                 first_name=first_name,
-                last_name=last_name
+                last_name=last_name,
+                user_type=user_type
             )
             
-            # Create or update profile
-            profile, created = UserProfile.objects.get_or_create(
-                user=user,
-                defaults={'user_type': user_type}
-            )
-            
-            if not created:
-                profile.user_type = user_type
-                profile.save()
-            
             self.stdout.write(self.style.SUCCESS(f"Created user: {username} ({user_type})"))
             return user
         except Exception as e:
@@ -1 +1,3 @@
 # This file makes the models directory a Python package
+from .user_profile import UserProfile
+from .claims_user import ClaimsUser
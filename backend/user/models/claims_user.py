@@ -0,0 +1,16 @@
+from django.contrib.auth.models import User
+
+
+class ClaimsUser(User):
+    """
+    User dựng từ claims của access token (không truy vấn DB).
+    Các field không có trong token được nạp lười, tất cả trong một truy vấn.
+    """
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred_fields = self.get_deferred_fields()
+        if fields is not None and deferred_fields.issuperset(fields):
+            fields = list(deferred_fields)
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
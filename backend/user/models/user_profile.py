@@ -1,5 +1,15 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
+from django.core.cache import cache
+
+
+PROFILE_VERSION_CACHE_TIMEOUT = 60 * 60
+
+
+def profile_version_cache_key(user_id):
+    return f'profile_version:{user_id}'
+
 
 class UserProfile(models.Model):
     USER_TYPE_CHOICES = (
@@ -15,6 +25,45 @@ class UserProfile(models.Model):
     date_of_birth = models.DateField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Tăng mỗi khi vai trò hoặc quyền của User thay đổi, dùng để vô hiệu hóa claims trong JWT cũ
+    version = models.PositiveIntegerField(default=1)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_user_type = instance.__dict__.get('user_type')
+        return instance
+
+    def save(self, *args, **kwargs):
+        loaded_user_type = getattr(self, '_loaded_user_type', None)
+        if self.pk and loaded_user_type is not None and loaded_user_type != self.user_type:
+            self.version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
+        self._loaded_user_type = self.user_type
+        cache.set(profile_version_cache_key(self.user_id), self.version, PROFILE_VERSION_CACHE_TIMEOUT)
+
+    @classmethod
+    def bump_version(cls, user_id):
+        """Tăng phiên bản khi quyền của User thay đổi (khóa tài khoản, staff, đổi mật khẩu...)"""
+        cls.objects.filter(user_id=user_id).update(version=F('version') + 1)
+        key = profile_version_cache_key(user_id)
+        cache.delete(key)
+        # Request khác có thể đã cache lại version cũ trước khi transaction commit
+        transaction.on_commit(lambda: cache.delete(key))
+
+    @classmethod
+    def get_version(cls, user_id):
+        """Phiên bản profile hiện tại, đọc từ cache trước rồi mới tới DB"""
+        key = profile_version_cache_key(user_id)
+        version = cache.get(key)
+        if version is None:
+            version = cls.objects.filter(user_id=user_id).values_list('version', flat=True).first()
+            if version is None:
+                return None
+            cache.set(key, version, PROFILE_VERSION_CACHE_TIMEOUT)
+        return version
 
     def __str__(self):
         return f"{self.user.username} ({self.get_user_type_display()})"
@@ -1,5 +1,56 @@
+from django.core.exceptions import ObjectDoesNotExist
 from rest_framework.permissions import BasePermission
 
+
+class UserRole:
+    """
+    Vai trò của người dùng, được tính một lần cho mỗi request và lưu trên đối tượng user.
+    """
+    __slots__ = ('user_type', 'is_staff')
+
+    def __init__(self, user_type=None, is_staff=False):
+        self.user_type = user_type
+        self.is_staff = is_staff
+
+    @property
+    def is_teacher(self):
+        return self.user_type == 'teacher'
+
+    @property
+    def is_student(self):
+        return self.user_type == 'student'
+
+    @property
+    def is_teacher_or_admin(self):
+        return self.is_staff or self.user_type in ('teacher', 'admin')
+
+
+ANONYMOUS_ROLE = UserRole()
+
+
+def get_user_role(user):
+    """
+    Trả về UserRole của user. Profile chỉ được đọc lần đầu (ProfileJWTAuthentication
+    đã select_related sẵn), các lần gọi sau trong cùng request dùng lại kết quả.
+    """
+    if not (user and user.is_authenticated):
+        return ANONYMOUS_ROLE
+    role = getattr(user, '_role', None)
+    if role is None:
+        try:
+            user_type = user.profile.user_type
+        except (AttributeError, ObjectDoesNotExist):
+            user_type = None
+        role = UserRole(user_type, user.is_staff)
+        user._role = role
+    return role
+
+
+def can_manage_course(user, course):
+    """Creator của khóa học, giáo viên hoặc admin mới được chỉnh sửa khóa học"""
+    return user.is_authenticated and (course.creator_id == user.id or get_user_role(user).is_teacher_or_admin)
+
+
 class IsTeacherOrAdmin(BasePermission):
     """
     Custom permission to allow only teachers and admins to access.
@@ -7,16 +58,8 @@ class IsTeacherOrAdmin(BasePermission):
     def has_permission(self, request, view):
         if not (request.user and request.user.is_authenticated):
             return False
-        
-        # Check if user is staff (admin)
-        if request.user.is_staff:
-            return True
-            
-        # Check if user has profile and is teacher or admin
-        try:
-            return hasattr(request.user, 'profile') and request.user.profile.user_type in ['teacher', 'admin']
-        except AttributeError:
-            return False
+
+        return get_user_role(request.user).is_teacher_or_admin
 
 class IsTeacher(BasePermission):
     """
@@ -25,12 +68,8 @@ class IsTeacher(BasePermission):
     def has_permission(self, request, view):
         if not (request.user and request.user.is_authenticated):
             return False
-            
-        # Check if user has profile and is teacher
-        try:
-            return hasattr(request.user, 'profile') and request.user.profile.user_type == 'teacher'
-        except AttributeError:
-            return False
+
+        return get_user_role(request.user).is_teacher
 
 class IsStudent(BasePermission):
     """
@@ -39,37 +78,17 @@ class IsStudent(BasePermission):
     def has_permission(self, request, view):
         if not (request.user and request.user.is_authenticated):
             return False
-            
-        # Check if user has profile and is student
-        try:
-            return hasattr(request.user, 'profile') and request.user.profile.user_type == 'student'
-        except AttributeError:
-            return False
+
+        return get_user_role(request.user).is_student
 
 class IsOwnerOrAdminOrTeacher(BasePermission):
     """
     Custom permission to allow only the user themselves, admin or teacher to access their data.
     """
     def has_object_permission(self, request, view, obj):
-        # Check if the object has a user attribute
-        if hasattr(obj, 'user'):
-            # For objects with user attribute (like Profile)
-            return bool(
-                request.user and
-                request.user.is_authenticated and
-                (
-                    obj.user == request.user or
-                    request.user.is_staff or
-                    request.user.profile.user_type in ['teacher', 'admin']
-                )
-            )
-        # For User objects
-        return bool(
-            request.user and
-            request.user.is_authenticated and
-            (
-                obj == request.user or
-                request.user.is_staff or
-                request.user.profile.user_type in ['teacher', 'admin']
-            )
-        )
+        if not (request.user and request.user.is_authenticated):
+            return False
+
+        # For objects with user attribute (like Profile), otherwise User objects
+        owner_id = obj.user_id if hasattr(obj, 'user_id') else obj.pk
+        return owner_id == request.user.pk or get_user_role(request.user).is_teacher_or_admin
@@ -2,9 +2,11 @@ from django.contrib.auth.models import User
 from rest_framework import serializers
 from .models.user_profile import UserProfile
 from django.contrib.auth import authenticate
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
 from django.contrib.auth.password_validation import validate_password
 from rest_framework.exceptions import ValidationError
+from .tokens import RoleRefreshToken
+from .utils import create_user_with_profile
 
 class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
@@ -14,7 +16,7 @@ class UserProfileSerializer(serializers.ModelSerializer):
 class UserRegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
     password2 = serializers.CharField(write_only=True, required=True)
-    user_type = serializers.ChoiceField(choices=UserProfile.USER_TYPE_CHOICES, required=True)
+    user_type = serializers.ChoiceField(source='profile.user_type', choices=UserProfile.USER_TYPE_CHOICES, required=True)
 
     class Meta:
         model = User
@@ -31,11 +33,9 @@ class UserRegisterSerializer(serializers.ModelSerializer):
         return attrs
 
     def create(self, validated_data):
-        user_type = validated_data.pop('user_type')
+        user_type = validated_data.pop('profile')['user_type']
         validated_data.pop('password2')
-        user = User.objects.create_user(**validated_data)
-        UserProfile.objects.create(user=user, user_type=user_type)
-        return user
+        return create_user_with_profile(user_type=user_type, **validated_data)
 
 class LoginSerializer(serializers.Serializer):
     username = serializers.CharField()
@@ -57,7 +57,7 @@ class LoginSerializer(serializers.Serializer):
                 # Nếu không, tạo một hồ sơ mới với vai trò mặc định là 'student'
                 UserProfile.objects.create(user=user, user_type='student')
                 
-            tokens = RefreshToken.for_user(user)
+            tokens = RoleRefreshToken.for_user(user)
             return {
                 'user': user,
                 'refresh': str(tokens),
@@ -101,3 +101,13 @@ class PasswordResetConfirmSerializer(serializers.Serializer):
         if attrs['new_password'] != attrs['confirm_password']:
             raise serializers.ValidationError({"new_password": "Mật khẩu mới không khớp."})
         return attrs
+
+
+class UserBulkImportSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    default_password = serializers.CharField(required=False, allow_blank=True, validators=[validate_password])
+    default_user_type = serializers.ChoiceField(choices=UserProfile.USER_TYPE_CHOICES, default='student')
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """Làm mới token và gắn lại claims vai trò mới nhất"""
+    token_class = RoleRefreshToken
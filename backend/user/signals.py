@@ -1,22 +1,46 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_init, post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from .models.user_profile import UserProfile
 
 @receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    """Create a UserProfile whenever a new User is created."""
-    if created:
-        UserProfile.objects.create(user=instance, user_type='student')
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    """
+    Điểm tạo UserProfile duy nhất: chỉ chạy khi User mới được tạo, không ghi gì
+    khi User được cập nhật (ví dụ last_login). Vai trò lấy từ instance._profile_user_type
+    (xem user.utils.create_user_with_profile), mặc định là 'student'.
+    bulk_create không gửi post_save nên user.utils.bulk_create_users tự tạo profile.
+    """
+    if created and not raw:
+        UserProfile.objects.create(
+            user=instance,
+            user_type=getattr(instance, '_profile_user_type', 'student')
+        )
+
+
+# Các field của User được tin theo claims trong token (xem ClaimsJWTAuthentication)
+AUTH_STATE_FIELDS = ('is_active', 'is_staff', 'is_superuser', 'password')
+
+
+def _auth_state(user):
+    return tuple(user.__dict__.get(field) for field in AUTH_STATE_FIELDS)
+
+
+@receiver(post_init, sender=User)
+def remember_auth_state(sender, instance, **kwargs):
+    instance._loaded_auth_state = _auth_state(instance)
+
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    """Update the UserProfile whenever User is updated."""
-    # Get or create profile if it doesn't exist
-    profile, created = UserProfile.objects.get_or_create(
-        user=instance,
-        defaults={'user_type': 'student'}
-    )
-    
-    if not created:
-        profile.save()
+def bump_profile_version(sender, instance, created, raw=False, **kwargs):
+    """
+    Khóa tài khoản, đổi quyền staff/superuser hay đổi mật khẩu làm claims trong các token
+    đã cấp hết hiệu lực: tăng UserProfile.version để các request sau đi qua DB.
+    """
+    state = _auth_state(instance)
+    if not created and not raw and state != getattr(instance, '_loaded_auth_state', state):
+        UserProfile.bump_version(instance.pk)
+        if 'profile' in instance._state.fields_cache:
+            # Profile đã nạp sẵn: tránh save() sau đó ghi đè version cũ
+            instance.profile.refresh_from_db(fields=['version'])
+    instance._loaded_auth_state = state
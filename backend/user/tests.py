@@ -1,3 +1,134 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .authentication import ClaimsJWTAuthentication
+from .checks import check_stateless_auth_cache
+from .models import ClaimsUser, UserProfile
+from .tokens import RoleRefreshToken
+from .utils import bulk_create_users, create_user_with_profile
+
+
+class ClaimsJWTAuthenticationTests(TestCase):
+    """Xác thực theo claims: token cũ hết hiệu lực khi quyền của user thay đổi"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user_with_profile('claims_teacher', 'pass12345', user_type='teacher')
+
+    def authenticate(self, method='get', token=None):
+        token = token or RoleRefreshToken.for_user(self.user).access_token
+        request = getattr(RequestFactory(), method)('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return ClaimsJWTAuthentication().authenticate(request)[0]
+
+    def test_safe_request_uses_claims_without_queries(self):
+        token = RoleRefreshToken.for_user(self.user).access_token
+        self.authenticate(token=token)  # nạp version vào cache
+        with self.assertNumQueries(0):
+            user = self.authenticate(token=token)
+        self.assertIsInstance(user, ClaimsUser)
+        self.assertEqual((user.pk, user.is_active, user.is_staff), (self.user.pk, True, False))
+
+    def test_deactivated_user_is_rejected(self):
+        token = RoleRefreshToken.for_user(self.user).access_token
+        self.authenticate(token=token)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token=token)
+
+    def test_staff_change_invalidates_claims(self):
+        token = RoleRefreshToken.for_user(self.user).access_token
+        version = UserProfile.get_version(self.user.pk)
+        self.user.is_staff = True
+        self.user.save(update_fields=['is_staff'])
+        self.assertEqual(UserProfile.get_version(self.user.pk), version + 1)
+        user = self.authenticate(token=token)
+        self.assertNotIsInstance(user, ClaimsUser)
+        self.assertTrue(user.is_staff)
+
+    def test_unrelated_update_keeps_version(self):
+        version = UserProfile.get_version(self.user.pk)
+        self.user.first_name = 'An'
+        self.user.save()
+        self.assertEqual(UserProfile.get_version(self.user.pk), version)
+
+    @mock.patch.object(jwt_settings, 'CHECK_REVOKE_TOKEN', True)
+    def test_password_change_revokes_token(self):
+        token = RoleRefreshToken.for_user(self.user).access_token
+        self.authenticate(token=token)
+        self.user.set_password('new-pass-123')
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token=token)
+
+    def test_inactive_claim_is_rejected(self):
+        token = RoleRefreshToken.for_user(self.user).access_token
+        token['is_active'] = False
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token=token)
+
+    @override_settings(JWT_STATELESS_AUTH=True)
+    def test_stateless_auth_requires_shared_cache(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([e.id for e in check_stateless_auth_cache(None)], ['user.E001'])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache'}}):
+            self.assertEqual(check_stateless_auth_cache(None), [])
+
+
+class BulkCreateUsersTests(TestCase):
+    """Import người dùng hàng loạt: kiểm tra mật khẩu, username trùng và tạo trùng đồng thời"""
+
+    def test_creates_users_with_profiles(self):
+        result = bulk_create_users([
+            {'username': 'an', 'password': 'Str0ng-pass-1'},
+            {'username': 'binh', 'user_type': 'teacher'},
+        ], default_password='Str0ng-pass-2')
+        self.assertEqual(result, {'created': ['an', 'binh'], 'errors': []})
+        self.assertTrue(User.objects.get(username='an').check_password('Str0ng-pass-1'))
+        self.assertTrue(User.objects.get(username='binh').check_password('Str0ng-pass-2'))
+        self.assertEqual(UserProfile.objects.get(user__username='binh').user_type, 'teacher')
+
+    def test_weak_csv_password_is_rejected(self):
+        result = bulk_create_users([
+            {'username': 'an', 'password': '123'},
+            {'username': 'binh', 'password': 'password'},
+            {'username': 'chi', 'password': 'Str0ng-pass-1'},
+        ])
+        self.assertEqual(result['created'], ['chi'])
+        self.assertEqual([(e['row'], e['username']) for e in result['errors']], [(1, 'an'), (2, 'binh')])
+        self.assertFalse(User.objects.filter(username__in=['an', 'binh']).exists())
+
+    def test_existing_username_is_skipped(self):
+        create_user_with_profile('an', 'pw')
+        result = bulk_create_users([{'username': 'an'}, {'username': 'binh'}])
+        self.assertEqual(result['created'], ['binh'])
+        self.assertEqual(result['errors'], [{'row': 1, 'username': 'an', 'error': 'Username đã tồn tại'}])
+
+    def test_username_created_concurrently_is_reported(self):
+        real_filter = User.objects.filter
+        raced = []
+
+        def filter_after_race(*args, **kwargs):
+            if not raced:
+                # Request khác tạo 'an' ngay sau lần kiểm tra tồn tại
+                raced.append(True)
+                queryset = real_filter(pk__in=[])
+                create_user_with_profile('an', 'pw')
+                return queryset
+            return real_filter(*args, **kwargs)
+
+        with mock.patch.object(User.objects, 'filter', side_effect=filter_after_race):
+            result = bulk_create_users([{'username': 'an'}, {'username': 'binh'}])
+        self.assertEqual(result['created'], ['binh'])
+        self.assertEqual(result['errors'], [{'row': 1, 'username': 'an', 'error': 'Username đã tồn tại'}])
+        self.assertEqual(UserProfile.objects.get(user__username='binh').user_type, 'student')
+
+    def test_command_rejects_weak_default_password(self):
+        with self.assertRaises(CommandError):
+            call_command('import_users', '/nonexistent.csv', default_password='123')
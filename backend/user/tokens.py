@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .permissions import get_user_role
+
+
+def add_role_claims(token, user):
+    """Gắn vai trò của user vào token để các request đọc không cần truy vấn DB"""
+    profile = getattr(user, 'profile', None)
+    token['username'] = user.get_username()
+    token['user_type'] = get_user_role(user).user_type
+    token['is_staff'] = user.is_staff
+    token['is_superuser'] = user.is_superuser
+    token['is_active'] = user.is_active
+    token['profile_version'] = profile.version if profile is not None else None
+    return token
+
+
+class RoleRefreshToken(RefreshToken):
+    """
+    Refresh token mang theo claims vai trò. Access token sinh ra từ nó luôn
+    được gắn lại claims mới nhất, nên khi làm mới token vai trò cũng được cập nhật.
+    """
+    @classmethod
+    def for_user(cls, user):
+        return add_role_claims(super().for_user(user), user)
+
+    @property
+    def access_token(self):
+        access = super().access_token
+        user = (
+            User.objects.select_related('profile')
+            .filter(**{api_settings.USER_ID_FIELD: self[api_settings.USER_ID_CLAIM]})
+            .first()
+        )
+        if user is not None:
+            add_role_claims(access, user)
+        return access
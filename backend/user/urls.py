@@ -2,7 +2,8 @@ from django.urls import path
 from .views import (
     RegisterView, LoginView, LogoutView, ProfileView,
     ChangePasswordView, PasswordResetRequestView, 
-    PasswordResetConfirmView, UserListView, AvatarUploadView
+    PasswordResetConfirmView, UserListView, AvatarUploadView,
+    UserBulkImportView
 )
 from rest_framework_simplejwt.views import TokenRefreshView
 
@@ -17,4 +18,5 @@ urlpatterns = [
     path('password-reset-confirm/', PasswordResetConfirmView.as_view(), name='password-reset-confirm'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
     path('users/', UserListView.as_view(), name='user-list'),
+    path('users/import/', UserBulkImportView.as_view(), name='user-bulk-import'),
 ]
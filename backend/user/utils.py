@@ -0,0 +1,133 @@
+import csv
+import io
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from .models.user_profile import UserProfile
+
+USER_TYPES = {value for value, _ in UserProfile.USER_TYPE_CHOICES}
+CSV_FIELDS = ('username', 'email', 'first_name', 'last_name', 'password', 'user_type')
+
+
+def create_user_with_profile(username, password=None, email='', user_type='student', **extra_fields):
+    """
+    Tạo User và UserProfile với vai trò cho trước trong một lần ghi mỗi bảng
+    (profile được tạo bởi signal create_user_profile).
+    """
+    user = User(
+        username=User.normalize_username(username),
+        email=User.objects.normalize_email(email),
+        **extra_fields
+    )
+    user.password = make_password(password)
+    user._profile_user_type = user_type
+    user.save()
+    return user
+
+
+def read_users_csv(file):
+    """Đọc CSV (username,email,first_name,last_name,password,user_type) thành danh sách dict"""
+    if isinstance(file, (bytes, bytearray)):
+        file = file.decode('utf-8-sig')
+    if isinstance(file, str):
+        file = io.StringIO(file)
+    reader = csv.DictReader(file)
+    return [
+        {field: (row.get(field) or '').strip() for field in CSV_FIELDS}
+        for row in reader
+    ]
+
+
+def bulk_create_users(rows, default_password=None, default_user_type='student',
+                      allowed_user_types=None, batch_size=500):
+    """
+    Tạo hàng loạt User và UserProfile bằng bulk_create (không qua signal).
+    Mật khẩu trong file phải qua AUTH_PASSWORD_VALIDATORS; dòng không có mật khẩu dùng
+    default_password (caller đã kiểm tra), được băm một lần cho cả lô; nếu không có
+    default_password thì mật khẩu không dùng được (người dùng tự đặt lại).
+    Trả về {"created": [...usernames], "errors": [{"row", "username", "error"}]}.
+    """
+    allowed_user_types = set(allowed_user_types or USER_TYPES)
+    default_hash = make_password(default_password)
+    errors = []
+    pending = {}
+
+    for index, row in enumerate(rows, start=1):
+        username = User.normalize_username((row.get('username') or '').strip())
+        user_type = (row.get('user_type') or default_user_type).strip()
+        if not username:
+            errors.append({"row": index, "username": username, "error": "Thiếu username"})
+            continue
+        if username in pending:
+            errors.append({"row": index, "username": username, "error": "Trùng username trong file"})
+            continue
+        if user_type not in USER_TYPES or user_type not in allowed_user_types:
+            errors.append({"row": index, "username": username, "error": f"Vai trò không hợp lệ: {user_type}"})
+            continue
+        user = User(
+            username=username,
+            email=User.objects.normalize_email((row.get('email') or '').strip()),
+            first_name=(row.get('first_name') or '').strip(),
+            last_name=(row.get('last_name') or '').strip(),
+            password=default_hash,
+        )
+        password = row.get('password')
+        if password:
+            try:
+                validate_password(password, user)
+            except ValidationError as e:
+                errors.append({"row": index, "username": username, "error": " ".join(e.messages)})
+                continue
+            user.password = make_password(password)
+        pending[username] = (user, user_type, index)
+
+    existing = set(
+        User.objects.filter(username__in=list(pending)).values_list('username', flat=True)
+    )
+    for username in existing:
+        _, _, index = pending.pop(username)
+        errors.append({"row": index, "username": username, "error": "Username đã tồn tại"})
+
+    items = list(pending.values())
+    users = []
+    with transaction.atomic():
+        for start in range(0, len(items), batch_size):
+            users += _create_users_batch(items[start:start + batch_size], errors)
+
+    errors.sort(key=lambda error: error['row'])
+    return {"created": [user.username for user in users], "errors": errors}
+
+
+def _create_users_batch(items, errors):
+    """
+    Tạo một lô (user, user_type, row) trong savepoint riêng. Request khác tạo cùng username
+    sau lần kiểm tra tồn tại thì lô vi phạm unique: bỏ các username đó (ghi lỗi) và thử lại.
+    """
+    while items:
+        try:
+            with transaction.atomic():
+                users = User.objects.bulk_create([user for user, _, _ in items])
+                if users[0].pk is None:
+                    # Backend không trả về id sau bulk_create: đọc lại theo username
+                    ids = dict(User.objects.filter(
+                        username__in=[user.username for user in users]).values_list('username', 'id'))
+                    for user in users:
+                        user.pk = ids[user.username]
+                UserProfile.objects.bulk_create([
+                    UserProfile(user=user, user_type=user_type) for user, user_type, _ in items
+                ])
+                return users
+        except IntegrityError:
+            for user, _, _ in items:
+                user.pk = None
+            taken = set(User.objects.filter(
+                username__in=[user.username for user, _, _ in items]).values_list('username', flat=True))
+            if not taken:
+                raise
+            for user, _, index in items:
+                if user.username in taken:
+                    errors.append({"row": index, "username": user.username, "error": "Username đã tồn tại"})
+            items = [item for item in items if item[0].username not in taken]
+    return []
@@ -3,13 +3,15 @@ from rest_framework import generics, status
 from .serializers import (
     UserRegisterSerializer, LoginSerializer, UserSerializer,
     PasswordChangeSerializer, PasswordResetRequestSerializer,
-    PasswordResetConfirmSerializer
+    PasswordResetConfirmSerializer, UserBulkImportSerializer
 )
 from django.contrib.auth.models import User
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
+from .permissions import get_user_role, IsTeacherOrAdmin
+from .utils import read_users_csv, bulk_create_users
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.utils.encoding import force_bytes, force_str
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
@@ -103,7 +105,7 @@ class ProfileView(APIView):
                 profile.date_of_birth = request.data['date_of_birth']
                 
             # Update user_type if included (and user has permission)
-            if 'user_type' in request.data and (request.user.is_staff or request.user.profile.user_type == 'admin'):
+            if 'user_type' in request.data and (request.user.is_staff or get_user_role(request.user).user_type == 'admin'):
                 profile.user_type = request.data['user_type']
                 
             profile.save()
@@ -242,9 +244,40 @@ class UserListView(APIView):
     
     def get(self, request):
         # Check if user is admin or teacher
-        if not request.user.is_staff and request.user.profile.user_type != 'teacher':
+        if not request.user.is_staff and not get_user_role(request.user).is_teacher:
             return Response({"detail": "Không có quyền truy cập"}, status=status.HTTP_403_FORBIDDEN)
             
         users = User.objects.all()
         serializer = UserSerializer(users, many=True)
         return Response(serializer.data)
+
+
+class UserBulkImportView(APIView):
+    """
+    Import danh sách người dùng từ file CSV (username,email,first_name,last_name,password,user_type)
+    Admin được tạo mọi vai trò, giáo viên chỉ được tạo tài khoản học viên
+    """
+    permission_classes = [IsTeacherOrAdmin]
+
+    def post(self, request):
+        serializer = UserBulkImportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        role = get_user_role(request.user)
+        allowed_user_types = None if (role.is_staff or role.user_type == 'admin') else ['student']
+        try:
+            rows = read_users_csv(serializer.validated_data['file'].read())
+        except (UnicodeDecodeError, ValueError):
+            return Response({"detail": "File CSV không hợp lệ"}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = bulk_create_users(
+            rows,
+            default_password=serializer.validated_data.get('default_password') or None,
+            default_user_type=serializer.validated_data['default_user_type'],
+            allowed_user_types=allowed_user_types,
+        )
+        return Response({
+            "created_count": len(result['created']),
+            "created": result['created'],
+            "errors": result['errors'],
+        }, status=status.HTTP_201_CREATED if result['created'] else status.HTTP_200_OK)